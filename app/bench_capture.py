@@ -0,0 +1,174 @@
+import argparse
+import json
+import logging
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from app.services.camera import CameraPipeline
+from app.services.frame_worker import FrameProcessor
+from app.services.sampling import SamplingPolicy
+from app.services.storage import Storage
+
+
+class BenchPipeline(CameraPipeline):
+    """A backend without a source: frames are pushed through ``handle_detection`` by the benchmark."""
+
+    backend = "bench"
+    frame_conversion = cv2.COLOR_RGBA2BGR
+
+    def start(self) -> None:
+        self._running = True
+
+    def stop(self) -> None:
+        self._running = False
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Measure the capture path: probe-thread cost per frame and end-to-end worker time"
+    )
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--fps", type=float, default=30.0, help="pace frames like a camera; 0 = as fast as possible")
+    parser.add_argument(
+        "--preview-fps", type=float, default=10.0, help="preview rate with a viewer attached; 0 = every frame"
+    )
+    parser.add_argument(
+        "--trace-alloc", action="store_true", help="report the tracemalloc peak; slows the probe, so timings are off"
+    )
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args()
+
+
+def _percentile(values, q: float) -> float:
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else 0.0
+
+
+def run(
+    width: int,
+    height: int,
+    frames: int,
+    workers: int,
+    fps: float,
+    preview_fps: float = 10.0,
+    trace_alloc: bool = False,
+) -> dict:
+    storage_dir = tempfile.mkdtemp(prefix="bench-capture-")
+    processor = FrameProcessor(workers)
+    storage = Storage(storage_dir)
+    pipeline = BenchPipeline(
+        camera_id="bench",
+        camera_name="bench",
+        # No cooldown and no persons: nothing is sampled, only capture and preview are measured.
+        sampling_policy=SamplingPolicy(time_span_years=1000.0, cooldown_hours=1e9),
+        storage=storage,
+        recent_samples_limit=1,
+        frame_processor=processor,
+        preview_fps=preview_fps,
+        frame_size=(width, height),
+    )
+    # With an MJPEG viewer the preview wants a frame every 1 / preview_fps seconds.
+    pipeline.preview.subscribe()
+    pipeline.start()
+
+    # The mapped NvBufSurface the probe sees is RGBA.
+    surface = np.zeros((height, width, 4), dtype=np.uint8)
+    cv2.randu(surface, 0, 255)
+    # Probe times of frames whose pixels were copied, and of frames that only carried a count.
+    probe_times = {True: [], False: []}
+    # Thread CPU time leaves out preemption by the workers, which dominates on a single core.
+    probe_cpu = {True: [], False: []}
+    mapped = []
+
+    def get_frame():
+        mapped.append(True)
+        return surface
+
+    interval = 1.0 / fps if fps > 0 else 0.0
+    faults_before = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    if trace_alloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    next_frame = started
+    for _ in range(frames):
+        mapped.clear()
+        probe_started, cpu_started = time.perf_counter(), time.thread_time()
+        pipeline.handle_detection(0, get_frame)
+        probe_times[bool(mapped)].append(time.perf_counter() - probe_started)
+        probe_cpu[bool(mapped)].append(time.thread_time() - cpu_started)
+        if interval:
+            next_frame += interval
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+    while len(pipeline.frame_queue) or pipeline.frame_pool.in_use > 1:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    peak = None
+    if trace_alloc:
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults_before
+
+    status = pipeline.get_status()
+    pipeline.stop()
+    pipeline.close()
+    storage.close()
+    processor.shutdown()
+    shutil.rmtree(storage_dir, ignore_errors=True)
+    convert = status["metrics"]["convert"]
+    return {
+        "frames": frames,
+        "size": f"{width}x{height}",
+        "workers": workers,
+        "copied_frames": len(probe_times[True]),
+        "probe_p50_ms": _percentile(probe_times[True], 50),
+        "probe_p99_ms": _percentile(probe_times[True], 99),
+        "probe_cpu_p50_ms": _percentile(probe_cpu[True], 50),
+        "probe_cpu_p99_ms": _percentile(probe_cpu[True], 99),
+        "probe_no_copy_p50_ms": _percentile(probe_times[False], 50),
+        "probe_no_copy_p99_ms": _percentile(probe_times[False], 99),
+        "worker_convert_avg_ms": convert["avg_ms"],
+        # With pacing this includes the idle time between frames.
+        "end_to_end_ms_per_frame": round(elapsed * 1000 / frames, 2),
+        "minor_faults_per_frame": round(faults / frames, 1),
+        "tracemalloc_peak_mib": round(peak / 1024 ** 2, 1) if peak is not None else None,
+        "dropped": status["frame_queue"]["dropped"],
+        "frame_pool": status["frame_pool"],
+        # Absent on trees that convert on the probe thread.
+        "source_pool": status.get("source_pool"),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = get_args()
+    report = run(args.width, args.height, args.frames, args.workers, args.fps, args.preview_fps, args.trace_alloc)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        f"{report['frames']} frames at {report['size']}, {report['workers']} worker(s): "
+        f"probe p50/p99 {report['probe_p50_ms']}/{report['probe_p99_ms']} ms "
+        f"(cpu {report['probe_cpu_p50_ms']}/{report['probe_cpu_p99_ms']} ms) on {report['copied_frames']} copied frames, "
+        f"{report['probe_no_copy_p50_ms']}/{report['probe_no_copy_p99_ms']} ms on the rest, "
+        f"worker convert {report['worker_convert_avg_ms']} ms, "
+        f"{report['end_to_end_ms_per_frame']} ms/frame end to end, "
+        f"{report['minor_faults_per_frame']} minor faults/frame, {report['dropped']} dropped"
+    )
+    if report["tracemalloc_peak_mib"] is not None:
+        print(f"  tracemalloc peak {report['tracemalloc_peak_mib']} MiB")
+    for name in ("frame_pool", "source_pool"):
+        pool = report.get(name)
+        if pool:
+            print(f"  {name}: {pool['allocations']} allocations, {pool['reuses']} reuses")
+
+
+if __name__ == "__main__":
+    main()
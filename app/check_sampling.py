@@ -0,0 +1,114 @@
+import argparse
+import datetime
+import json
+import logging
+import math
+import random
+import sys
+from typing import List, Sequence
+
+import numpy as np
+
+from app.services.sampling import SamplingPolicy, SamplingState
+
+# Two-sided thresholds at alpha = 0.001: chi-square with one degree of
+# freedom for the sample counts, and the KS coefficient c(alpha) for the gaps.
+CHI2_CRITICAL = 10.828
+KS_COEFFICIENT = 1.949
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Replay one person-count trace through the per-frame Bernoulli lottery and the geometric "
+            "scheduler in SamplingPolicy; exits 1 if their sample counts or gap distributions differ"
+        )
+    )
+    parser.add_argument("--frames", type=int, default=400_000)
+    parser.add_argument("--max-persons", type=int, default=3)
+    parser.add_argument("--time-span-years", type=float, default=0.1, help="sets the lottery chance")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args()
+
+
+def person_trace(frames: int, max_persons: int, seed: int) -> np.ndarray:
+    """Person counts per frame: empty stretches and busy stretches of a few hundred frames."""
+    rng = np.random.default_rng(seed)
+    counts = np.empty(frames, dtype=np.int64)
+    position = 0
+    while position < frames:
+        length = int(rng.integers(50, 500))
+        level = int(rng.integers(0, max_persons + 1))
+        counts[position:position + length] = rng.binomial(level, 0.8, size=min(length, frames - position))
+        position += length
+    return counts
+
+
+def bernoulli_samples(trace: Sequence[int], sample_chance: float, seed: int) -> List[int]:
+    """The policy before the geometric scheduler: one draw per frame against ``sample_chance * persons``."""
+    rng = random.Random(seed)
+    return [frame for frame, persons in enumerate(trace) if rng.random() >= max(0.0, 1.0 - sample_chance * persons)]
+
+
+def scheduled_samples(trace: Sequence[int], time_span_years: float, seed: int) -> List[int]:
+    # A cooldown far beyond the trace leaves only the lottery to compare.
+    policy = SamplingPolicy(time_span_years=time_span_years, cooldown_hours=1e6, seed=seed)
+    state = SamplingState(last_sample_time=datetime.datetime.now())
+    return [frame for frame, persons in enumerate(trace) if policy.should_sample(state, person_count=int(persons))]
+
+
+def ks_statistic(a: np.ndarray, b: np.ndarray) -> float:
+    """Largest distance between the two empirical CDFs."""
+    a, b = np.sort(a), np.sort(b)
+    values = np.concatenate((a, b))
+    cdf_a = np.searchsorted(a, values, side="right") / len(a)
+    cdf_b = np.searchsorted(b, values, side="right") / len(b)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+
+def compare(frames: int, max_persons: int, time_span_years: float, seed: int) -> dict:
+    trace = person_trace(frames, max_persons, seed)
+    chance = SamplingPolicy(time_span_years=time_span_years, cooldown_hours=0).sample_chance
+    old = bernoulli_samples(trace.tolist(), chance, seed + 1)
+    new = scheduled_samples(trace.tolist(), time_span_years, seed + 2)
+    # Same expected count on both sides, so the chi-square is on a 50/50 split.
+    chi2 = (len(old) - len(new)) ** 2 / (len(old) + len(new)) if old or new else 0.0
+    old_gaps, new_gaps = np.diff(old), np.diff(new)
+    ks = ks_statistic(old_gaps, new_gaps) if len(old_gaps) and len(new_gaps) else 1.0
+    n, m = len(old_gaps), len(new_gaps)
+    ks_critical = KS_COEFFICIENT * math.sqrt((n + m) / (n * m)) if n and m else 0.0
+    return {
+        "frames": frames,
+        "sample_chance": chance,
+        "old_samples": len(old),
+        "new_samples": len(new),
+        "chi2": round(chi2, 3),
+        "chi2_critical": CHI2_CRITICAL,
+        "old_gap_mean": round(float(old_gaps.mean()), 1) if n else None,
+        "new_gap_mean": round(float(new_gaps.mean()), 1) if m else None,
+        "ks": round(ks, 4),
+        "ks_critical": round(ks_critical, 4),
+        "passed": chi2 <= CHI2_CRITICAL and n > 0 and m > 0 and ks <= ks_critical,
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = get_args()
+    report = compare(args.frames, args.max_persons, args.time_span_years, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(
+            f"{report['frames']} frames, chance {report['sample_chance']:.5f}: "
+            f"{report['old_samples']} Bernoulli vs {report['new_samples']} scheduled samples "
+            f"(chi2 {report['chi2']} <= {report['chi2_critical']}), "
+            f"mean gap {report['old_gap_mean']} vs {report['new_gap_mean']} frames "
+            f"(KS {report['ks']} <= {report['ks_critical']}): {'ok' if report['passed'] else 'DIVERGED'}"
+        )
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
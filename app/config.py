@@ -1,6 +1,17 @@
 import yaml
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.services.batch import SHARED_DETECTORS
+from app.services.dedup import DEDUP_MODES
+from app.services.event_buffer import CAPTURE_MODES
+from app.services.frame_worker import DROP_POLICIES
+from app.services.preview import MOSAIC_ID
+from app.services.replay import DETECTORS as REPLAY_DETECTORS
+
+BACKENDS = ("deepstream", "replay")
+# sampling: a snooze only stops sampling; low-power: it also throttles the camera.
+SNOOZE_PROFILES = ("sampling", "low-power")
 
 
 @dataclass
@@ -9,6 +20,79 @@ class SamplingConfig:
     cooldown_hours: float
 
 
+@dataclass
+class ProcessingConfig:
+    queue_size: int = 4
+    drop_policy: str = "drop-oldest"
+
+
+@dataclass
+class StorageConfig:
+    queue_size: int = 8
+    fsync_seconds: float = 0.0
+    jpeg_quality: int = 95
+    max_bytes: int = 0
+    max_files: int = 0
+    max_age_days: float = 0.0
+    thin_after_days: float = 0.0
+    retention_interval_seconds: float = 60.0
+    thumb_width: int = 320
+    thumb_cache_bytes: int = 64 * 1024 * 1024
+
+
+@dataclass
+class CaptureConfig:
+    mode: str = "frame"
+    buffer_seconds: float = 0.0
+    buffer_fps: float = 5.0
+    buffer_bytes: int = 16 * 1024 * 1024
+    before_seconds: float = 2.0
+    after_seconds: float = 2.0
+
+
+@dataclass
+class GatingConfig:
+    enabled: bool = False
+    idle_seconds: float = 60.0
+    idle_interval: int = 15
+    motion_threshold: float = 3.0
+    motion_width: int = 64
+
+
+@dataclass
+class DedupConfig:
+    enabled: bool = False
+    mode: str = "skip"
+    max_distance: int = 3
+    window: int = 64
+
+
+@dataclass
+class OccupancyConfig:
+    enabled: bool = True
+    bucket_seconds: int = 60
+    retention_days: float = 730.0
+
+
+@dataclass
+class SnoozeConfig:
+    profile: str = "sampling"
+    fps: float = 1.0
+    pause_inference: bool = False
+    preview_fps: float = 1.0
+
+
+@dataclass
+class ReplayConfig:
+    source: str = "synthetic"
+    loop: bool = True
+    detector: str = "script"
+    persons: List[int] = field(default_factory=lambda: [0, 1])
+    hold_seconds: float = 10.0
+    detect_interval: int = 5
+    seed: Optional[int] = None
+
+
 @dataclass
 class CameraConfig:
     id: str
@@ -21,36 +105,226 @@ class CameraConfig:
     storage_dir: str
     recent_samples_limit: int
     sampling: SamplingConfig
+    preview_fps: float = 10.0
+    processing: ProcessingConfig = field(default_factory=ProcessingConfig)
+    storage: StorageConfig = field(default_factory=StorageConfig)
+    backend: str = "deepstream"
+    replay: ReplayConfig = field(default_factory=ReplayConfig)
+    capture: CaptureConfig = field(default_factory=CaptureConfig)
+    gating: GatingConfig = field(default_factory=GatingConfig)
+    snooze: SnoozeConfig = field(default_factory=SnoozeConfig)
+    dedup: DedupConfig = field(default_factory=DedupConfig)
+    occupancy: OccupancyConfig = field(default_factory=OccupancyConfig)
+    stall_seconds: float = 10.0
+
+
+@dataclass
+class InferenceConfig:
+    shared: bool = False
+    batch_timeout_ms: float = 40.0
+    detector: str = "per-camera"
+    proto_file: str = ""
+    model_file: str = ""
+    threshold: float = 0.5
+
+
+@dataclass
+class LoggingConfig:
+    level: str = "INFO"
+    summary_seconds: float = 10.0
+    queue_size: int = 10000
+    loggers: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class ServerConfig:
+    max_connections: int = 256
+    wsgi_workers: int = 8
+    write_timeout_seconds: float = 10.0
+    header_timeout_seconds: float = 10.0
+
+
+@dataclass
+class WatchdogConfig:
+    interval_seconds: float = 2.0
+    startup_seconds: float = 60.0
+    backoff_seconds: float = 2.0
+    max_backoff_seconds: float = 60.0
 
 
 @dataclass
 class AppConfig:
     cameras: List[CameraConfig]
+    frame_workers: int = 2
+    mosaic_fps: float = 5.0
+    config_watch_seconds: float = 0.0
+    startup_workers: int = 4
+    inference: InferenceConfig = field(default_factory=InferenceConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+    server: ServerConfig = field(default_factory=ServerConfig)
+    watchdog: WatchdogConfig = field(default_factory=WatchdogConfig)
 
 
 def load_config(path: str) -> AppConfig:
     with open(path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file) or {}
+        return parse_config(yaml.safe_load(file) or {})
+
 
+def parse_config(data: dict) -> AppConfig:
     cameras = []
     for raw in data.get("cameras", []):
+        if any(camera.id == raw["id"] for camera in cameras):
+            raise ValueError(f"Duplicate camera id: {raw['id']}")
+        if raw["id"] == MOSAIC_ID:
+            raise ValueError(f"Reserved camera id: {raw['id']}")
         sampling = raw.get("sampling", {})
+        processing = raw.get("processing", {})
+        storage = raw.get("storage", {})
+        replay = raw.get("replay", {})
+        capture = raw.get("capture", {})
+        gating = raw.get("gating", {})
+        snooze = raw.get("snooze", {})
+        snooze_profile = str(snooze.get("profile", "sampling"))
+        if snooze_profile not in SNOOZE_PROFILES:
+            raise ValueError(f"Unknown snooze profile for camera {raw['id']}: {snooze_profile}")
+        dedup = raw.get("dedup", {})
+        occupancy = raw.get("occupancy", {})
+        dedup_mode = str(dedup.get("mode", "skip"))
+        if dedup_mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode for camera {raw['id']}: {dedup_mode}")
+        capture_mode = str(capture.get("mode", "frame"))
+        if capture_mode not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode for camera {raw['id']}: {capture_mode}")
+        before_seconds = max(0.0, float(capture.get("before_seconds", 2)))
+        after_seconds = max(0.0, float(capture.get("after_seconds", 2)))
+        buffer_seconds = max(0.0, float(capture.get("buffer_seconds", 0)))
+        if capture_mode != "frame" or buffer_seconds > 0:
+            # The buffer has to span the whole event window.
+            buffer_seconds = max(buffer_seconds, before_seconds + after_seconds)
+        drop_policy = str(processing.get("drop_policy", "drop-oldest"))
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy for camera {raw['id']}: {drop_policy}")
+        replay_detector = str(replay.get("detector", "script"))
+        if replay_detector not in REPLAY_DETECTORS:
+            raise ValueError(f"Unknown replay detector for camera {raw['id']}: {replay_detector}")
+        backend = str(raw.get("backend", "deepstream"))
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend for camera {raw['id']}: {backend}")
         cameras.append(
             CameraConfig(
                 id=raw["id"],
                 name=raw.get("name", raw["id"]),
-                device=raw["device"],
+                device=raw["device"] if backend == "deepstream" else raw.get("device", ""),
                 width=int(raw.get("width", 1920)),
                 height=int(raw.get("height", 1080)),
                 fps=int(raw.get("fps", 30)),
-                model_config=raw["model_config"],
+                model_config=raw["model_config"] if backend == "deepstream" else raw.get("model_config", ""),
                 storage_dir=raw["storage_dir"],
                 recent_samples_limit=max(0, int(raw.get("recent_samples_limit", 16))),
                 sampling=SamplingConfig(
                     time_span_years=float(sampling.get("time_span_years", 10)),
                     cooldown_hours=float(sampling.get("cooldown_hours", 24)),
                 ),
+                preview_fps=max(0.0, float(raw.get("preview_fps", 10))),
+                processing=ProcessingConfig(
+                    queue_size=max(1, int(processing.get("queue_size", 4))),
+                    drop_policy=drop_policy,
+                ),
+                storage=StorageConfig(
+                    queue_size=max(1, int(storage.get("queue_size", 8))),
+                    fsync_seconds=max(0.0, float(storage.get("fsync_seconds", 0))),
+                    jpeg_quality=min(100, max(1, int(storage.get("jpeg_quality", 95)))),
+                    max_bytes=max(0, int(storage.get("max_bytes", 0))),
+                    max_files=max(0, int(storage.get("max_files", 0))),
+                    max_age_days=max(0.0, float(storage.get("max_age_days", 0))),
+                    thin_after_days=max(0.0, float(storage.get("thin_after_days", 0))),
+                    retention_interval_seconds=max(1.0, float(storage.get("retention_interval_seconds", 60))),
+                    thumb_width=max(16, int(storage.get("thumb_width", 320))),
+                    thumb_cache_bytes=max(0, int(storage.get("thumb_cache_bytes", 64 * 1024 * 1024))),
+                ),
+                backend=backend,
+                replay=ReplayConfig(
+                    source=str(replay.get("source", "synthetic")),
+                    loop=bool(replay.get("loop", True)),
+                    detector=replay_detector,
+                    persons=[max(0, int(v)) for v in replay.get("persons", [0, 1])],
+                    hold_seconds=max(0.001, float(replay.get("hold_seconds", 10))),
+                    detect_interval=max(1, int(replay.get("detect_interval", 5))),
+                    seed=replay.get("seed"),
+                ),
+                capture=CaptureConfig(
+                    mode=capture_mode,
+                    buffer_seconds=buffer_seconds,
+                    buffer_fps=max(0.1, float(capture.get("buffer_fps", 5))),
+                    buffer_bytes=max(1024 * 1024, int(capture.get("buffer_bytes", 16 * 1024 * 1024))),
+                    before_seconds=before_seconds,
+                    after_seconds=after_seconds,
+                ),
+                gating=GatingConfig(
+                    enabled=bool(gating.get("enabled", False)),
+                    idle_seconds=max(0.0, float(gating.get("idle_seconds", 60))),
+                    idle_interval=max(1, int(gating.get("idle_interval", 15))),
+                    motion_threshold=max(0.0, float(gating.get("motion_threshold", 3))),
+                    motion_width=max(8, int(gating.get("motion_width", 64))),
+                ),
+                snooze=SnoozeConfig(
+                    profile=snooze_profile,
+                    fps=max(0.0, float(snooze.get("fps", 1))),
+                    pause_inference=bool(snooze.get("pause_inference", False)),
+                    preview_fps=max(0.0, float(snooze.get("preview_fps", 1))),
+                ),
+                dedup=DedupConfig(
+                    enabled=bool(dedup.get("enabled", False)),
+                    mode=dedup_mode,
+                    max_distance=min(64, max(0, int(dedup.get("max_distance", 3)))),
+                    window=max(1, int(dedup.get("window", 64))),
+                ),
+                occupancy=OccupancyConfig(
+                    enabled=bool(occupancy.get("enabled", True)),
+                    bucket_seconds=max(1, int(occupancy.get("bucket_seconds", 60))),
+                    retention_days=max(1.0, float(occupancy.get("retention_days", 730))),
+                ),
+                stall_seconds=max(0.0, float(raw.get("stall_seconds", 10))),
             )
         )
 
-    return AppConfig(cameras=cameras)
+    inference = data.get("inference", {})
+    shared_detector = str(inference.get("detector", "per-camera"))
+    if shared_detector not in SHARED_DETECTORS:
+        raise ValueError(f"Unknown shared detector: {shared_detector}")
+    logging_data = data.get("logging", {})
+    server = data.get("server", {})
+    watchdog = data.get("watchdog", {})
+    return AppConfig(
+        cameras=cameras,
+        frame_workers=max(1, int(data.get("frame_workers", 2))),
+        mosaic_fps=max(0.0, float(data.get("mosaic_fps", 5))),
+        config_watch_seconds=max(0.0, float(data.get("config_watch_seconds", 0))),
+        startup_workers=max(1, int(data.get("startup_workers", 4))),
+        inference=InferenceConfig(
+            shared=bool(inference.get("shared", False)),
+            batch_timeout_ms=max(1.0, float(inference.get("batch_timeout_ms", 40))),
+            detector=shared_detector,
+            proto_file=str(inference.get("proto_file", "")),
+            model_file=str(inference.get("model_file", "")),
+            threshold=float(inference.get("threshold", 0.5)),
+        ),
+        logging=LoggingConfig(
+            level=str(logging_data.get("level", "INFO")).upper(),
+            summary_seconds=max(0.0, float(logging_data.get("summary_seconds", 10))),
+            queue_size=max(1, int(logging_data.get("queue_size", 10000))),
+            loggers={str(k): str(v).upper() for k, v in (logging_data.get("loggers") or {}).items()},
+        ),
+        server=ServerConfig(
+            max_connections=max(1, int(server.get("max_connections", 256))),
+            wsgi_workers=max(1, int(server.get("wsgi_workers", 8))),
+            write_timeout_seconds=max(0.1, float(server.get("write_timeout_seconds", 10))),
+            header_timeout_seconds=max(0.1, float(server.get("header_timeout_seconds", 10))),
+        ),
+        watchdog=WatchdogConfig(
+            interval_seconds=max(0.1, float(watchdog.get("interval_seconds", 2))),
+            startup_seconds=max(1.0, float(watchdog.get("startup_seconds", 60))),
+            backoff_seconds=max(0.0, float(watchdog.get("backoff_seconds", 2))),
+            max_backoff_seconds=max(0.0, float(watchdog.get("max_backoff_seconds", 60))),
+        ),
+    )
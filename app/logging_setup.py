@@ -0,0 +1,152 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting them first.
+
+    The stock QueueHandler formats in ``prepare`` on the caller's thread; here
+    the message is only rendered by the listener. Records that do not fit the
+    bounded queue are dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue: "queue.Queue") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(
+    level: str = "INFO",
+    loggers: Optional[Dict[str, str]] = None,
+    queue_size: int = 10000,
+) -> DeferredQueueHandler:
+    global _listener
+
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler = DeferredQueueHandler(queue.Queue(maxsize=max(1, queue_size)))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, logger_level in (loggers or {}).items():
+        logging.getLogger(name).setLevel(str(logger_level).upper())
+
+    if _listener is not None:
+        _listener.stop()
+    else:
+        # The first setup registers the exit hook; reconfiguring reuses it.
+        atexit.register(shutdown_logging)
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return handler
+
+
+def shutdown_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        atexit.unregister(shutdown_logging)
+
+
+class RateLimiter:
+    """Allows one event per key every ``interval`` seconds and counts the suppressed ones."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state: Dict[str, Tuple[float, int]] = {}
+
+    def allow(self, key: str) -> Tuple[bool, int]:
+        """Returns ``(allowed, suppressed_since_last_allowed)``."""
+        now = time.monotonic()
+        with self._lock:
+            next_time, suppressed = self._state.get(key, (0.0, 0))
+            if now < next_time:
+                self._state[key] = (next_time, suppressed + 1)
+                return False, suppressed
+            self._state[key] = (now + self.interval, 0)
+            return True, suppressed
+
+
+_limiter = RateLimiter(interval=10.0)
+
+
+def log_limited(logger: logging.Logger, level: int, key: str, msg: str, *args, **kwargs) -> None:
+    """Log ``msg`` at most once per 10 s for ``key``, noting how many were suppressed."""
+    if not logger.isEnabledFor(level):
+        return
+    allowed, suppressed = _limiter.allow(key)
+    if not allowed:
+        return
+    if suppressed:
+        msg = f"{msg} (+{suppressed} similar suppressed)"
+    logger.log(level, msg, *args, **kwargs)
+
+
+class FrameLogSummary:
+    """Aggregates per-frame outcomes and logs one summary line per camera every ``interval`` seconds."""
+
+    def __init__(self, logger: logging.Logger, camera_id: str, interval: float = 10.0) -> None:
+        self.logger = logger
+        self.camera_id = camera_id
+        self.interval = interval
+        self._reset(time.monotonic())
+
+    def _reset(self, now: float) -> None:
+        self.frames = 0
+        self.skipped = 0
+        self.sampled = 0
+        self.max_persons = 0
+        self._started = now
+        self._next_emit = now + self.interval
+
+    def record(self, person_count: int, sampled: bool) -> None:
+        self.frames += 1
+        if sampled:
+            self.sampled += 1
+        else:
+            self.skipped += 1
+        if person_count > self.max_persons:
+            self.max_persons = person_count
+        if self.interval <= 0 or self.frames & 31:
+            return
+        # Checked every 32 frames so the clock is not read on every frame.
+        now = time.monotonic()
+        if now >= self._next_emit:
+            self.emit(now)
+
+    def emit(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        if self.frames and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                "%s: %d frames (%d skipped, %d sampled), max persons %d in last %.0f s",
+                self.camera_id,
+                self.frames,
+                self.skipped,
+                self.sampled,
+                self.max_persons,
+                now - self._started,
+            )
+        self._reset(now)
@@ -1,8 +1,8 @@
 import argparse
-import logging
 
 from app import create_app
-from app.config import load_config
+from app.logging_setup import setup_logging
+from app.services.config_store import ConfigStore
 from app.services.pipeline_manager import PipelineManager
 
 
@@ -11,22 +11,48 @@ def get_args():
     parser.add_argument("--config", default="configs/cameras.yaml")
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--server",
+        choices=("dev", "stream"),
+        default="dev",
+        help="dev: Flask's threaded server; stream: event-loop server for many MJPEG viewers",
+    )
+    parser.add_argument("--log-level", help="overrides logging.level from the config file")
     return parser.parse_args()
 
 
 def main():
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    )
     args = get_args()
-    config = load_config(args.config)
+    config_store = ConfigStore(args.config)
+    config = config_store.config
+    setup_logging(
+        level=args.log_level or config.logging.level,
+        loggers=config.logging.loggers,
+        queue_size=config.logging.queue_size,
+    )
     manager = PipelineManager(config)
-    manager.start_all()
+    config_store.subscribe(manager.apply_config)
+    # Cameras come up in the background so the web UI is reachable right away.
+    manager.start_all(wait=False)
+    config_store.watch(config.config_watch_seconds)
 
     app = create_app(manager)
     app.config["CONFIG_PATH"] = args.config
-    app.run(debug=False, host=args.host, port=args.port, threaded=True)
+    app.config["CONFIG_STORE"] = config_store
+    if args.server == "stream":
+        from app.server import StreamingServer
+
+        StreamingServer(
+            app,
+            host=args.host,
+            port=args.port,
+            max_connections=config.server.max_connections,
+            wsgi_workers=config.server.wsgi_workers,
+            write_timeout=config.server.write_timeout_seconds,
+            header_timeout=config.server.header_timeout_seconds,
+        ).serve_forever()
+    else:
+        app.run(debug=False, host=args.host, port=args.port, threaded=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+import argparse
+import logging
+
+from app.config import load_config
+from app.services.storage import migrate_flat_layout
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Move flat sample directories into YYYY/MM/DD shards")
+    parser.add_argument("--config", default="configs/cameras.yaml")
+    parser.add_argument("--camera", action="append", help="camera id to migrate (default: all)")
+    parser.add_argument("--dry-run", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    args = get_args()
+    config = load_config(args.config)
+    for camera in config.cameras:
+        if args.camera and camera.id not in args.camera:
+            continue
+        migrate_flat_layout(camera.storage_dir, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
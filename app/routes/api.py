@@ -1,17 +1,43 @@
-import yaml
-from flask import Blueprint, current_app, jsonify, request
+import datetime
+import time
 
-from app.services.sampling import SamplingPolicy
+from typing import List, Optional
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, url_for
+
+from app.services.config_store import ConfigError
+from app.services.events import EVENT_SAMPLE, Event, format_sse
+from app.services.occupancy import RESOLUTION_HOUR
+from app.services.pipeline_manager import STATE_STOPPED
 
 api_bp = Blueprint("api", __name__)
 
+MAX_SAMPLES_PAGE = 500
+DEFAULT_OCCUPANCY_DAYS = 7
+EVENT_ENDPOINTS = ("api.events",)
+EVENT_KEEPALIVE_SECONDS = 15.0
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 
 def _get_manager():
     return current_app.config["PIPELINE_MANAGER"]
 
 
-def _get_config_path() -> str:
-    return current_app.config["CONFIG_PATH"]
+def _get_config_store():
+    return current_app.config["CONFIG_STORE"]
+
+
+def _running_pipeline(camera_id: str):
+    """The camera's pipeline and None, or None and an error response: 404 if unknown, 409 if not running."""
+    manager = _get_manager()
+    pipeline = manager.pipelines.get(camera_id)
+    if pipeline is not None:
+        return pipeline, None
+    if not any(camera.id == camera_id for camera in manager.config.cameras):
+        return None, (jsonify({"error": "camera not found"}), 404)
+    record = manager.startup.get(camera_id)
+    state = record.state if record is not None else STATE_STOPPED
+    return None, (jsonify({"error": f"camera {camera_id} is not running", "state": state}), 409)
 
 
 @api_bp.get("/cameras")
@@ -20,18 +46,121 @@ def list_cameras():
     return jsonify(manager.list_status())
 
 
+def resolve_event_filter(manager, camera_ids: List[str]) -> Optional[List[str]]:
+    """The cameras an event stream is limited to, or None for all; raises KeyError for unknown ones."""
+    configured = {camera.id for camera in manager.config.cameras}
+    for camera_id in camera_ids:
+        if camera_id not in configured:
+            raise KeyError(camera_id)
+    return camera_ids or None
+
+
+def render_events(url_map, events: List[Event]) -> bytes:
+    """Serializes events for an SSE stream, adding the media URL to sample events."""
+    adapter = url_map.bind("")
+    chunks = []
+    for name, data in events:
+        if name == EVENT_SAMPLE:
+            values = {"camera_id": data["camera_id"], "filename": data["path"]}
+            data = {
+                **data,
+                "url": adapter.build("dashboard.sample_media", values),
+                "thumb_url": adapter.build("dashboard.sample_media", {**values, "thumb": 1}),
+            }
+        chunks.append(format_sse(name, data))
+    return b"".join(chunks)
+
+
+@api_bp.get("/events")
+def events():
+    """Server-sent events: ``status`` deltas per camera and ``sample`` for every new sample.
+
+    ``?camera=<id>`` (repeatable) limits the stream to those cameras.
+    """
+    manager = _get_manager()
+    try:
+        camera_ids = resolve_event_filter(manager, request.args.getlist("camera"))
+    except KeyError:
+        abort(404)
+    subscription = manager.events.subscribe(camera_ids)
+    url_map = current_app.url_map
+
+    def generate():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                events = subscription.wait(timeout=EVENT_KEEPALIVE_SECONDS)
+                yield render_events(url_map, events) if events else b": keepalive\n\n"
+        finally:
+            manager.events.unsubscribe(subscription)
+
+    return Response(generate(), mimetype="text/event-stream", headers=SSE_HEADERS, direct_passthrough=True)
+
+
+@api_bp.get("/cameras/<camera_id>/samples")
+def list_camera_samples(camera_id: str):
+    pipeline, error = _running_pipeline(camera_id)
+    if error is not None:
+        return error
+    limit = min(MAX_SAMPLES_PAGE, max(0, request.args.get("limit", 50, type=int)))
+    before = request.args.get("before", type=float)
+    after = request.args.get("after", type=float)
+    records = pipeline.storage.list_samples(limit, before=before, after=after)
+    items = [
+        {
+            **record.to_dict(),
+            "time": datetime.datetime.fromtimestamp(record.timestamp).isoformat(),
+            "url": url_for("dashboard.sample_media", camera_id=camera_id, filename=record.path),
+            "thumb_url": url_for("dashboard.sample_media", camera_id=camera_id, filename=record.path, thumb=1),
+        }
+        for record in records
+    ]
+    next_before = records[-1].timestamp if len(records) == limit and records else None
+    return jsonify({"samples": items, "next_before": next_before})
+
+
+@api_bp.get("/cameras/<camera_id>/occupancy")
+def camera_occupancy(camera_id: str):
+    """Person counts over ``from``..``to`` (epoch seconds, default the last week).
+
+    ``resolution`` is ``bucket``, ``hour`` or ``day`` for a time series, or
+    ``hour-of-day``/``day-of-week`` for a heatmap in local time.
+    """
+    pipeline, error = _running_pipeline(camera_id)
+    if error is not None:
+        return error
+    occupancy = pipeline.occupancy
+    if occupancy is None:
+        return jsonify({"error": f"Occupancy is disabled for {camera_id}"}), 404
+    end = request.args.get("to", time.time(), type=float)
+    start = request.args.get("from", end - DEFAULT_OCCUPANCY_DAYS * 86400, type=float)
+    if start > end:
+        return jsonify({"error": "from is after to"}), 400
+    try:
+        return jsonify(occupancy.query(start, end, request.args.get("resolution", RESOLUTION_HOUR)))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+
 @api_bp.post("/cameras/<camera_id>/snapshot")
 def force_snapshot(camera_id: str):
-    manager = _get_manager()
-    pipeline = manager.get_pipeline(camera_id)
-    pipeline.force_snapshot()
-    return jsonify({"status": "ok"})
+    pipeline, error = _running_pipeline(camera_id)
+    if error is not None:
+        return error
+    payload = request.get_json(silent=True) or {}
+    mode = request.args.get("mode") or payload.get("mode")
+    try:
+        pipeline.force_snapshot(mode=mode)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"status": "ok", "mode": mode or pipeline.get_status()["capture"]["mode"]})
 
 
 @api_bp.post("/cameras/<camera_id>/snooze")
 def add_camera_snooze(camera_id: str):
-    manager = _get_manager()
-    pipeline = manager.get_pipeline(camera_id)
+    pipeline, error = _running_pipeline(camera_id)
+    if error is not None:
+        return error
     snooze_until = pipeline.add_snooze(minutes=10)
     return jsonify(
         {
@@ -44,8 +173,9 @@ def add_camera_snooze(camera_id: str):
 
 @api_bp.post("/cameras/<camera_id>/snooze/cancel")
 def cancel_camera_snooze(camera_id: str):
-    manager = _get_manager()
-    pipeline = manager.get_pipeline(camera_id)
+    pipeline, error = _running_pipeline(camera_id)
+    if error is not None:
+        return error
     pipeline.cancel_snooze()
     return jsonify({"status": "ok", "snoozing": False, "snooze_until": None})
 
@@ -53,46 +183,31 @@ def cancel_camera_snooze(camera_id: str):
 @api_bp.post("/cameras/<camera_id>/config")
 def update_camera_config(camera_id: str):
     payload = request.get_json(force=True)
-    config_path = _get_config_path()
-
-    with open(config_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file) or {}
-
-    cameras = data.get("cameras", [])
-    target = None
-    for camera in cameras:
-        if camera.get("id") == camera_id:
-            target = camera
-            break
-
-    if target is None:
+    if not isinstance(payload, dict):
+        return jsonify({"error": "expected a JSON object"}), 400
+    try:
+        _get_config_store().update_camera(camera_id, payload)
+    except KeyError:
         return jsonify({"error": "camera not found"}), 404
+    except ConfigError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"status": "updated"})
 
-    if "name" in payload:
-        target["name"] = payload["name"]
-    if "sampling" in payload:
-        target.setdefault("sampling", {})
-        sampling_payload = payload["sampling"]
-        if "time_span_years" in sampling_payload:
-            target["sampling"]["time_span_years"] = float(sampling_payload["time_span_years"])
-        if "cooldown_hours" in sampling_payload:
-            target["sampling"]["cooldown_hours"] = float(sampling_payload["cooldown_hours"])
-    if "recent_samples_limit" in payload:
-        target["recent_samples_limit"] = int(payload["recent_samples_limit"])
-
-    with open(config_path, "w", encoding="utf-8") as file:
-        yaml.safe_dump(data, file, allow_unicode=True)
-
-    manager = _get_manager()
-    pipeline = manager.get_pipeline(camera_id)
-    sampling = target.get("sampling", {})
-    pipeline.sampling_policy = SamplingPolicy(
-        time_span_years=float(sampling.get("time_span_years", 10)),
-        cooldown_hours=float(sampling.get("cooldown_hours", 24)),
-    )
-    if "name" in payload:
-        pipeline.camera_name = payload["name"]
-    if "recent_samples_limit" in payload:
-        pipeline.recent_samples_limit = max(0, int(payload["recent_samples_limit"]))
 
-    return jsonify({"status": "updated"})
+@api_bp.post("/cameras")
+def add_camera():
+    payload = request.get_json(force=True)
+    try:
+        camera = _get_config_store().add_camera(payload)
+    except ConfigError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"status": "added", "camera_id": camera.id}), 201
+
+
+@api_bp.delete("/cameras/<camera_id>")
+def remove_camera(camera_id: str):
+    try:
+        _get_config_store().remove_camera(camera_id)
+    except KeyError:
+        return jsonify({"error": "camera not found"}), 404
+    return jsonify({"status": "removed"})
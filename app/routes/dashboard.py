@@ -1,14 +1,38 @@
-import time
-from flask import Blueprint, current_app, render_template, Response, abort, send_from_directory, url_for
+import os
+from typing import Optional
+
+from flask import Blueprint, current_app, render_template, request, Response, abort, send_file, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from app.services.metrics import REGISTRY
+from app.services.preview import DEFAULT_TIER, MJPEG_BOUNDARY, PREVIEW_TIERS
+from app.services.sample_index import CLIP_EXTENSION, EXCLUDED_NAMES
 
 
 dashboard_bp = Blueprint("dashboard", __name__)
 
+STREAM_ENDPOINTS = ("dashboard.mosaic_stream", "dashboard.camera_stream")
+# Sample files are named by capture time and never rewritten.
+SAMPLE_MAX_AGE = 365 * 24 * 3600
+# The storage dir also holds the sample index, dedup and occupancy files and
+# the thumbnail cache, all dot-named; only samples and their clips are served.
+MEDIA_EXTENSIONS = (".jpg", CLIP_EXTENSION)
+
 
 def _get_manager():
     return current_app.config["PIPELINE_MANAGER"]
 
 
+def resolve_stream(manager, camera_id: Optional[str] = None, size: Optional[str] = None):
+    """Returns ``(publisher, tier)``; raises KeyError for unknown cameras, ValueError for bad sizes."""
+    if camera_id is None:
+        return manager.mosaic, DEFAULT_TIER
+    if camera_id not in manager.pipelines:
+        raise KeyError(camera_id)
+    tier = size or DEFAULT_TIER
+    if tier not in PREVIEW_TIERS:
+        raise ValueError(tier)
+    return manager.get_pipeline(camera_id).preview, tier
 
 
 @dashboard_bp.route("/")
@@ -27,7 +51,10 @@ def camera_detail(camera_id: str):
     limit = max(0, int(getattr(pipeline, "recent_samples_limit", 16)))
     recent = pipeline.storage.list_recent(limit)
     recent_urls = [
-        url_for("dashboard.sample_media", camera_id=camera_id, filename=path)
+        (
+            url_for("dashboard.sample_media", camera_id=camera_id, filename=path),
+            url_for("dashboard.sample_media", camera_id=camera_id, filename=path, thumb=1),
+        )
         for path in recent
     ]
     return render_template(
@@ -37,24 +64,35 @@ def camera_detail(camera_id: str):
     )
 
 
+def _mjpeg_response(publisher, tier: str = DEFAULT_TIER):
+    fps = request.args.get("fps", type=float)
+    return Response(
+        publisher.stream(tier, max_fps=fps),
+        mimetype=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+        direct_passthrough=True,
+    )
+
+
+@dashboard_bp.route("/stream/mosaic")
+def mosaic_stream():
+    publisher, tier = resolve_stream(_get_manager())
+    return _mjpeg_response(publisher, tier)
+
+
 @dashboard_bp.route("/stream/<camera_id>")
 def camera_stream(camera_id: str):
-    manager = _get_manager()
-    if camera_id not in manager.pipelines:
+    try:
+        publisher, tier = resolve_stream(_get_manager(), camera_id, request.args.get("size"))
+    except KeyError:
         abort(404)
-    pipeline = manager.get_pipeline(camera_id)
+    except ValueError:
+        abort(400)
+    return _mjpeg_response(publisher, tier)
 
-    def generate():
-        while True:
-            frame = pipeline.get_latest_jpeg()
-            if frame:
-                yield (
-                    b"--frame\r\n"
-                    b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
-                )
-            time.sleep(0.1)
 
-    return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
+@dashboard_bp.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 @dashboard_bp.route("/media/<camera_id>/<path:filename>")
@@ -62,5 +100,29 @@ def sample_media(camera_id: str, filename: str):
     manager = _get_manager()
     if camera_id not in manager.pipelines:
         abort(404)
-    pipeline = manager.get_pipeline(camera_id)
-    return send_from_directory(pipeline.storage.base_dir, filename)
+    if any(part.startswith(".") for part in filename.split("/")):
+        abort(404)
+    if not filename.lower().endswith(MEDIA_EXTENSIONS):
+        abort(404)
+    storage = manager.get_pipeline(camera_id).storage
+    # Flask resolves relative paths against the app package, not the working directory.
+    base_dir = os.path.abspath(storage.base_dir)
+    if os.path.basename(filename) in EXCLUDED_NAMES:
+        # latest.jpg is replaced in place: cacheable, but revalidated every time.
+        response = send_from_directory(base_dir, filename)
+        response.cache_control.no_cache = True
+        return response
+    if request.args.get("thumb", default=0, type=int):
+        full_path = safe_join(base_dir, filename)
+        if full_path is None or not os.path.isfile(full_path):
+            abort(404)
+        thumb_path = storage.thumbnails.get(os.path.relpath(full_path, base_dir))
+        if thumb_path is None:
+            abort(404)
+        response = send_file(os.path.abspath(thumb_path), mimetype="image/jpeg", max_age=SAMPLE_MAX_AGE)
+    else:
+        # Conditional: strong ETag and Last-Modified with 304s, plus Range requests.
+        response = send_from_directory(base_dir, filename, max_age=SAMPLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
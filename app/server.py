@@ -0,0 +1,458 @@
+import asyncio
+import io
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote
+
+from werkzeug.exceptions import HTTPException
+
+from app.routes.api import EVENT_ENDPOINTS, EVENT_KEEPALIVE_SECONDS, render_events, resolve_event_filter
+from app.routes.dashboard import STREAM_ENDPOINTS, resolve_stream
+from app.services.preview import MJPEG_BOUNDARY
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 4 * 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    501: "Not Implemented",
+    503: "Service Unavailable",
+}
+
+
+class RequestError(Exception):
+    """A request that cannot be served; answered with ``status`` and ``message``, then the connection closes."""
+
+    def __init__(self, status: int, message: str = "") -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class _FrameSignal:
+    """Bridges a PreviewPublisher's new-frame callback into the event loop.
+
+    One publisher listener per stream source, however many viewers: the
+    callback only schedules a wake-up, and every waiting viewer shares the
+    same asyncio.Event for that frame.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, publisher) -> None:
+        self.loop = loop
+        self.publisher = publisher
+        self.event = asyncio.Event()
+        self.viewers = 0
+        self._pending = False
+        publisher.add_listener(self._on_frame)
+
+    def _on_frame(self, _seq: int) -> None:
+        if self._pending:
+            return
+        self._pending = True
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self) -> None:
+        self._pending = False
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+    def close(self) -> None:
+        self.publisher.remove_listener(self._on_frame)
+
+
+class StreamingServer:
+    """HTTP/1.1 front end for many long-lived MJPEG viewers.
+
+    MJPEG and server-sent event routes are served cooperatively on one event
+    loop, so a viewer costs a socket and a coroutine rather than an OS thread. All other requests are
+    dispatched to the Flask app on a bounded thread pool, reusing its routes.
+    Their connections are kept alive between requests when the response has
+    a Content-Length; request bodies may be sent with chunked encoding.
+    """
+
+    def __init__(
+        self,
+        app,
+        host: str = "0.0.0.0",
+        port: int = 5000,
+        max_connections: int = 256,
+        wsgi_workers: int = 8,
+        write_timeout: float = 10.0,
+        header_timeout: float = 10.0,
+    ) -> None:
+        self.app = app
+        self.manager = app.config["PIPELINE_MANAGER"]
+        self.host = host
+        self.port = port
+        self.max_connections = max(1, max_connections)
+        self.write_timeout = write_timeout
+        self.header_timeout = header_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, wsgi_workers), thread_name_prefix="wsgi")
+        self._signals: Dict[int, _FrameSignal] = {}
+        self._connections = 0
+        self._streams = 0
+        self._rejected = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def serve_forever(self) -> None:
+        asyncio.run(self._serve())
+
+    async def _serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_HEADER_BYTES)
+        logger.info(
+            "Streaming server on %s:%d (max %d connections)", self.host, self.port, self.max_connections
+        )
+        async with server:
+            await server.serve_forever()
+
+    def get_status(self) -> dict:
+        return {
+            "connections": self._connections,
+            "streams": self._streams,
+            "rejected": self._rejected,
+            "max_connections": self.max_connections,
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self._connections >= self.max_connections:
+            self._rejected += 1
+            await self._send_simple(writer, 503)
+            return
+        self._connections += 1
+        served = 0
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.header_timeout)
+                except asyncio.TimeoutError:
+                    # An idle keep-alive connection just ends.
+                    if not served:
+                        await self._send_simple(writer, 408)
+                    return
+                except RequestError as exc:
+                    await self._send_simple(writer, exc.status, exc.message)
+                    return
+                if request is None:
+                    return
+                served += 1
+                method, target, version, headers, body = request
+                path, _, query = target.partition("?")
+                endpoint, view_args = self._match(method, unquote(path))
+                if endpoint in STREAM_ENDPOINTS:
+                    await self._serve_stream(reader, writer, view_args, query)
+                    return
+                if endpoint in EVENT_ENDPOINTS:
+                    await self._serve_events(reader, writer, query)
+                    return
+                keep_alive = version == "HTTP/1.1" and "close" not in _header(headers, "connection").lower()
+                if not await self._serve_wsgi(writer, method, path, query, headers, body, keep_alive):
+                    return
+        except asyncio.TimeoutError:
+            pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception("Request failed")
+        finally:
+            self._connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """``(method, target, version, headers, body)``, None at EOF; raises RequestError for bad requests."""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise RequestError(413, "request headers too large")
+        except asyncio.IncompleteReadError:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3 or not parts[0].isalpha() or not parts[1] or parts[2] not in ("HTTP/1.0", "HTTP/1.1"):
+            raise RequestError(400, f"malformed request line: {lines[0][:100]!r}")
+        method, target, version = parts
+        headers: List[Tuple[str, str]] = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, colon, value = line.partition(":")
+            if not colon or not name or name != name.strip() or " " in name:
+                raise RequestError(400, f"malformed header line: {line[:100]!r}")
+            headers.append((name, value.strip()))
+
+        encoding = _header(headers, "transfer-encoding").lower()
+        if encoding:
+            if encoding != "chunked":
+                raise RequestError(501, f"unsupported transfer encoding: {encoding}")
+            if _header(headers, "content-length"):
+                raise RequestError(400, "both Content-Length and Transfer-Encoding given")
+            body = await self._read_chunked(reader)
+            # The app sees a plain body of known length.
+            headers = [(name, value) for name, value in headers if name.lower() != "transfer-encoding"]
+            headers.append(("Content-Length", str(len(body))))
+            return method.upper(), target, version, headers, body
+
+        length = _header(headers, "content-length") or "0"
+        if not length.isdigit():
+            raise RequestError(400, f"invalid Content-Length: {length[:20]!r}")
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, "request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, version, headers, body
+
+    async def _read_chunked(self, reader: asyncio.StreamReader) -> bytes:
+        body = bytearray()
+        while True:
+            try:
+                line = await reader.readuntil(b"\r\n")
+            except asyncio.LimitOverrunError:
+                raise RequestError(400, "chunk size line too long")
+            size = line[:-2].split(b";", 1)[0].strip()
+            try:
+                size = int(size, 16)
+            except ValueError:
+                raise RequestError(400, f"invalid chunk size: {size[:20]!r}")
+            if size < 0:
+                raise RequestError(400, "invalid chunk size")
+            if size == 0:
+                break
+            if len(body) + size > MAX_BODY_BYTES:
+                raise RequestError(413, "request body too large")
+            body += await reader.readexactly(size)
+            if await reader.readexactly(2) != b"\r\n":
+                raise RequestError(400, "chunk not terminated by CRLF")
+        # Trailers are read and ignored.
+        while await reader.readuntil(b"\r\n") != b"\r\n":
+            pass
+        return bytes(body)
+
+    def _match(self, method: str, path: str):
+        adapter = self.app.url_map.bind(self.host)
+        try:
+            return adapter.match(path, method=method)
+        except HTTPException:
+            return None, {}
+
+    async def _send_simple(self, writer: asyncio.StreamWriter, status: int, message: str = "") -> None:
+        body = f"{status} {REASONS.get(status, '')}{': ' + message if message else ''}\n".encode("latin-1", "replace")
+        writer.write(
+            (
+                f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: text/plain\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            ).encode("ascii")
+            + body
+        )
+        try:
+            await asyncio.wait_for(writer.drain(), self.write_timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+
+    async def _write(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(data)
+        # A stalled client fails here instead of pinning a buffer forever.
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def _serve_stream(self, reader, writer, view_args: dict, query: str) -> None:
+        params = parse_qs(query)
+        size = params.get("size", [None])[0]
+        try:
+            publisher, tier = resolve_stream(self.manager, view_args.get("camera_id"), size)
+        except KeyError:
+            await self._send_simple(writer, 404)
+            return
+        except ValueError:
+            await self._send_simple(writer, 400)
+            return
+        try:
+            fps = float(params.get("fps", ["0"])[0])
+        except ValueError:
+            fps = 0.0
+        min_interval = 1.0 / fps if fps > 0 else 0.0
+
+        await self._write(
+            writer,
+            (
+                "HTTP/1.1 200 OK\r\n"
+                f"Content-Type: multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}\r\n"
+                "Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+            ).encode("ascii"),
+        )
+
+        signal = self._signals.get(id(publisher))
+        if signal is None:
+            signal = self._signals[id(publisher)] = _FrameSignal(self._loop, publisher)
+        signal.viewers += 1
+        self._streams += 1
+        publisher.subscribe()
+        # Viewers never send anything after the request, so EOF means they left.
+        disconnected = asyncio.ensure_future(reader.read(1))
+        bytes_sent = publisher.metrics.stream_counter(tier) if publisher.metrics is not None else None
+        try:
+            sent_seq = -1
+            next_send = 0.0
+            while not disconnected.done():
+                if publisher.seq == sent_seq:
+                    waiter = asyncio.ensure_future(signal.event.wait())
+                    await asyncio.wait(
+                        {waiter, disconnected},
+                        timeout=publisher.keepalive_seconds,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    waiter.cancel()
+                    if disconnected.done():
+                        break
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                sent_seq = publisher.seq
+                # Cached per tier and frame, so at most one viewer pays for the encode.
+                chunk = await self._loop.run_in_executor(self._executor, publisher.get_chunk, tier)
+                if not chunk:
+                    continue
+                await self._write(writer, chunk)
+                next_send = time.monotonic() + min_interval
+                if bytes_sent is not None:
+                    bytes_sent.inc(len(chunk))
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            disconnected.cancel()
+            publisher.unsubscribe()
+            self._streams -= 1
+            signal.viewers -= 1
+            if signal.viewers == 0:
+                signal.close()
+                self._signals.pop(id(publisher), None)
+
+    async def _serve_events(self, reader, writer, query: str) -> None:
+        events = self.manager.events
+        try:
+            camera_ids = resolve_event_filter(self.manager, parse_qs(query).get("camera", []))
+        except KeyError:
+            await self._send_simple(writer, 404)
+            return
+        loop = self._loop
+        ready = asyncio.Event()
+        subscription = events.subscribe(camera_ids, on_ready=lambda: loop.call_soon_threadsafe(ready.set))
+        self._streams += 1
+        disconnected = asyncio.ensure_future(reader.read(1))
+        try:
+            await self._write(
+                writer,
+                (
+                    "HTTP/1.1 200 OK\r\n"
+                    "Content-Type: text/event-stream; charset=utf-8\r\n"
+                    "Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+                    "retry: 3000\n\n"
+                ).encode("ascii"),
+            )
+            while not disconnected.done():
+                # Cleared before draining, so an event offered in between still wakes us.
+                ready.clear()
+                pending = subscription.drain()
+                if pending:
+                    # Whatever arrives during a slow write coalesces into the next drain.
+                    await self._write(writer, render_events(self.app.url_map, pending))
+                    continue
+                waiter = asyncio.ensure_future(ready.wait())
+                done, _ = await asyncio.wait(
+                    {waiter, disconnected},
+                    timeout=EVENT_KEEPALIVE_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                waiter.cancel()
+                if not done:
+                    await self._write(writer, b": keepalive\n\n")
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            disconnected.cancel()
+            events.unsubscribe(subscription)
+            self._streams -= 1
+
+    def _environ(self, method: str, path: str, query: str, headers, body: bytes, writer) -> dict:
+        peer = writer.get_extra_info("peername") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(path).encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": query,
+            "SERVER_NAME": self.host,
+            "SERVER_PORT": str(self.port),
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": peer[0],
+            "REMOTE_PORT": str(peer[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in headers:
+            key = name.upper().replace("-", "_")
+            if key == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif key == "CONTENT_LENGTH":
+                environ["CONTENT_LENGTH"] = value
+            else:
+                key = f"HTTP_{key}"
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    async def _serve_wsgi(
+        self, writer, method: str, path: str, query: str, headers, body: bytes, keep_alive: bool
+    ) -> bool:
+        """Runs the Flask app; returns whether the connection can take another request."""
+        environ = self._environ(method, path, query, headers, body, writer)
+        response: dict = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response["status"] = status
+            response["headers"] = response_headers
+
+        def call_app():
+            result = self.app(environ, start_response)
+            return result, iter(result)
+
+        result, chunks = await self._loop.run_in_executor(self._executor, call_app)
+        try:
+            # Without a length the body ends when the connection does.
+            keep_alive = keep_alive and _header(response["headers"], "content-length") != ""
+            head = [f"HTTP/1.1 {response['status']}"]
+            head.extend(f"{name}: {value}" for name, value in response["headers"] if name.lower() != "connection")
+            head.append("Connection: keep-alive" if keep_alive else "Connection: close")
+            await self._write(writer, ("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+            if method == "HEAD":
+                return keep_alive
+            while True:
+                chunk = await self._loop.run_in_executor(self._executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await self._write(writer, chunk)
+            return keep_alive
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                await self._loop.run_in_executor(self._executor, close)
+
+
+def _header(headers, name: str) -> str:
+    """The first value of header ``name`` (case-insensitive), or an empty string."""
+    return next((value for key, value in headers if key.lower() == name), "")
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PERSON_CLASS_ID = 2
+# inference.detector values for a shared batch.
+DETECTOR_PER_CAMERA = "per-camera"
+DETECTOR_RESNET10 = "resnet10"
+SHARED_DETECTORS = (DETECTOR_PER_CAMERA, DETECTOR_RESNET10)
+
+
+class BatchDetector:
+    def detect_batch(self, source_ids: Sequence[str], frames: Sequence[np.ndarray], now: float) -> List[int]:
+        raise NotImplementedError
+
+
+class PerSourceDetector(BatchDetector):
+    """Runs each source's own stand-in detector, so batching can be exercised without a model."""
+
+    def __init__(self) -> None:
+        self.detectors: Dict[str, object] = {}
+
+    def register(self, source_id: str, detector) -> None:
+        self.detectors[source_id] = detector
+
+    def unregister(self, source_id: str) -> None:
+        self.detectors.pop(source_id, None)
+
+    def detect_batch(self, source_ids: Sequence[str], frames: Sequence[np.ndarray], now: float) -> List[int]:
+        return [self.detectors[source_id].detect(frame, now) for source_id, frame in zip(source_ids, frames)]
+
+
+class Resnet10Detector(BatchDetector):
+    """The DeepStream resnet10 detector on the CPU via OpenCV DNN, one forward pass per batch.
+
+    Person boxes are approximated by counting connected regions of the person
+    coverage map above ``threshold``.
+    """
+
+    def __init__(
+        self,
+        proto_file: str,
+        model_file: str,
+        threshold: float = 0.5,
+        input_size: Tuple[int, int] = (640, 368),
+    ) -> None:
+        self.net = cv2.dnn.readNetFromCaffe(proto_file, model_file)
+        self.threshold = threshold
+        self.input_size = input_size
+
+    def detect_batch(self, source_ids: Sequence[str], frames: Sequence[np.ndarray], now: float) -> List[int]:
+        blob = cv2.dnn.blobFromImages(list(frames), scalefactor=1.0 / 255, size=self.input_size, swapRB=True)
+        self.net.setInput(blob)
+        coverage = self.net.forward("conv2d_cov/Sigmoid")
+        counts = []
+        for person_map in coverage[:, PERSON_CLASS_ID]:
+            mask = (person_map > self.threshold).astype(np.uint8)
+            labels, _ = cv2.connectedComponents(mask)
+            counts.append(labels - 1)
+        return counts
+
+
+class BatchedInference:
+    """Collects the latest frame from each registered source and detects them as one batch.
+
+    Like nvstreammux, a batch is pushed when every active source has a frame
+    or ``batch_timeout_ms`` after the first frame arrived. A source that
+    submits again before its frame was batched replaces it; the replaced
+    frame goes to that submission's ``on_drop``.
+    """
+
+    def __init__(self, detector: BatchDetector, batch_timeout_ms: float = 40.0) -> None:
+        self.detector = detector
+        self.batch_timeout = max(0.001, batch_timeout_ms / 1000)
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._sources: set = set()
+        self._pending: Dict[str, Tuple[np.ndarray, Callable, Optional[Callable]]] = {}
+        self._first_pending = 0.0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.frames = 0
+        self.replaced = 0
+        self._last_infer_ms = 0.0
+        self._total_infer_ms = 0.0
+
+    def register(self, source_id: str) -> None:
+        with self._lock:
+            self._sources.add(source_id)
+
+    def unregister(self, source_id: str) -> None:
+        with self._lock:
+            self._sources.discard(source_id)
+            self._pending.pop(source_id, None)
+            self._ready.notify()
+
+    def submit(
+        self,
+        source_id: str,
+        frame: np.ndarray,
+        callback: Callable[[np.ndarray, int], None],
+        on_drop: Optional[Callable[[np.ndarray], None]] = None,
+    ) -> None:
+        replaced = None
+        with self._lock:
+            if source_id in self._pending:
+                self.replaced += 1
+                replaced = self._pending[source_id]
+            elif not self._pending:
+                self._first_pending = time.monotonic()
+            self._pending[source_id] = (frame, callback, on_drop)
+            self._ready.notify()
+        # Like FrameQueue's on_drop: called with the evicted frame, outside the lock.
+        if replaced is not None and replaced[2] is not None:
+            replaced[2](replaced[0])
+
+    def start(self) -> None:
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="batched-inference", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            self._running = False
+            self._ready.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_batch(self) -> Optional[Dict[str, Tuple[np.ndarray, Callable, Optional[Callable]]]]:
+        with self._lock:
+            while self._running:
+                if self._pending:
+                    if len(self._pending) >= len(self._sources):
+                        break
+                    remaining = self._first_pending + self.batch_timeout - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._ready.wait(remaining)
+                else:
+                    self._ready.wait()
+            if not self._running:
+                return None
+            batch, self._pending = self._pending, {}
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            source_ids = list(batch)
+            frames = [batch[source_id][0] for source_id in source_ids]
+            started = time.monotonic()
+            try:
+                counts = self.detector.detect_batch(source_ids, frames, started)
+            except Exception:
+                logger.exception("Batched inference failed (%d frames)", len(frames))
+                continue
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.batches += 1
+            self.frames += len(frames)
+            self._last_infer_ms = elapsed_ms
+            self._total_infer_ms += elapsed_ms
+
+            for source_id, frame, count in zip(source_ids, frames, counts):
+                try:
+                    batch[source_id][1](frame, count)
+                except Exception:
+                    logger.exception("Detection callback failed: %s", source_id)
+
+    def get_status(self) -> dict:
+        batches = self.batches
+        return {
+            "sources": len(self._sources),
+            "batches": batches,
+            "frames": self.frames,
+            "avg_batch_size": round(self.frames / batches, 2) if batches else 0.0,
+            "replaced": self.replaced,
+            "last_infer_ms": round(self._last_infer_ms, 2),
+            "avg_infer_ms": round(self._total_infer_ms / batches, 2) if batches else 0.0,
+        }
@@ -0,0 +1,435 @@
+import datetime
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.logging_setup import FrameLogSummary
+from app.services.event_buffer import CAPTURE_MODES, MODE_FRAME, EventRecorder
+from app.services.frame_pool import FramePool, PooledFrame
+from app.services.frame_worker import DROP_OLDEST, FrameProcessor
+from app.services.gating import MODE_ACTIVE, InferenceGate
+from app.services.metrics import REGISTRY, CameraMetrics
+from app.services.occupancy import OccupancyStore
+from app.services.preview import PreviewPublisher
+from app.services.sampling import SamplingPolicy, SamplingState
+from app.services.snooze import SnoozePower, SnoozeTimer
+from app.services.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FrameTask:
+    frame: PooledFrame
+    person_count: int
+    captured_at: float
+    should_sample: bool
+    should_preview: bool
+    should_buffer: bool = False
+    # Forced snapshots are saved even if they look like a recent sample.
+    forced: bool = False
+    # Sampling reason, counted by Storage once the sample is written.
+    reason: Optional[str] = None
+
+
+class CameraPipeline:
+    """Per-camera sampling, storage, preview and snooze state shared by every backend.
+
+    Backends feed detections through ``handle_detection`` from their own
+    streaming thread and implement ``start``/``stop``. Captured frames are
+    copied into pooled buffers on that thread and converted to BGR buffers,
+    sized from ``frame_size`` (width, height), on the frame worker.
+    """
+
+    backend = "base"
+    # Conversion from the backend's native frame layout to BGR, if any.
+    frame_conversion: Optional[int] = None
+
+    def __init__(
+        self,
+        camera_id: str,
+        camera_name: str,
+        sampling_policy: SamplingPolicy,
+        storage: Storage,
+        recent_samples_limit: int,
+        frame_processor: FrameProcessor,
+        preview_fps: float = 10.0,
+        frame_queue_size: int = 4,
+        drop_policy: str = DROP_OLDEST,
+        metrics: Optional[CameraMetrics] = None,
+        log_summary_seconds: float = 10.0,
+        frame_size: Optional[Tuple[int, int]] = None,
+        event_recorder: Optional[EventRecorder] = None,
+        inference_gate: Optional[InferenceGate] = None,
+        snooze_power: Optional[SnoozePower] = None,
+        occupancy: Optional[OccupancyStore] = None,
+    ) -> None:
+        self.camera_id = camera_id
+        self.camera_name = camera_name
+        self.sampling_policy = sampling_policy
+        self.storage = storage
+        self.recent_samples_limit = recent_samples_limit
+        self.metrics = metrics or CameraMetrics(camera_id)
+        self.log_summary = FrameLogSummary(logger, camera_id, interval=log_summary_seconds)
+        self.preview = PreviewPublisher(max_fps=preview_fps, metrics=self.metrics)
+        self.event_recorder = event_recorder
+        self.inference_gate = inference_gate
+        self.occupancy = occupancy
+        # None: snoozing only stops sampling.
+        self.snooze_power = snooze_power
+        self._preview_fps = self.preview.max_fps
+        # The profile in effect; swapped as a whole so frames never see half of a switch.
+        self._low_power: Optional[SnoozePower] = None
+        self._next_admit = 0.0
+        self.throttled_frames = 0
+        self._last_person_count = 0
+        self._snapshot_mode: Optional[str] = None
+        # Queued frames plus the one being processed and the one held by the preview.
+        self.frame_pool = FramePool(
+            shape=(frame_size[1], frame_size[0], 3) if frame_size else None,
+            capacity=frame_queue_size + 2,
+        )
+        # Raw copies in the backend's layout, converted to BGR on the worker;
+        # sized from the first frame since only the backend knows its channels.
+        self.source_pool = (
+            FramePool(capacity=frame_queue_size + 1, preallocate=0) if self.frame_conversion is not None else None
+        )
+        self.frame_queue = frame_processor.create_queue(
+            name=camera_id,
+            handler=self._process_frame,
+            maxsize=frame_queue_size,
+            drop_policy=drop_policy,
+            on_drop=self._drop_frame,
+        )
+        self.sampling_state = SamplingState(
+            last_sample_time=datetime.datetime.now().replace(
+                hour=12, minute=0, second=0, microsecond=0
+            )
+        )
+
+        self._status_lock = threading.Lock()
+        self._last_frame_time: Optional[datetime.datetime] = None
+        self.created_at = time.monotonic()
+        self.first_frame_at: Optional[float] = None
+        self.last_frame_at: Optional[float] = None
+        # Set by the backend when its source errors out or ends; cleared only by a rebuild.
+        self.failure: Optional[str] = None
+        self._running = False
+        self._snooze = SnoozeTimer(camera_id, on_change=self._on_snooze_change)
+        REGISTRY.register_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        labels = (("camera", self.camera_id),)
+        queue = self.frame_queue
+        yield "happylad_frames_processed_total", "counter", "Frames handled by the worker pool", labels, queue.processed
+        yield "happylad_frames_dropped_total", "counter", "Frames dropped by the bounded frame queue", labels, queue.dropped
+        yield "happylad_frame_queue_depth", "gauge", "Frames waiting for a worker", labels, len(queue)
+        yield "happylad_stream_subscribers", "gauge", "Connected MJPEG viewers", labels, self.preview.subscribers
+        dedup = self.storage.dedup
+        if dedup is not None:
+            yield "happylad_samples_suppressed_total", "counter", "Near-duplicate samples skipped or tagged", labels, dedup.suppressed
+        yield "happylad_frame_buffer_allocations_total", "counter", "Frame buffers allocated by the pools", labels, self.frame_pool.allocations + (
+            self.source_pool.allocations if self.source_pool is not None else 0
+        )
+        gate = self.inference_gate
+        yield "happylad_inference_interval", "gauge", "Detector runs on every Nth frame", labels, gate.interval if gate else 1
+        yield "happylad_low_power", "gauge", "Whether the camera runs its snooze power profile", labels, int(self._low_power is not None)
+        yield "happylad_running", "gauge", "Whether the camera pipeline is running", labels, int(self._running and self.failure is None)
+
+    def handle_detection(self, person_count: Optional[int], get_frame: Callable[[], np.ndarray]) -> bool:
+        """Run sampling and preview decisions for one frame; returns whether snoozing.
+
+        ``get_frame`` is only called when the frame is actually needed; the
+        array it returns is copied into a pooled buffer before returning, so
+        it only has to stay valid for the duration of this call. A
+        ``person_count`` of None marks a frame the detector skipped; the last
+        count carries forward so sampling sees an unbroken series.
+        """
+        self.metrics.frames_in.inc()
+        if self.inference_gate is not None:
+            person_count = self.inference_gate.update(person_count)
+        if person_count is None:
+            person_count = self._last_person_count
+        self._last_person_count = person_count
+        if self.occupancy is not None:
+            self.occupancy.record(person_count)
+        low_power = self._low_power
+        snoozing = self.is_snoozing()
+        if snoozing:
+            self.sampling_state.force_snapshot = False
+            should_sample = False
+        else:
+            should_sample = self.sampling_policy.should_sample(
+                self.sampling_state,
+                person_count=person_count,
+            )
+        captured_at = time.time()
+        forced = should_sample and self.sampling_state.last_reason == "forced"
+        event_mode = self._event_mode(self.sampling_state.last_reason) if should_sample else None
+        if event_mode is not None:
+            self.event_recorder.trigger(
+                self.camera_name, captured_at, event_mode, exempt=forced, reason=self.sampling_state.last_reason
+            )
+        recorder = self.event_recorder
+        should_buffer = recorder is not None and (event_mode is not None or recorder.wants_frame())
+        should_preview = self.preview.wants_frame() and (low_power is None or low_power.preview_fps > 0)
+
+        if should_sample or ((should_preview or should_buffer) and self.frame_queue.can_accept()):
+            self.frame_queue.put(
+                FrameTask(
+                    frame=self._capture(get_frame()),
+                    person_count=person_count,
+                    captured_at=captured_at,
+                    # Event captures are persisted by the recorder from its buffer.
+                    should_sample=should_sample and event_mode is None,
+                    should_preview=should_preview,
+                    should_buffer=should_buffer,
+                    forced=forced,
+                    reason=self.sampling_state.last_reason if should_sample else None,
+                ),
+                force=should_sample,
+            )
+
+        self.log_summary.record(person_count, should_sample)
+        if self.first_frame_at is None:
+            self.first_frame_at = time.monotonic()
+            logger.info(
+                "First frame received: %s (%.2f s after build)", self.camera_id, self.first_frame_at - self.created_at
+            )
+
+        with self._status_lock:
+            self._last_frame_time = datetime.datetime.now()
+            self.last_frame_at = time.monotonic()
+        return snoozing
+
+    def _event_mode(self, reason: str) -> Optional[str]:
+        mode = None
+        if reason == "forced":
+            mode, self._snapshot_mode = self._snapshot_mode, None
+        if self.event_recorder is None:
+            return None
+        mode = mode or self.event_recorder.mode
+        return None if mode == MODE_FRAME else mode
+
+    def _capture(self, source: np.ndarray) -> PooledFrame:
+        # Runs on the backend's streaming thread: only a copy into a pooled
+        # buffer, the colour conversion is left to the worker. The copy is
+        # bound by memory bandwidth (about 1.7 ms for 1080p RGBA, see
+        # app/bench_capture.py); holding the surface instead would pin one of
+        # nvstreammux's few buffers while the frame waits in the queue.
+        pool = self.source_pool if self.source_pool is not None else self.frame_pool
+        frame = pool.acquire(source.shape)
+        np.copyto(frame.array, source)
+        return frame
+
+    def _to_bgr(self, raw: PooledFrame) -> PooledFrame:
+        """Converts a captured frame into a pooled BGR buffer on the worker; takes over ``raw``."""
+        if self.frame_conversion is None:
+            return raw
+        started = time.perf_counter()
+        try:
+            source = raw.array
+            frame = self.frame_pool.acquire((source.shape[0], source.shape[1], 3))
+            cv2.cvtColor(source, self.frame_conversion, dst=frame.array)
+        finally:
+            raw.release()
+        self.metrics.convert_seconds.observe(time.perf_counter() - started)
+        return frame
+
+    def _drop_frame(self, task: FrameTask) -> None:
+        task.frame.release()
+
+    def _process_frame(self, task: FrameTask) -> None:
+        frame = self._to_bgr(task.frame)
+        try:
+            timestamp = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(task.captured_at))
+            cv2.putText(
+                frame.array,
+                timestamp,
+                (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                1,
+                (255, 255, 255),
+                2,
+                cv2.LINE_AA,
+            )
+            # Storage and preview retain the buffer themselves; no copies are made.
+            if task.should_buffer:
+                self.event_recorder.add(frame.array, task.captured_at)
+            if task.should_sample:
+                self.storage.save_sample(
+                    frame.array, self.camera_name, lease=frame, exempt=task.forced, reason=task.reason
+                )
+            if task.should_preview:
+                self.preview.publish(frame.array, lease=frame)
+        finally:
+            frame.release()
+
+    def start(self) -> None:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self._snooze.close()
+        if self.occupancy is not None:
+            self.occupancy.close()
+        REGISTRY.unregister_collector(self._collect_metrics)
+
+    def mark_failed(self, reason: str) -> None:
+        """Records that frames stopped for good; the manager's watchdog rebuilds the camera."""
+        if self.failure is None:
+            logger.error("Camera %s failed: %s", self.camera_id, reason)
+            self.failure = reason
+
+    def update_settings(
+        self,
+        camera_name: str,
+        time_span_years: float,
+        cooldown_hours: float,
+        recent_samples_limit: int,
+        preview_fps: float,
+        snooze_power: Optional[SnoozePower] = None,
+    ) -> None:
+        """Applies the settings that do not need the capture graph rebuilt."""
+        self.camera_name = camera_name
+        # Rescheduling keeps the cooldown anchored to the last sample; the
+        # lottery wait is memoryless, so redrawing it does not bias sampling.
+        self.sampling_policy.configure(time_span_years, cooldown_hours)
+        self.sampling_policy.reschedule(self.sampling_state)
+        self.recent_samples_limit = recent_samples_limit
+
+        def update_power() -> None:
+            self._preview_fps = max(0.0, float(preview_fps))
+            self.snooze_power = snooze_power
+
+        # Under the snooze timer's lock, so a snooze ending meanwhile cannot apply a stale profile.
+        self._snooze.refresh(update_power)
+
+    def inherit_state(self, previous: "CameraPipeline") -> None:
+        """Takes over viewers, sampling history and snooze from the pipeline this one replaces."""
+        self.preview = previous.preview
+        self.preview.max_fps = self._preview_fps
+        self.sampling_state = previous.sampling_state
+        self.sampling_policy.reschedule(self.sampling_state)
+        self._last_person_count = previous._last_person_count
+        self._snooze.restore(previous._snooze.until)
+
+    def force_snapshot(self, mode: Optional[str] = None) -> None:
+        """Sample the next frame; ``mode`` overrides the configured capture mode for this one event."""
+        if mode is not None:
+            if mode not in CAPTURE_MODES:
+                raise ValueError(f"Unknown capture mode: {mode}")
+            if mode != MODE_FRAME and self.event_recorder is None:
+                raise ValueError(f"Pre-event buffer is disabled for {self.camera_id}")
+        logger.info("Force snapshot requested for %s", self.camera_id)
+        self._snapshot_mode = mode
+        self.sampling_state.force_snapshot = True
+
+    def add_snooze(self, minutes: int = 10) -> datetime.datetime:
+        return self._snooze.extend(minutes)
+
+    def cancel_snooze(self) -> None:
+        self._snooze.cancel()
+
+    def is_snoozing(self) -> bool:
+        return self._snooze.active
+
+    def _on_snooze_change(self, active: bool) -> None:
+        low_power = self.snooze_power if active else None
+        if low_power is not None and low_power.preview_fps > 0:
+            self.preview.max_fps = min(low_power.preview_fps, self._preview_fps or low_power.preview_fps)
+        else:
+            self.preview.max_fps = self._preview_fps
+        self._next_admit = 0.0
+        if (low_power is None) != (self._low_power is None):
+            logger.info("Camera %s %s", self.camera_id, "in low power" if low_power else "back to full rate")
+        self._low_power = low_power
+        self.apply_power()
+
+    def apply_power(self) -> None:
+        """Hook for backends that reconfigure their capture graph when the power profile changes."""
+
+    @property
+    def inference_paused(self) -> bool:
+        low_power = self._low_power
+        return low_power is not None and low_power.pause_inference
+
+    @property
+    def min_frame_interval(self) -> float:
+        """Seconds between the frames let through by the current profile."""
+        low_power = self._low_power
+        return 1.0 / low_power.fps if low_power is not None and low_power.fps > 0 else 0.0
+
+    def admit_frame(self) -> bool:
+        """Valve in front of decoding and inference: whether the profile in effect lets this frame through."""
+        low_power = self._low_power
+        if low_power is None or low_power.fps <= 0:
+            return True
+        now = time.monotonic()
+        if now < self._next_admit:
+            self.throttled_frames += 1
+            return False
+        self._next_admit = now + 1.0 / low_power.fps
+        return True
+
+    def get_latest_jpeg(self) -> Optional[bytes]:
+        return self.preview.get_jpeg()
+
+    def get_source_status(self) -> dict:
+        return {}
+
+    def _inference_status(self) -> dict:
+        if self.inference_gate is not None:
+            return self.inference_gate.get_status()
+        return {"mode": MODE_ACTIVE, "interval": 1, "inference_fps": self.metrics.frame_rate()}
+
+    def get_status(self) -> dict:
+        with self._status_lock:
+            last_frame = self._last_frame_time
+        snooze_until = self._snooze.until
+        snoozing = snooze_until is not None
+        remaining_seconds = max(0, int((snooze_until - datetime.datetime.now()).total_seconds())) if snoozing else 0
+        low_power = self._low_power
+        return {
+            "camera_id": self.camera_id,
+            "camera_name": self.camera_name,
+            "backend": self.backend,
+            **self.get_source_status(),
+            "running": self._running and self.failure is None,
+            "failure": self.failure,
+            "last_frame_time": last_frame.isoformat() if last_frame else None,
+            "recent_samples_limit": self.recent_samples_limit,
+            "preview": {
+                "max_fps": self.preview.max_fps,
+                "subscribers": self.preview.subscribers,
+                "frame_seq": self.preview.seq,
+            },
+            "frame_queue": self.frame_queue.get_status(),
+            "frame_pool": self.frame_pool.get_status(),
+            "source_pool": self.source_pool.get_status() if self.source_pool is not None else None,
+            "inference": self._inference_status(),
+            "occupancy": self.occupancy.get_status() if self.occupancy is not None else None,
+            "capture": self.event_recorder.get_status() if self.event_recorder is not None else {"mode": MODE_FRAME},
+            "metrics": self.metrics.summary(),
+            "storage": self.storage.get_status(),
+            "sampling": {
+                "time_span_years": self.sampling_policy.time_span_years,
+                "cooldown_hours": self.sampling_policy.cooldown_seconds / 3600,
+            },
+            "snoozing": snoozing,
+            "snooze_until": snooze_until.isoformat() if snoozing else None,
+            "snooze_remaining_seconds": remaining_seconds,
+            "power": {
+                "profile": "low" if low_power is not None else "full",
+                "fps": low_power.fps if low_power is not None else None,
+                "inference_paused": low_power is not None and low_power.pause_inference,
+                "throttled_frames": self.throttled_frames,
+            },
+        }
@@ -0,0 +1,184 @@
+import copy
+import logging
+import os
+import tempfile
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import yaml
+
+from app.config import AppConfig, CameraConfig, parse_config
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def merge_changes(target: dict, changes: dict) -> dict:
+    """Recursively applies ``changes``; nested dicts merge, ``None`` removes a key."""
+    for key, value in changes.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_changes(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+    return target
+
+
+class ConfigStore:
+    """Authoritative in-memory configuration backed by a YAML file.
+
+    Every change is validated by ``parse_config`` before it is persisted
+    (temp file + rename) and handed to subscribers as ``callback(old, new)``.
+    Changes are serialized, so subscribers never see them out of order.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._subscribers: List[Callable[[AppConfig, AppConfig], None]] = []
+        self._raw, self._config = self._read()
+        self._stat = self._file_stat()
+        self._watch_stop = threading.Event()
+        self._watch_thread: Optional[threading.Thread] = None
+
+    @property
+    def config(self) -> AppConfig:
+        return self._config
+
+    def subscribe(self, callback: Callable[[AppConfig, AppConfig], None]) -> None:
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def _read(self) -> Tuple[dict, AppConfig]:
+        with open(self.path, "r", encoding="utf-8") as file:
+            raw = yaml.safe_load(file) or {}
+        return raw, self._validate(raw)
+
+    @staticmethod
+    def _validate(raw: dict) -> AppConfig:
+        try:
+            return parse_config(raw)
+        except (KeyError, TypeError, ValueError) as exc:
+            detail = f"missing field {exc}" if isinstance(exc, KeyError) else str(exc)
+            raise ConfigError(f"Invalid configuration: {detail}") from exc
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _persist(self, raw: dict) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".yaml", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                yaml.safe_dump(raw, file, allow_unicode=True)
+                file.flush()
+                os.fsync(file.fileno())
+            try:
+                # mkstemp creates the file 0600; keep the original permissions.
+                os.chmod(tmp_path, os.stat(self.path).st_mode & 0o777)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._stat = self._file_stat()
+
+    def _commit(self, raw: dict, persist: bool = True) -> AppConfig:
+        with self._lock:
+            config = self._validate(raw)
+            if persist:
+                self._persist(raw)
+            old, self._raw, self._config = self._config, raw, config
+            for callback in list(self._subscribers):
+                try:
+                    callback(old, config)
+                except Exception:
+                    logger.exception("Config subscriber failed")
+            return config
+
+    def _camera_index(self, raw: dict, camera_id: str) -> int:
+        for index, camera in enumerate(raw.get("cameras") or []):
+            if camera.get("id") == camera_id:
+                return index
+        raise KeyError(camera_id)
+
+    def get_camera(self, camera_id: str) -> CameraConfig:
+        for camera in self._config.cameras:
+            if camera.id == camera_id:
+                return camera
+        raise KeyError(camera_id)
+
+    def update_camera(self, camera_id: str, changes: dict) -> CameraConfig:
+        """Applies a partial update; raises KeyError for unknown cameras, ConfigError if invalid."""
+        if changes.get("id", camera_id) != camera_id:
+            raise ConfigError("Camera id cannot be changed")
+        with self._lock:
+            raw = copy.deepcopy(self._raw)
+            index = self._camera_index(raw, camera_id)
+            merge_changes(raw["cameras"][index], changes)
+            self._commit(raw)
+            return self.get_camera(camera_id)
+
+    def add_camera(self, camera: dict) -> CameraConfig:
+        if not isinstance(camera, dict) or "id" not in camera:
+            raise ConfigError("Camera needs an id")
+        with self._lock:
+            raw = copy.deepcopy(self._raw)
+            raw.setdefault("cameras", []).append(copy.deepcopy(camera))
+            self._commit(raw)
+            return self.get_camera(camera["id"])
+
+    def remove_camera(self, camera_id: str) -> None:
+        with self._lock:
+            raw = copy.deepcopy(self._raw)
+            del raw["cameras"][self._camera_index(raw, camera_id)]
+            self._commit(raw)
+
+    def reload(self) -> bool:
+        """Re-reads the file; keeps the current config and returns False if it is invalid."""
+        with self._lock:
+            self._stat = self._file_stat()
+            try:
+                raw, _config = self._read()
+            except (OSError, yaml.YAMLError, ConfigError) as exc:
+                logger.error("Not reloading %s: %s", self.path, exc)
+                return False
+            if raw == self._raw:
+                return False
+            logger.info("Reloading configuration from %s", self.path)
+            self._commit(raw, persist=False)
+            return True
+
+    def watch(self, interval: float) -> None:
+        """Polls the file every ``interval`` seconds and reloads it when it changes."""
+        if self._watch_thread is not None or interval <= 0:
+            return
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch, args=(interval,), name="config-watch", daemon=True)
+        self._watch_thread.start()
+
+    def _watch(self, interval: float) -> None:
+        while not self._watch_stop.wait(interval):
+            if self._file_stat() != self._stat:
+                try:
+                    self.reload()
+                except Exception:
+                    logger.exception("Config reload failed")
+
+    def stop_watching(self) -> None:
+        self._watch_stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join(timeout=5.0)
+            self._watch_thread = None
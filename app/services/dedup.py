@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEDUP_FILENAME = ".dedup.npy"
+DEDUP_SKIP = "skip"
+DEDUP_TAG = "tag"
+DEDUP_MODES = (DEDUP_SKIP, DEDUP_TAG)
+
+# Set bits per byte value, for popcounts over uint64 arrays viewed as bytes.
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def dhash(frame: np.ndarray) -> int:
+    """64-bit difference hash: sign of the horizontal gradient of a 9x8 grayscale thumbnail.
+
+    Neighbours must differ by more than one gray level to set a bit, so flat
+    areas such as walls hash to stable zeros instead of sensor noise.
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = small[:, 1:] > small[:, :-1] + 1
+    return int(np.packbits(bits.ravel()).view(">u8")[0])
+
+
+def hamming(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Bit distance from ``value`` to each of ``hashes`` (uint64)."""
+    diff = np.bitwise_xor(hashes, np.uint64(value))
+    return _POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class DuplicateFilter:
+    """Recognises samples that look like one of the last ``window`` kept ones.
+
+    Each sample is reduced to a 64-bit dHash; a sample within
+    ``max_distance`` bits of a recent one is a near-duplicate. The recent
+    hashes are a ring of packed uint64 kept in ``<base_dir>/.dedup.npy``, so
+    a restart does not forget what a static scene looks like.
+    """
+
+    def __init__(self, base_dir: str, max_distance: int = 3, window: int = 64, mode: str = DEDUP_SKIP) -> None:
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode: {mode}")
+        self.path = os.path.join(base_dir, DEDUP_FILENAME)
+        self.max_distance = max(0, max_distance)
+        self.window = max(1, window)
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._hashes = self._load()
+        self.checked = 0
+        self.suppressed = 0
+        self.last_distance: Optional[int] = None
+
+    def _load(self) -> np.ndarray:
+        try:
+            hashes = np.load(self.path)
+        except FileNotFoundError:
+            return np.empty(0, dtype=np.uint64)
+        except (OSError, ValueError):
+            logger.warning("Dedup index unreadable, starting over: %s", self.path)
+            return np.empty(0, dtype=np.uint64)
+        return hashes.astype(np.uint64, copy=False)[-self.window:]
+
+    def _save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, self._hashes)
+        os.replace(tmp_path, self.path)
+
+    def check(self, frame: np.ndarray) -> Tuple[bool, int]:
+        """Returns whether ``frame`` is a near-duplicate, and its hash for ``remember``."""
+        value = dhash(frame)
+        with self._lock:
+            self.checked += 1
+            if not len(self._hashes):
+                self.last_distance = None
+                return False, value
+            distance = int(hamming(self._hashes, value).min())
+            self.last_distance = distance
+            duplicate = distance <= self.max_distance
+            if duplicate:
+                self.suppressed += 1
+            return duplicate, value
+
+    def remember(self, value: int) -> None:
+        """Adds the hash of a kept sample."""
+        with self._lock:
+            self._hashes = np.append(self._hashes, np.uint64(value))[-self.window:]
+            try:
+                self._save()
+            except OSError:
+                logger.exception("Failed to save dedup index: %s", self.path)
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "max_distance": self.max_distance,
+                "hashes": len(self._hashes),
+                "checked": self.checked,
+                "suppressed": self.suppressed,
+                "last_distance": self.last_distance,
+            }
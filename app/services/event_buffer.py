@@ -0,0 +1,308 @@
+import logging
+import math
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from app.services.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+MODE_FRAME = "frame"
+MODE_BURST = "burst"
+MODE_SHARPEST = "sharpest"
+MODE_CLIP = "clip"
+CAPTURE_MODES = (MODE_FRAME, MODE_BURST, MODE_SHARPEST, MODE_CLIP)
+
+# Frames still in the worker queue when the post-event window closes get this long to land.
+FLUSH_GRACE_SECONDS = 0.5
+MAX_PENDING_EVENTS = 4
+
+
+@dataclass
+class BufferedFrame:
+    timestamp: float
+    sharpness: float
+    width: int
+    height: int
+    jpeg: bytes
+
+
+def sharpness(frame: np.ndarray, step: int = 4) -> float:
+    """Mean squared gradient of a subsampled green channel; higher is sharper."""
+    plane = frame[::step, ::step, 1] if frame.ndim == 3 else frame[::step, ::step]
+    plane = plane.astype(np.float32)
+    dx = plane[:, 1:] - plane[:, :-1]
+    dy = plane[1:, :] - plane[:-1, :]
+    return float(np.mean(dx * dx) + np.mean(dy * dy))
+
+
+class FrameRing:
+    """Encoded frames kept in one preallocated byte buffer.
+
+    Memory is fixed at construction: ``max_bytes`` of JPEG data plus
+    ``max_frames`` metadata slots. Appending evicts the oldest frames whose
+    bytes would be overwritten, so the buffer never grows.
+    """
+
+    def __init__(self, max_bytes: int, max_frames: int) -> None:
+        self.max_bytes = max(1, max_bytes)
+        self.max_frames = max(1, max_frames)
+        self._data = np.empty(self.max_bytes, dtype=np.uint8)
+        self._offsets = np.zeros(self.max_frames, dtype=np.int64)
+        self._lengths = np.zeros(self.max_frames, dtype=np.int64)
+        self._timestamps = np.zeros(self.max_frames, dtype=np.float64)
+        self._scores = np.zeros(self.max_frames, dtype=np.float32)
+        self._shapes = np.zeros((self.max_frames, 2), dtype=np.int32)
+        self._lock = threading.Lock()
+        self._first = 0
+        self._count = 0
+        self._write_pos = 0
+        self.appended = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def used_bytes(self) -> int:
+        with self._lock:
+            return int(sum(self._lengths[(self._first + i) % self.max_frames] for i in range(self._count)))
+
+    def _drop_oldest(self) -> None:
+        self._first = (self._first + 1) % self.max_frames
+        self._count -= 1
+
+    def append(self, jpeg, timestamp: float, score: float, width: int, height: int) -> bool:
+        data = np.frombuffer(jpeg, dtype=np.uint8)
+        size = len(data)
+        if size > self.max_bytes:
+            self.rejected += 1
+            return False
+        with self._lock:
+            if self._count == 0:
+                self._write_pos = 0
+            pos = self._write_pos
+            if pos + size > self.max_bytes:
+                # Wrap: the tail past ``pos`` is abandoned, along with the frames in it.
+                while self._count and self._offsets[self._first] >= pos:
+                    self._drop_oldest()
+                pos = 0
+            while self._count and (
+                self._count == self.max_frames
+                or (
+                    self._offsets[self._first] < pos + size
+                    and self._offsets[self._first] + self._lengths[self._first] > pos
+                )
+            ):
+                self._drop_oldest()
+
+            slot = (self._first + self._count) % self.max_frames
+            self._data[pos:pos + size] = data
+            self._offsets[slot] = pos
+            self._lengths[slot] = size
+            self._timestamps[slot] = timestamp
+            self._scores[slot] = score
+            self._shapes[slot] = (width, height)
+            self._count += 1
+            self._write_pos = pos + size
+            self.appended += 1
+        return True
+
+    def frames(self, start: float, end: float) -> List[BufferedFrame]:
+        """Copies out the frames with ``start <= timestamp <= end``, oldest first."""
+        result = []
+        with self._lock:
+            for i in range(self._count):
+                slot = (self._first + i) % self.max_frames
+                timestamp = float(self._timestamps[slot])
+                if start <= timestamp <= end:
+                    offset, length = int(self._offsets[slot]), int(self._lengths[slot])
+                    result.append(
+                        BufferedFrame(
+                            timestamp=timestamp,
+                            sharpness=float(self._scores[slot]),
+                            width=int(self._shapes[slot][0]),
+                            height=int(self._shapes[slot][1]),
+                            jpeg=self._data[offset:offset + length].tobytes(),
+                        )
+                    )
+        return result
+
+
+def _chunk(fourcc: bytes, payload: bytes) -> bytes:
+    return fourcc + struct.pack("<I", len(payload)) + payload + (b"\0" if len(payload) % 2 else b"")
+
+
+def _list(kind: bytes, payload: bytes) -> bytes:
+    return _chunk(b"LIST", kind + payload)
+
+
+def build_mjpeg_avi(frames: List[BufferedFrame], fps: float) -> bytes:
+    """Wraps already-encoded JPEG frames in an MJPEG AVI container without re-encoding."""
+    width = max(frame.width for frame in frames)
+    height = max(frame.height for frame in frames)
+    largest = max(len(frame.jpeg) for frame in frames)
+    rate = max(1, round(fps * 1000))
+
+    avih = struct.pack(
+        "<14I",
+        round(1_000_000 / max(fps, 0.001)),  # dwMicroSecPerFrame
+        round(largest * fps),  # dwMaxBytesPerSec
+        0,
+        0x10,  # AVIF_HASINDEX
+        len(frames),
+        0,
+        1,  # dwStreams
+        largest,
+        width,
+        height,
+        0,
+        0,
+        0,
+        0,
+    )
+    strh = b"vidsMJPG" + struct.pack(
+        "<IHHIIIIIIiI4h", 0, 0, 0, 0, 1000, rate, 0, len(frames), largest, -1, 0, 0, 0, width, height
+    )
+    strf = struct.pack("<IiiHH4sIiiII", 40, width, height, 1, 24, b"MJPG", width * height * 3, 0, 0, 0, 0)
+    header = _list(b"hdrl", _chunk(b"avih", avih) + _list(b"strl", _chunk(b"strh", strh) + _chunk(b"strf", strf)))
+
+    movi = []
+    index = []
+    offset = 4  # idx1 offsets count from the "movi" fourcc
+    for frame in frames:
+        chunk = _chunk(b"00dc", frame.jpeg)
+        index.append(b"00dc" + struct.pack("<III", 0x10, offset, len(frame.jpeg)))
+        movi.append(chunk)
+        offset += len(chunk)
+
+    body = b"AVI " + header + _list(b"movi", b"".join(movi)) + _chunk(b"idx1", b"".join(index))
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+class EventRecorder:
+    """Keeps the last few seconds of a camera as JPEG and persists them around sampling events.
+
+    Modes: ``burst`` saves every buffered frame in the window, ``sharpest``
+    saves only the frame with the highest ``sharpness`` score and ``clip``
+    saves that frame with an MJPEG AVI of the window beside it. Frames are
+    encoded once on the frame worker and persisted byte-for-byte.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        mode: str = MODE_BURST,
+        buffer_seconds: float = 6.0,
+        buffer_fps: float = 5.0,
+        buffer_bytes: int = 16 * 1024 * 1024,
+        before_seconds: float = 2.0,
+        after_seconds: float = 2.0,
+        jpeg_quality: int = 95,
+    ) -> None:
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode: {mode}")
+        self.storage = storage
+        self.mode = mode
+        self.buffer_fps = max(0.1, buffer_fps)
+        self.before_seconds = before_seconds
+        self.after_seconds = after_seconds
+        self.jpeg_quality = jpeg_quality
+        # Room for the forced event frames on top of the paced ones.
+        max_frames = math.ceil(buffer_seconds * self.buffer_fps) + MAX_PENDING_EVENTS
+        self.ring = FrameRing(buffer_bytes, max_frames)
+        self._lock = threading.Lock()
+        self._pending: List[threading.Timer] = []
+        self._next_frame = 0.0
+        self.events = 0
+        self.saved = 0
+        self.missed = 0
+
+    def wants_frame(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_frame:
+            return False
+        self._next_frame = now + 1.0 / self.buffer_fps
+        return True
+
+    def add(self, frame: np.ndarray, captured_at: float) -> None:
+        ret, jpeg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if not ret:
+            return
+        self.ring.append(jpeg, captured_at, sharpness(frame), frame.shape[1], frame.shape[0])
+
+    def trigger(
+        self,
+        camera_name: str,
+        captured_at: float,
+        mode: Optional[str] = None,
+        exempt: bool = False,
+        reason: Optional[str] = None,
+    ) -> bool:
+        """Schedule persisting the window around ``captured_at``; false if too many are pending.
+
+        ``exempt`` events are saved even if they look like a recent sample;
+        ``reason`` is the sampling reason passed on to storage.
+        """
+        mode = mode or self.mode
+        if mode not in CAPTURE_MODES or mode == MODE_FRAME:
+            raise ValueError(f"Not an event capture mode: {mode}")
+        delay = max(0.0, captured_at + self.after_seconds - time.time()) + FLUSH_GRACE_SECONDS
+        with self._lock:
+            self._pending = [timer for timer in self._pending if timer.is_alive()]
+            if len(self._pending) >= MAX_PENDING_EVENTS:
+                self.missed += 1
+                return False
+            timer = threading.Timer(delay, self._persist, args=(camera_name, captured_at, mode, exempt, reason))
+            timer.daemon = True
+            self._pending.append(timer)
+            self.events += 1
+        timer.start()
+        return True
+
+    def _persist(self, camera_name: str, captured_at: float, mode: str, exempt: bool, reason: Optional[str]) -> None:
+        frames = self.ring.frames(captured_at - self.before_seconds, captured_at + self.after_seconds)
+        if not frames:
+            self.missed += 1
+            logger.warning("No buffered frames around event for %s", camera_name)
+            return
+        if mode == MODE_BURST:
+            # One event, so the samples metric counts it once, on the first frame.
+            for sequence, frame in enumerate(frames):
+                self.storage.save_encoded(
+                    frame.jpeg,
+                    camera_name,
+                    frame.timestamp,
+                    sequence=sequence,
+                    exempt=exempt,
+                    reason=reason if sequence == 0 else None,
+                )
+            self.saved += len(frames)
+            return
+        best = max(frames, key=lambda frame: frame.sharpness)
+        clip = build_mjpeg_avi(frames, self.buffer_fps) if mode == MODE_CLIP else None
+        self.storage.save_encoded(best.jpeg, camera_name, best.timestamp, clip=clip, exempt=exempt, reason=reason)
+        self.saved += 1
+
+    def close(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for timer in pending:
+            timer.cancel()
+
+    def get_status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "buffered_frames": len(self.ring),
+            "buffered_bytes": self.ring.used_bytes,
+            "max_bytes": self.ring.max_bytes,
+            "events": self.events,
+            "saved": self.saved,
+            "missed": self.missed,
+        }
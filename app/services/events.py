@@ -0,0 +1,191 @@
+import collections
+import datetime
+import json
+import logging
+import threading
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.services.sample_index import SampleRecord
+
+logger = logging.getLogger(__name__)
+
+EVENT_STATUS = "status"
+EVENT_SAMPLE = "sample"
+# Fields of a camera's get_status() that are pushed to subscribers when they change.
+STATUS_FIELDS = (
+    "camera_name",
+    "state",
+    "running",
+    "failure",
+    "last_frame_time",
+    "snoozing",
+    "snooze_until",
+    "snooze_remaining_seconds",
+)
+
+Event = Tuple[str, dict]
+
+
+def format_sse(name: str, data: dict) -> bytes:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def status_delta(old: Optional[dict], new: dict) -> dict:
+    """The STATUS_FIELDS of ``new`` that differ from ``old``; all of them if ``old`` is None."""
+    if old is None:
+        return {name: new.get(name) for name in STATUS_FIELDS}
+    return {name: new.get(name) for name in STATUS_FIELDS if old.get(name) != new.get(name)}
+
+
+class EventSubscription:
+    """One client's pending events.
+
+    Status deltas coalesce per camera, so a slow client gets the latest
+    values rather than every intermediate one. Sample events queue up to
+    ``max_samples``; beyond that the oldest are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        camera_ids: Optional[Iterable[str]] = None,
+        max_samples: int = 32,
+        on_ready: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.camera_ids = frozenset(camera_ids) if camera_ids else None
+        self.on_ready = on_ready
+        self._cond = threading.Condition()
+        self._status: Dict[str, dict] = {}
+        self._samples: Deque[dict] = collections.deque(maxlen=max(1, max_samples))
+        self.dropped = 0
+
+    def wants(self, camera_id: str) -> bool:
+        return self.camera_ids is None or camera_id in self.camera_ids
+
+    def _offer_status(self, camera_id: str, delta: dict) -> None:
+        with self._cond:
+            pending = self._status.get(camera_id)
+            if pending is None:
+                self._status[camera_id] = {"camera_id": camera_id, **delta}
+            else:
+                pending.update(delta)
+            self._cond.notify_all()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def _offer_sample(self, event: dict) -> None:
+        with self._cond:
+            if len(self._samples) == self._samples.maxlen:
+                self.dropped += 1
+            self._samples.append(event)
+            self._cond.notify_all()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def drain(self) -> List[Event]:
+        """Takes every pending event without blocking: status deltas first, then samples in order."""
+        with self._cond:
+            status, self._status = self._status, {}
+            samples = list(self._samples)
+            self._samples.clear()
+        return [(EVENT_STATUS, delta) for delta in status.values()] + [(EVENT_SAMPLE, event) for event in samples]
+
+    def wait(self, timeout: Optional[float] = None) -> List[Event]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._status or self._samples, timeout)
+        return self.drain()
+
+
+class EventHub:
+    """Fans camera status deltas and new samples out to any number of subscribers.
+
+    One producer thread polls ``status_source`` every ``interval`` seconds
+    while anyone is subscribed and diffs it against the previous poll, so the
+    cost does not grow with the number of clients. Samples are pushed by the
+    storage writer as soon as they are indexed.
+    """
+
+    def __init__(self, status_source: Callable[[], List[dict]], interval: float = 1.0) -> None:
+        self.status_source = status_source
+        self.interval = max(0.1, interval)
+        self._lock = threading.Lock()
+        self._subscribers: Tuple[EventSubscription, ...] = ()
+        self._last: Dict[str, dict] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.published = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(
+        self,
+        camera_ids: Optional[Iterable[str]] = None,
+        on_ready: Optional[Callable[[], None]] = None,
+    ) -> EventSubscription:
+        """Registers a client; its first drain holds the full current status of its cameras."""
+        subscription = EventSubscription(camera_ids, on_ready=on_ready)
+        with self._lock:
+            last = dict(self._last)
+            self._subscribers = self._subscribers + (subscription,)
+            if self._thread is None:
+                self._wake.clear()
+                self._thread = threading.Thread(target=self._run, name="events", daemon=True)
+                self._thread.start()
+        if not last:
+            last = {status["camera_id"]: status for status in self.status_source()}
+        for camera_id, status in last.items():
+            if subscription.wants(camera_id):
+                subscription._offer_status(camera_id, status_delta(None, status))
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription) -> None:
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+            if not self._subscribers:
+                self._wake.set()
+
+    def publish_sample(self, camera_id: str, record: SampleRecord) -> None:
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        event = {
+            "camera_id": camera_id,
+            **record.to_dict(),
+            "time": datetime.datetime.fromtimestamp(record.timestamp).isoformat(),
+        }
+        for subscription in subscribers:
+            if subscription.wants(camera_id):
+                subscription._offer_sample(event)
+        self.published += 1
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._poll()
+            except Exception:
+                logger.exception("Status poll failed")
+            self._wake.wait(self.interval)
+            with self._lock:
+                self._wake.clear()
+                if not self._subscribers:
+                    # Idle until the next subscriber starts a fresh producer.
+                    self._thread = None
+                    self._last = {}
+                    return
+
+    def _poll(self) -> None:
+        current = {status["camera_id"]: status for status in self.status_source()}
+        previous, self._last = self._last, current
+        subscribers = self._subscribers
+        for camera_id, status in current.items():
+            delta = status_delta(previous.get(camera_id), status)
+            if not delta:
+                continue
+            for subscription in subscribers:
+                if subscription.wants(camera_id):
+                    subscription._offer_status(camera_id, delta)
+        for camera_id in previous.keys() - current.keys():
+            for subscription in subscribers:
+                if subscription.wants(camera_id):
+                    subscription._offer_status(camera_id, {"removed": True})
@@ -0,0 +1,99 @@
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class PooledFrame:
+    """A pooled frame buffer shared between threads.
+
+    The holder that acquires it owns one reference; every additional consumer
+    that keeps the array past the current call takes its own with ``retain``.
+    The buffer goes back to the pool when the last reference is released, so
+    the array must not be touched after ``release``.
+    """
+
+    __slots__ = ("array", "_pool", "_refs")
+
+    def __init__(self, pool: "FramePool", array: np.ndarray) -> None:
+        self.array = array
+        self._pool = pool
+        self._refs = 1
+
+    def retain(self) -> "PooledFrame":
+        with self._pool._lock:
+            if self._refs <= 0:
+                raise RuntimeError("retain() on a released frame")
+            self._refs += 1
+        return self
+
+    def release(self) -> None:
+        self._pool._release(self)
+
+
+class FramePool:
+    """Reusable frame buffers of one shape, grown on demand.
+
+    ``preallocate`` buffers are created up front; when they are all in use a
+    new one is allocated (counted in ``allocations``) and kept once released,
+    up to ``capacity`` idle buffers. A different frame shape replaces the idle
+    buffers, which only happens when a source changes resolution.
+    """
+
+    def __init__(
+        self,
+        shape: Optional[Tuple[int, ...]] = None,
+        dtype=np.uint8,
+        capacity: int = 4,
+        preallocate: int = 2,
+    ) -> None:
+        self.dtype = np.dtype(dtype)
+        self.capacity = max(1, capacity)
+        self.shape = tuple(shape) if shape else None
+        self._lock = threading.Lock()
+        self._free: List[np.ndarray] = []
+        self.allocations = 0
+        self.reuses = 0
+        self.in_use = 0
+        if self.shape is not None:
+            for _ in range(min(preallocate, self.capacity)):
+                self._free.append(self._allocate(self.shape))
+
+    def _allocate(self, shape: Tuple[int, ...]) -> np.ndarray:
+        self.allocations += 1
+        return np.empty(shape, dtype=self.dtype)
+
+    def acquire(self, shape: Optional[Tuple[int, ...]] = None) -> PooledFrame:
+        with self._lock:
+            if shape is not None and tuple(shape) != self.shape:
+                self.shape = tuple(shape)
+                self._free.clear()
+            if self.shape is None:
+                raise ValueError("FramePool has no shape")
+            self.in_use += 1
+            if self._free:
+                self.reuses += 1
+                return PooledFrame(self, self._free.pop())
+            array = self._allocate(self.shape)
+        return PooledFrame(self, array)
+
+    def _release(self, frame: PooledFrame) -> None:
+        with self._lock:
+            frame._refs -= 1
+            if frame._refs > 0:
+                return
+            if frame._refs < 0:
+                raise RuntimeError("release() called more often than retain()")
+            self.in_use -= 1
+            if frame.array.shape == self.shape and len(self._free) < self.capacity:
+                self._free.append(frame.array)
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "shape": list(self.shape) if self.shape else None,
+                "free": len(self._free),
+                "in_use": self.in_use,
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+            }
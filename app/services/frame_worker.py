@@ -0,0 +1,147 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.logging_setup import log_limited
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+
+class FrameQueue:
+    def __init__(
+        self,
+        name: str,
+        executor: ThreadPoolExecutor,
+        handler: Callable,
+        maxsize: int,
+        drop_policy: str,
+        on_drop: Optional[Callable] = None,
+    ) -> None:
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.name = name
+        self.maxsize = max(1, maxsize)
+        self.drop_policy = drop_policy
+        self._executor = executor
+        self._handler = handler
+        # Called with each item evicted by the drop policy, outside the lock.
+        self._on_drop = on_drop
+        # (item, forced) pairs; forced items are only dropped when nothing else can be.
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self.dropped = 0
+        self.processed = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def can_accept(self) -> bool:
+        if self.drop_policy == DROP_NEWEST and len(self._items) >= self.maxsize:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def put(self, item, force: bool = False) -> bool:
+        """Queues ``item``; returns False if it was dropped instead.
+
+        A full queue makes room by evicting its oldest unforced item
+        (``drop-newest`` drops an unforced ``item`` instead). Only when
+        every queued item is forced is a new item dropped, forced or not.
+        """
+        evicted = None
+        with self._lock:
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                victim = None
+                if force or self.drop_policy == DROP_OLDEST:
+                    victim = next((index for index, (_, forced) in enumerate(self._items) if not forced), None)
+                if victim is None:
+                    evicted = item
+                else:
+                    evicted = self._items[victim][0]
+                    del self._items[victim]
+            if evicted is not item:
+                self._items.append((item, force))
+                submit = not self._scheduled
+                self._scheduled = True
+
+        if evicted is not None and self._on_drop is not None:
+            self._on_drop(evicted)
+        if evicted is item:
+            if force:
+                log_limited(
+                    logger,
+                    logging.WARNING,
+                    f"frame-forced-drop:{self.name}",
+                    "Frame queue %s is full of forced frames, dropping one",
+                    self.name,
+                )
+            return False
+        if submit:
+            self._executor.submit(self._drain)
+        return True
+
+    def _drain(self) -> None:
+        for _ in range(self.maxsize):
+            with self._lock:
+                if not self._items:
+                    self._scheduled = False
+                    return
+                item, _forced = self._items.popleft()
+            try:
+                self._handler(item)
+            except Exception:
+                log_limited(
+                    logger,
+                    logging.ERROR,
+                    f"frame-handler:{self.name}",
+                    "Frame handler failed: %s",
+                    self.name,
+                    exc_info=True,
+                )
+            self.processed += 1
+
+        with self._lock:
+            if not self._items:
+                self._scheduled = False
+                return
+        self._executor.submit(self._drain)
+
+    def get_status(self) -> dict:
+        return {
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "drop_policy": self.drop_policy,
+            "dropped": self.dropped,
+            "processed": self.processed,
+        }
+
+
+class FrameProcessor:
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="frame-worker",
+        )
+
+    def create_queue(
+        self,
+        name: str,
+        handler: Callable,
+        maxsize: int,
+        drop_policy: str = DROP_OLDEST,
+        on_drop: Optional[Callable] = None,
+    ) -> FrameQueue:
+        return FrameQueue(name, self._executor, handler, maxsize, drop_policy, on_drop)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODE_ACTIVE = "active"
+MODE_IDLE = "idle"
+
+
+class InferenceGate:
+    """Runs the person detector less often while a camera's scene is empty.
+
+    After ``idle_seconds`` without a detection (or motion) the camera goes
+    idle: the detector runs on every ``idle_interval``-th frame only, and each
+    frame is checked for motion with a mean absolute difference of a
+    ``motion_width``-pixel wide green-channel thumbnail against the last
+    inferred one. A detection or a score of ``motion_threshold`` or more
+    (0 disables the motion check) goes back to every frame at once. Frames
+    that are not inferred carry the last person count forward.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        idle_seconds: float = 60.0,
+        idle_interval: int = 15,
+        motion_threshold: float = 3.0,
+        motion_width: int = 64,
+        on_change: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.name = name
+        self.idle_seconds = max(0.0, idle_seconds)
+        self.idle_interval = max(1, idle_interval)
+        self.motion_threshold = max(0.0, motion_threshold)
+        self.motion_width = max(8, motion_width)
+        self.on_change = on_change
+        self.mode = MODE_ACTIVE
+        self._lock = threading.Lock()
+        self._last_activity = time.monotonic()
+        self._last_count = 0
+        self._since_inference = 0
+        self._reference: Optional[np.ndarray] = None
+        self.motion_score = 0.0
+        self.inferences = 0
+        self.carried = 0
+        self.wakeups = 0
+        self._rate_mark = (time.monotonic(), 0)
+        self._rate = 0.0
+
+    @property
+    def idle(self) -> bool:
+        return self.mode == MODE_IDLE
+
+    @property
+    def interval(self) -> int:
+        """Infer every Nth frame in the current mode."""
+        return self.idle_interval if self.idle else 1
+
+    def _small(self, frame: np.ndarray) -> np.ndarray:
+        step = max(1, frame.shape[1] // self.motion_width)
+        plane = frame[::step, ::step, 1] if frame.ndim == 3 else frame[::step, ::step]
+        return plane.astype(np.int16)
+
+    def _set_mode(self, mode: str, reason: str) -> None:
+        # Callers hold the lock; on_change only flips a flag or an element property.
+        if mode == self.mode:
+            return
+        self.mode = mode
+        self._reference = None
+        if mode == MODE_ACTIVE:
+            self.wakeups += 1
+        logger.info(
+            "Inference for %s %s (%s)",
+            self.name,
+            "back to every frame" if mode == MODE_ACTIVE else f"down to every {self.idle_interval}th frame",
+            reason,
+        )
+        if self.on_change is not None:
+            self.on_change(mode)
+
+    def observe(self, frame: np.ndarray, inferred: bool) -> bool:
+        """Checks an idle camera's frame for motion; returns True if it woke the camera.
+
+        Motion is measured against the last inferred frame rather than the
+        previous one, so slow movement adds up between inferences.
+        """
+        if not self.idle or self.motion_threshold <= 0:
+            return False
+        small = self._small(frame)
+        with self._lock:
+            reference = self._reference
+            if reference is None or reference.shape != small.shape:
+                self._reference = small
+                return False
+            self.motion_score = float(np.mean(np.abs(small - reference)))
+            if inferred:
+                self._reference = small
+            if self.motion_score < self.motion_threshold:
+                return False
+            self._last_activity = time.monotonic()
+            self._set_mode(MODE_ACTIVE, f"motion {self.motion_score:.1f}")
+            return True
+
+    def should_infer(self) -> bool:
+        """For backends that pick frames themselves: whether to run the detector on this one."""
+        with self._lock:
+            if not self.idle:
+                return True
+            self._since_inference += 1
+            if self._since_inference >= self.idle_interval:
+                self._since_inference = 0
+                return True
+            return False
+
+    def update(self, person_count: Optional[int]) -> int:
+        """Records a detector result, or None for a frame that was not inferred; returns the count to use."""
+        now = time.monotonic()
+        with self._lock:
+            if person_count is None:
+                self.carried += 1
+                return self._last_count
+            self.inferences += 1
+            self._since_inference = 0
+            self._last_count = person_count
+            if person_count > 0:
+                self._last_activity = now
+                self._set_mode(MODE_ACTIVE, "person detected")
+            elif not self.idle and now - self._last_activity >= self.idle_seconds:
+                self._set_mode(MODE_IDLE, f"no activity for {self.idle_seconds:.0f} s")
+            return person_count
+
+    def inference_rate(self, window: float = 1.0) -> float:
+        """Detector runs per second, re-measured at most once per ``window`` seconds."""
+        now = time.monotonic()
+        then, previous = self._rate_mark
+        if now - then >= window:
+            self._rate = round((self.inferences - previous) / (now - then), 2)
+            self._rate_mark = (now, self.inferences)
+        return self._rate
+
+    def get_status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "interval": self.interval,
+            "inference_fps": self.inference_rate(),
+            "inferences": self.inferences,
+            "carried_frames": self.carried,
+            "motion_score": round(self.motion_score, 2),
+            "wakeups": self.wakeups,
+        }
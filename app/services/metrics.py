@@ -0,0 +1,225 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; spans a sub-millisecond probe up to a slow SD-card write.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """Monotonic counter. Increments are plain attribute updates to keep the hot path cheap."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (None if empty or beyond the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": _ms(self.quantile(0.5)),
+            "p95_ms": _ms(self.quantile(0.95)),
+        }
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value * 1000, 3)
+
+
+class _Family:
+    def __init__(self, name: str, kind: str, help_text: str) -> None:
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.children: Dict[LabelSet, object] = {}
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._families: Dict[str, _Family] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, LabelSet, float]]]] = []
+
+    def _child(self, name: str, kind: str, help_text: str, labels: dict, factory: Callable):
+        key: LabelSet = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(name, kind, help_text)
+            child = family.children.get(key)
+            if child is None:
+                child = family.children[key] = factory()
+            return child
+
+    def counter(self, name: str, help_text: str, **labels) -> Counter:
+        return self._child(name, "counter", help_text, labels, Counter)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._child(name, "histogram", help_text, labels, lambda: Histogram(buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, LabelSet, float]]]) -> None:
+        """``collector`` yields ``(name, kind, help, labels, value)`` for values read at scrape time."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister_collector(self, collector: Callable) -> None:
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def remove(self, **labels) -> None:
+        """Drop every child whose labels include ``labels`` (e.g. a removed camera)."""
+        wanted = {(k, str(v)) for k, v in labels.items()}
+        with self._lock:
+            for family in self._families.values():
+                for key in [key for key in family.children if wanted.issubset(key)]:
+                    del family.children[key]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            families = list(self._families.values())
+            collectors = list(self._collectors)
+
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for key, child in list(family.children.items()):
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_labels(key)} {child.value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(child.buckets, child.counts):
+                    cumulative += count
+                    lines.append(f"{family.name}_bucket{_labels(key + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{family.name}_bucket{_labels(key + (('le', '+Inf'),))} {child.count}")
+                lines.append(f"{family.name}_sum{_labels(key)} {child.sum}")
+                lines.append(f"{family.name}_count{_labels(key)} {child.count}")
+
+        collected: Dict[str, Tuple[str, str, List[str]]] = {}
+        for collector in collectors:
+            for name, kind, help_text, key, value in collector():
+                entry = collected.setdefault(name, (kind, help_text, []))
+                entry[2].append(f"{name}{_labels(key)} {value}")
+        for name, (kind, help_text, samples) in collected.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: LabelSet) -> str:
+    if not key:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in key)
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = MetricsRegistry()
+
+
+class CameraMetrics:
+    """Per-camera handles into the registry, created once so the hot path only touches attributes."""
+
+    def __init__(self, camera_id: str, registry: MetricsRegistry = REGISTRY) -> None:
+        self.camera_id = camera_id
+        self.registry = registry
+        self.frames_in = registry.counter("happylad_frames_total", "Frames seen by the detector probe", camera=camera_id)
+        self.probe_seconds = registry.histogram(
+            "happylad_probe_seconds", "Time spent in the per-frame probe", camera=camera_id
+        )
+        self.convert_seconds = registry.histogram(
+            "happylad_convert_seconds", "Time to convert a captured frame to BGR on the worker", camera=camera_id
+        )
+        self.encode_seconds = registry.histogram(
+            "happylad_preview_encode_seconds", "Preview JPEG resize and encode time", camera=camera_id
+        )
+        self.write_seconds = registry.histogram(
+            "happylad_sample_write_seconds", "Sample encode and disk write time", camera=camera_id
+        )
+        self.restarts = registry.counter(
+            "happylad_restarts_total", "Pipeline restarts by the watchdog", camera=camera_id
+        )
+        self._samples: Dict[str, Counter] = {}
+        self._stream_bytes: Dict[str, Counter] = {}
+        self._rate_mark = (time.monotonic(), 0)
+        self._fps = 0.0
+
+    def sample_saved(self, reason: str) -> None:
+        counter = self._samples.get(reason)
+        if counter is None:
+            counter = self._samples[reason] = self.registry.counter(
+                "happylad_samples_total",
+                "Samples written, by sampling reason; dropped, duplicate and failed count the ones that were not",
+                camera=self.camera_id,
+                reason=reason,
+            )
+        counter.inc()
+
+    def stream_counter(self, tier: str) -> Counter:
+        counter = self._stream_bytes.get(tier)
+        if counter is None:
+            counter = self._stream_bytes[tier] = self.registry.counter(
+                "happylad_stream_bytes_total", "MJPEG bytes sent to viewers", camera=self.camera_id, tier=tier
+            )
+        return counter
+
+    def frame_rate(self, window: float = 1.0) -> float:
+        """Frames per second, re-measured at most once per ``window`` seconds."""
+        now = time.monotonic()
+        then, previous = self._rate_mark
+        if now - then >= window:
+            frames = self.frames_in.value
+            self._fps = round((frames - previous) / (now - then), 2)
+            self._rate_mark = (now, frames)
+        return self._fps
+
+    def summary(self) -> dict:
+        return {
+            "fps": self.frame_rate(),
+            "frames": self.frames_in.value,
+            "samples": {reason: counter.value for reason, counter in self._samples.items()},
+            "stream_bytes": sum(counter.value for counter in self._stream_bytes.values()),
+            "probe": self.probe_seconds.summary(),
+            "convert": self.convert_seconds.summary(),
+            "preview_encode": self.encode_seconds.summary(),
+            "sample_write": self.write_seconds.summary(),
+        }
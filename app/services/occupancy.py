@@ -0,0 +1,223 @@
+import datetime
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESOLUTION_BUCKET = "bucket"
+RESOLUTION_HOUR = "hour"
+RESOLUTION_DAY = "day"
+RESOLUTION_HOUR_OF_DAY = "hour-of-day"
+RESOLUTION_DAY_OF_WEEK = "day-of-week"
+RESOLUTIONS = (RESOLUTION_BUCKET, RESOLUTION_HOUR, RESOLUTION_DAY, RESOLUTION_HOUR_OF_DAY, RESOLUTION_DAY_OF_WEEK)
+
+# One 20-byte record per bucket; ``bucket`` is the bucket's start divided by
+# the bucket size, so a ring slot still holding an older lap is recognisable.
+# Frame counts are 32-bit: 16 bits fill up after 36 minutes at 30 fps.
+BUCKET_DTYPE = np.dtype(
+    [
+        ("bucket", "<u4"),
+        ("frames", "<u4"),
+        ("occupied", "<u4"),
+        ("total", "<u4"),
+        ("max", "<u2"),
+        ("reserved", "<u2"),
+    ]
+)
+EPOCH = datetime.datetime(1970, 1, 1)
+# Buckets are flushed to the page cache as they close; msync every this many.
+SYNC_EVERY = 16
+
+
+def occupancy_filename(bucket_seconds: int) -> str:
+    return f".occupancy-{bucket_seconds}s.npy"
+
+
+class OccupancyStore:
+    """Per-camera person counts aggregated into fixed time buckets.
+
+    Each bucket keeps frames seen, frames with a person, the sum of counts
+    (for the mean) and the maximum. Buckets are a ring of ``retention_days``
+    worth of fixed-width records in a memory-mapped ``.npy`` file, so memory
+    and disk stay constant however long the camera runs. Queries only touch
+    the pages of the requested range.
+    """
+
+    def __init__(self, base_dir: str, bucket_seconds: int = 60, retention_days: float = 730.0) -> None:
+        self.bucket_seconds = max(1, int(bucket_seconds))
+        self.capacity = max(1, int(retention_days * 86400 / self.bucket_seconds))
+        self.path = os.path.join(base_dir, occupancy_filename(self.bucket_seconds))
+        self._lock = threading.Lock()
+        self._records = self._open()
+        self._bucket: Optional[int] = None
+        self._frames = 0
+        self._occupied = 0
+        self._total = 0
+        self._max = 0
+        self._unsynced = 0
+
+    def _open(self) -> np.memmap:
+        if os.path.exists(self.path):
+            try:
+                records = np.load(self.path, mmap_mode="r+")
+                if records.dtype == BUCKET_DTYPE and records.shape == (self.capacity,):
+                    return records
+                if records.dtype.names == BUCKET_DTYPE.names:
+                    # Another capacity, or the older 16-bit frame counts.
+                    return self._resize(records)
+                logger.warning("Occupancy file has an unknown layout, starting over: %s", self.path)
+            except (OSError, ValueError):
+                logger.warning("Occupancy file unreadable, starting over: %s", self.path)
+        return np.lib.format.open_memmap(self.path, mode="w+", dtype=BUCKET_DTYPE, shape=(self.capacity,))
+
+    def _resize(self, old: np.memmap) -> np.memmap:
+        logger.info(
+            "Resizing occupancy ring %s from %d to %d buckets (%d to %d bytes each)",
+            self.path,
+            len(old),
+            self.capacity,
+            old.dtype.itemsize,
+            BUCKET_DTYPE.itemsize,
+        )
+        kept = old[old["frames"] > 0]
+        kept = kept[np.argsort(kept["bucket"], kind="stable")][-self.capacity:].astype(BUCKET_DTYPE)
+        tmp_path = self.path + ".tmp.npy"
+        records = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=BUCKET_DTYPE, shape=(self.capacity,))
+        records[kept["bucket"] % self.capacity] = kept
+        records.flush()
+        del records, old
+        os.replace(tmp_path, self.path)
+        return np.load(self.path, mmap_mode="r+")
+
+    def record(self, person_count: int, now: Optional[float] = None) -> None:
+        """Adds one frame's count; called from the streaming thread, so it stays a few integer ops."""
+        bucket = int((time.time() if now is None else now) // self.bucket_seconds)
+        with self._lock:
+            if bucket != self._bucket:
+                self._flush()
+                self._bucket = bucket
+                self._frames = self._occupied = self._total = self._max = 0
+            if self._frames < 0xFFFFFFFF:
+                self._frames += 1
+                self._occupied += person_count > 0
+                self._total += person_count
+                self._max = max(self._max, person_count)
+
+    def _flush(self) -> None:
+        # Callers hold the lock. Writes the open bucket into its slot; a later
+        # flush of the same bucket overwrites it with the final values.
+        if self._bucket is None or not self._frames:
+            return
+        self._records[self._bucket % self.capacity] = (
+            self._bucket,
+            self._frames,
+            self._occupied,
+            min(self._total, 0xFFFFFFFF),
+            min(self._max, 0xFFFF),
+            0,
+        )
+        self._unsynced += 1
+        if self._unsynced >= SYNC_EVERY:
+            self._records.flush()
+            self._unsynced = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._records.flush()
+            self._bucket = None
+
+    def _select(self, start: float, end: float) -> np.ndarray:
+        """Copies of the records whose bucket starts in [start, end), read from at most two slices of the ring."""
+        first = int(start // self.bucket_seconds)
+        last = int(np.ceil(end / self.bucket_seconds)) - 1
+        first = max(first, last - self.capacity + 1)
+        if last < first:
+            return np.empty(0, dtype=BUCKET_DTYPE)
+        head, tail = first % self.capacity, last % self.capacity
+        if head <= tail:
+            chunk = np.array(self._records[head:tail + 1])
+        else:
+            chunk = np.concatenate((self._records[head:], self._records[:tail + 1]))
+        buckets = chunk["bucket"].astype(np.int64)
+        return chunk[(chunk["frames"] > 0) & (buckets >= first) & (buckets <= last)]
+
+    def query(self, start: float, end: float, resolution: str = RESOLUTION_HOUR) -> dict:
+        """Aggregates [start, end) by time (``bucket``/``hour``/``day``) or into a local-time heatmap."""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        with self._lock:
+            self._flush()
+            records = self._select(start, end)
+        seconds = records["bucket"].astype(np.int64) * self.bucket_seconds
+        local = seconds + _utc_offsets(seconds)
+
+        if resolution == RESOLUTION_HOUR_OF_DAY:
+            cells, shape = (local // 3600) % 24, (24,)
+        elif resolution == RESOLUTION_DAY_OF_WEEK:
+            # 1970-01-01 was a Thursday; rows are Monday..Sunday, columns hours.
+            cells, shape = ((local // 86400 + 3) % 7) * 24 + (local // 3600) % 24, (7, 24)
+        else:
+            step = {RESOLUTION_BUCKET: self.bucket_seconds, RESOLUTION_HOUR: 3600, RESOLUTION_DAY: 86400}[resolution]
+            step = max(step, self.bucket_seconds)
+            # Periods are aligned to local midnight/hours; keep only the ones with data.
+            periods, cells = np.unique(local // step, return_inverse=True)
+            shape = (len(periods),)
+
+        size = int(np.prod(shape))
+        buckets = np.bincount(cells, minlength=size)
+        frames = np.bincount(cells, weights=records["frames"], minlength=size)
+        occupied = np.bincount(cells, weights=records["occupied"], minlength=size)
+        total = np.bincount(cells, weights=records["total"], minlength=size)
+        peak = np.zeros(size, dtype=np.int64)
+        np.maximum.at(peak, cells, records["max"].astype(np.int64))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.round(total / frames, 3)
+            share = np.round(occupied / frames, 3)
+        empty = frames == 0
+
+        def cells_of(values: np.ndarray) -> list:
+            listed = np.where(empty, None, values.astype(object)).reshape(shape)
+            return listed.tolist()
+
+        result = {
+            "resolution": resolution,
+            "from": start,
+            "to": end,
+            "bucket_seconds": self.bucket_seconds,
+            "buckets": int(len(records)),
+            "mean": cells_of(mean),
+            "max": cells_of(peak),
+            "occupancy": cells_of(share),
+            "minutes": np.round(buckets * self.bucket_seconds / 60, 1).reshape(shape).tolist(),
+        }
+        if resolution not in (RESOLUTION_HOUR_OF_DAY, RESOLUTION_DAY_OF_WEEK):
+            # Local wall-clock start of each period.
+            result["time"] = [(EPOCH + datetime.timedelta(seconds=int(period) * step)).isoformat() for period in periods]
+        return result
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "bucket_seconds": self.bucket_seconds,
+                "capacity": self.capacity,
+                "file_bytes": self._records.nbytes,
+                "current_frames": self._frames,
+            }
+
+
+def _utc_offsets(seconds: np.ndarray) -> np.ndarray:
+    """Local UTC offset of each timestamp, looked up once per distinct hour (DST changes on the hour)."""
+    if not len(seconds):
+        return np.zeros(0, dtype=np.int64)
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    offsets: Dict[int, int] = {}
+    for hour in hours.tolist():
+        moment = datetime.datetime.fromtimestamp(hour * 3600).astimezone()
+        offsets[hour] = int(moment.utcoffset().total_seconds())
+    return np.array([offsets[hour] for hour in hours.tolist()], dtype=np.int64)[inverse]
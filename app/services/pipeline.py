@@ -1,27 +1,66 @@
-import datetime
 import logging
 import threading
 import time
-from typing import Optional
+from typing import List, Optional
 
 import gi
-import numpy as np
 import cv2
 
 import pyds
 from gi.repository import Gst, GLib
 
-from app.services.sampling import SamplingPolicy, SamplingState
+from app.services.camera import CameraPipeline
+from app.services.event_buffer import EventRecorder
+from app.services.frame_worker import DROP_OLDEST, FrameProcessor
+from app.services.gating import InferenceGate
+from app.services.metrics import CameraMetrics
+from app.services.occupancy import OccupancyStore
+from app.services.sampling import SamplingPolicy
+from app.services.snooze import SnoozePower
 from app.services.storage import Storage
 
-Gst.init(None)
-
 PGIE_CLASS_ID_PERSON = 2
 
 logger = logging.getLogger(__name__)
 
+_gst_lock = threading.Lock()
+_gst_ready = False
+
+
+def init_gstreamer() -> None:
+    """Runs Gst.init once, on first use rather than at import time."""
+    global _gst_ready
+    with _gst_lock:
+        if not _gst_ready:
+            Gst.init(None)
+            _gst_ready = True
+
+
+def _bus_failure(message) -> Optional[str]:
+    """Describes an ERROR or EOS bus message; None for anything else."""
+    if message.type == Gst.MessageType.EOS:
+        return "end of stream"
+    if message.type == Gst.MessageType.ERROR:
+        error, _debug = message.parse_error()
+        source = message.src.get_name() if message.src is not None else "pipeline"
+        return f"{source}: {error.message}"
+    return None
+
+
+# nvinfer's largest interval; effectively no inference at all.
+PAUSED_INTERVAL = 2147483647
+
+
+def _set_interval(pgie, every: int) -> bool:
+    """Makes nvinfer run on every ``every``-th batch; returns False so GLib.idle_add runs it once."""
+    pgie.set_property("interval", max(0, every - 1))
+    return False
+
+
+class DeepStreamPipeline(CameraPipeline):
+    backend = "deepstream"
+    frame_conversion = cv2.COLOR_RGBA2BGR
 
-class DeepStreamPipeline:
     def __init__(
         self,
         camera_id: str,
@@ -34,101 +73,99 @@ class DeepStreamPipeline:
         sampling_policy: SamplingPolicy,
         storage: Storage,
         recent_samples_limit: int,
+        frame_processor: FrameProcessor,
+        preview_fps: float = 10.0,
+        frame_queue_size: int = 4,
+        drop_policy: str = DROP_OLDEST,
+        group: Optional["DeepStreamGroup"] = None,
+        metrics: Optional[CameraMetrics] = None,
+        log_summary_seconds: float = 10.0,
+        event_recorder: Optional[EventRecorder] = None,
+        inference_gate: Optional[InferenceGate] = None,
+        snooze_power: Optional[SnoozePower] = None,
+        occupancy: Optional[OccupancyStore] = None,
     ) -> None:
-        self.camera_id = camera_id
-        self.camera_name = camera_name
+        super().__init__(
+            camera_id=camera_id,
+            camera_name=camera_name,
+            sampling_policy=sampling_policy,
+            storage=storage,
+            recent_samples_limit=recent_samples_limit,
+            frame_processor=frame_processor,
+            preview_fps=preview_fps,
+            frame_queue_size=frame_queue_size,
+            drop_policy=drop_policy,
+            metrics=metrics,
+            log_summary_seconds=log_summary_seconds,
+            frame_size=(width, height),
+            event_recorder=event_recorder,
+            inference_gate=inference_gate,
+            snooze_power=snooze_power,
+            occupancy=occupancy,
+        )
         self.device = device
         self.width = width
         self.height = height
         self.fps = fps
         self.model_config = model_config
-        self.sampling_policy = sampling_policy
-        self.storage = storage
-        self.recent_samples_limit = recent_samples_limit
-        self.sampling_state = SamplingState(
-            last_sample_time=datetime.datetime.now().replace(
-                hour=12, minute=0, second=0, microsecond=0
-            )
-        )
-
-        self.pipeline = self._build_pipeline()
+        self.group = group
+        init_gstreamer()
+
+        # Grouped cameras share the group's muxer, nvinfer and main loop.
+        self.pgie = None
+        self.pipeline = self._build_pipeline() if group is None else None
+        if inference_gate is not None:
+            inference_gate.on_change = lambda _mode: self.apply_power()
         self.loop: Optional[GLib.MainLoop] = None
         self.thread: Optional[threading.Thread] = None
 
-        self._latest_jpeg: Optional[bytes] = None
-        self._jpeg_lock = threading.Lock()
-        self._status_lock = threading.Lock()
-        self._last_frame_time: Optional[datetime.datetime] = None
-        self._running = False
-        self._snooze_until: Optional[datetime.datetime] = None
-
-    def _build_pipeline(self) -> Gst.Pipeline:
-        pipeline = Gst.Pipeline()
-
-        source = Gst.ElementFactory.make("v4l2src", f"source-{self.camera_id}")
-        caps_filter = Gst.ElementFactory.make("capsfilter", f"caps-{self.camera_id}")
-        jpegdec = Gst.ElementFactory.make("jpegdec", f"jpegdec-{self.camera_id}")
-        vidconv = Gst.ElementFactory.make("videoconvert", f"videoconvert-{self.camera_id}")
-        nvvidconv = Gst.ElementFactory.make("nvvideoconvert", f"nvvidconv-{self.camera_id}")
-        streammux = Gst.ElementFactory.make("nvstreammux", f"streammux-{self.camera_id}")
-        pgie = Gst.ElementFactory.make("nvinfer", f"primary-{self.camera_id}")
-        nvvidconv_osd = Gst.ElementFactory.make("nvvideoconvert", f"osd-convert-{self.camera_id}")
-        caps_filter2 = Gst.ElementFactory.make("capsfilter", f"caps2-{self.camera_id}")
-        nvosd = Gst.ElementFactory.make("nvdsosd", f"nvosd-{self.camera_id}")
-        fakesink = Gst.ElementFactory.make("fakesink", f"sink-{self.camera_id}")
-
-        if not all([
-            source,
-            caps_filter,
-            jpegdec,
-            vidconv,
-            nvvidconv,
-            streammux,
-            pgie,
-            nvvidconv_osd,
-            caps_filter2,
-            nvosd,
-            fakesink,
-        ]):
+    def _make_elements(self, *specs):
+        elements = [Gst.ElementFactory.make(factory, f"{name}-{self.camera_id}") for factory, name in specs]
+        if not all(elements):
             raise RuntimeError("Failed to create GStreamer elements")
+        return elements
+
+    def build_source(self, pipeline: Gst.Pipeline, streammux, index: int) -> None:
+        source, caps_filter, jpegdec, vidconv, nvvidconv = self._make_elements(
+            ("v4l2src", "source"),
+            ("capsfilter", "caps"),
+            ("jpegdec", "jpegdec"),
+            ("videoconvert", "videoconvert"),
+            ("nvvideoconvert", "nvvidconv"),
+        )
 
         source.set_property("device", self.device)
         caps = Gst.Caps.from_string(
             f"image/jpeg, width={self.width}, height={self.height}, framerate={self.fps}/1"
         )
         caps_filter.set_property("caps", caps)
-        caps_filter2.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM),format=RGBA"))
-        fakesink.set_property("sync", False)
-
-        streammux.set_property("width", self.width)
-        streammux.set_property("height", self.height)
-        streammux.set_property("batch-size", 1)
-        streammux.set_property("batched-push-timeout", 4000000)
-        pgie.set_property("config-file-path", self.model_config)
-
-        pipeline.add(source)
-        pipeline.add(caps_filter)
-        pipeline.add(jpegdec)
-        pipeline.add(vidconv)
-        pipeline.add(nvvidconv)
-        pipeline.add(streammux)
-        pipeline.add(pgie)
-        pipeline.add(nvvidconv_osd)
-        pipeline.add(caps_filter2)
-        pipeline.add(nvosd)
-        pipeline.add(fakesink)
 
+        for element in (source, caps_filter, jpegdec, vidconv, nvvidconv):
+            pipeline.add(element)
         source.link(caps_filter)
         caps_filter.link(jpegdec)
+        # Valve for the snooze power profile: dropped JPEGs are never decoded, converted or inferred.
+        caps_filter.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._valve_probe)
         jpegdec.link(vidconv)
         vidconv.link(nvvidconv)
 
-        sinkpad = streammux.get_request_pad("sink_0")
+        sinkpad = streammux.get_request_pad(f"sink_{index}")
         srcpad = nvvidconv.get_static_pad("src")
         srcpad.link(sinkpad)
 
-        streammux.link(pgie)
-        pgie.link(nvvidconv_osd)
+    def build_output(self, pipeline: Gst.Pipeline, upstream_pad) -> None:
+        nvvidconv_osd, caps_filter2, nvosd, fakesink = self._make_elements(
+            ("nvvideoconvert", "osd-convert"),
+            ("capsfilter", "caps2"),
+            ("nvdsosd", "nvosd"),
+            ("fakesink", "sink"),
+        )
+        caps_filter2.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM),format=RGBA"))
+        fakesink.set_property("sync", False)
+
+        for element in (nvvidconv_osd, caps_filter2, nvosd, fakesink):
+            pipeline.add(element)
+        upstream_pad.link(nvvidconv_osd.get_static_pad("sink"))
         nvvidconv_osd.link(caps_filter2)
         caps_filter2.link(nvosd)
         nvosd.link(fakesink)
@@ -136,22 +173,45 @@ class DeepStreamPipeline:
         osd_sink_pad = nvosd.get_static_pad("sink")
         osd_sink_pad.add_probe(Gst.PadProbeType.BUFFER, self._osd_buffer_probe)
 
+    def _build_pipeline(self) -> Gst.Pipeline:
+        pipeline = Gst.Pipeline()
+        streammux, pgie = self._make_elements(("nvstreammux", "streammux"), ("nvinfer", "primary"))
+
+        streammux.set_property("width", self.width)
+        streammux.set_property("height", self.height)
+        streammux.set_property("batch-size", 1)
+        streammux.set_property("batched-push-timeout", 4000000)
+        pgie.set_property("config-file-path", self.model_config)
+        self.pgie = pgie
+
+        pipeline.add(streammux)
+        pipeline.add(pgie)
+        self.build_source(pipeline, streammux, 0)
+        streammux.link(pgie)
+        self.build_output(pipeline, pgie.get_static_pad("src"))
         return pipeline
 
     def _osd_buffer_probe(self, pad, info):
         gst_buffer = info.get_buffer()
-        if not gst_buffer:
+        if not gst_buffer or not self._running:
             return Gst.PadProbeReturn.OK
 
         batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
         l_frame = batch_meta.frame_meta_list
 
         while l_frame is not None:
+            started = time.perf_counter()
             try:
                 frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
             except StopIteration:
                 break
 
+            # With a non-zero nvinfer interval, skipped frames carry no objects.
+            inferred = bool(frame_meta.bInferDone)
+            gate = self.inference_gate
+            if gate is not None and gate.idle:
+                gate.observe(pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id), inferred)
+
             person_count = 0
             l_obj = frame_meta.obj_meta_list
             while l_obj is not None:
@@ -166,46 +226,11 @@ class DeepStreamPipeline:
                 except StopIteration:
                     break
 
-            frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
-            frame_copy = np.array(frame, copy=True, order="C")
-            frame_copy = cv2.cvtColor(frame_copy, cv2.COLOR_RGBA2BGR)
-
-            timestamp = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())
-            cv2.putText(
-                frame_copy,
-                timestamp,
-                (10, 30),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                1,
-                (255, 255, 255),
-                2,
-                cv2.LINE_AA,
+            snoozing = self.handle_detection(
+                person_count if inferred else None,
+                lambda: pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id),
             )
 
-            snoozing = self.is_snoozing()
-            if snoozing:
-                self.sampling_state.force_snapshot = False
-                should_sample = False
-            else:
-                should_sample = self.sampling_policy.should_sample(
-                    self.sampling_state,
-                    person_count=person_count,
-                )
-
-            if should_sample:
-                self.storage.save_sample(frame_copy, self.camera_name)
-
-            if self._last_frame_time is None:
-                logger.info("First frame received: %s", self.camera_id)
-
-            ret, jpeg = cv2.imencode(".jpg", frame_copy, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-            if ret:
-                with self._jpeg_lock:
-                    self._latest_jpeg = jpeg.tobytes()
-
-            with self._status_lock:
-                self._last_frame_time = datetime.datetime.now()
-
             display_meta = pyds.nvds_acquire_display_meta_from_pool(batch_meta)
             display_meta.num_labels = 1
             text_params = display_meta.text_params[0]
@@ -222,6 +247,7 @@ class DeepStreamPipeline:
             text_params.set_bg_clr = 1
             text_params.text_bg_clr.set(0.0, 0.0, 0.0, 1.0)
             pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
+            self.metrics.probe_seconds.observe(time.perf_counter() - started)
 
             try:
                 l_frame = l_frame.next
@@ -230,11 +256,31 @@ class DeepStreamPipeline:
 
         return Gst.PadProbeReturn.OK
 
+    def _valve_probe(self, pad, info):
+        return Gst.PadProbeReturn.OK if self.admit_frame() else Gst.PadProbeReturn.DROP
+
+    @property
+    def inference_interval(self) -> int:
+        if self.inference_paused:
+            return PAUSED_INTERVAL
+        return self.inference_gate.interval if self.inference_gate is not None else 1
+
+    def apply_power(self) -> None:
+        # Called from the streaming or timer thread; the element is reconfigured from the main loop.
+        if self.group is not None:
+            GLib.idle_add(self.group.apply_interval)
+        elif self.pgie is not None:
+            GLib.idle_add(_set_interval, self.pgie, self.inference_interval)
+
     def start(self) -> None:
         if self._running:
             return
 
         self._running = True
+        if self.group is not None:
+            logger.info("Enabling %s in shared pipeline", self.camera_id)
+            self.group.start()
+            return
         logger.info("Starting pipeline for %s (%s)", self.camera_id, self.device)
         self.loop = GLib.MainLoop()
         bus = self.pipeline.get_bus()
@@ -250,69 +296,138 @@ class DeepStreamPipeline:
             return
 
         self._running = False
+        if self.group is not None:
+            # The shared pipeline keeps running for the other cameras; this
+            # camera's frames are ignored by its probe from now on.
+            logger.info("Disabling %s in shared pipeline", self.camera_id)
+            return
         logger.info("Stopping pipeline for %s", self.camera_id)
         if self.loop is not None:
             self.loop.quit()
         self.pipeline.set_state(Gst.State.NULL)
 
     def _bus_call(self, bus, message):
-        t = message.type
-        if t == Gst.MessageType.EOS:
-            logger.warning("Pipeline EOS: %s", self.camera_id)
+        reason = _bus_failure(message)
+        if reason is not None:
+            self.mark_failed(reason)
             if self.loop is not None:
                 self.loop.quit()
-        elif t == Gst.MessageType.ERROR:
-            logger.error("Pipeline error: %s", self.camera_id)
+
+    def get_source_status(self) -> dict:
+        status = {"device": self.device}
+        if self.group is not None:
+            status["shared_inference"] = self.group.get_status()
+        return status
+
+
+class DeepStreamGroup:
+    """One nvstreammux/nvinfer at batch-size N feeding per-camera branches via nvstreamdemux."""
+
+    def __init__(self, name: str = "shared", batch_timeout_ms: float = 40.0) -> None:
+        init_gstreamer()
+        self.name = name
+        self.batch_timeout_ms = max(1.0, batch_timeout_ms)
+        self.cameras: List[DeepStreamPipeline] = []
+        self.pipeline: Optional[Gst.Pipeline] = None
+        self.pgie = None
+        self.loop: Optional[GLib.MainLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._running = False
+
+    def add(self, camera: DeepStreamPipeline) -> None:
+        if self.pipeline is not None:
+            raise RuntimeError("Cannot add cameras after the shared pipeline is built")
+        self.cameras.append(camera)
+
+    def _build_pipeline(self) -> Gst.Pipeline:
+        if not self.cameras:
+            raise RuntimeError("Shared pipeline has no cameras")
+        model_configs = {camera.model_config for camera in self.cameras}
+        if len(model_configs) > 1:
+            logger.warning("Shared pipeline uses %s; ignoring %s", self.cameras[0].model_config, model_configs)
+
+        pipeline = Gst.Pipeline()
+        streammux = Gst.ElementFactory.make("nvstreammux", f"streammux-{self.name}")
+        pgie = Gst.ElementFactory.make("nvinfer", f"primary-{self.name}")
+        demux = Gst.ElementFactory.make("nvstreamdemux", f"demux-{self.name}")
+        if not all([streammux, pgie, demux]):
+            raise RuntimeError("Failed to create GStreamer elements")
+
+        batch_size = len(self.cameras)
+        streammux.set_property("width", max(camera.width for camera in self.cameras))
+        streammux.set_property("height", max(camera.height for camera in self.cameras))
+        streammux.set_property("batch-size", batch_size)
+        streammux.set_property("batched-push-timeout", int(self.batch_timeout_ms * 1000))
+        streammux.set_property("live-source", 1)
+        pgie.set_property("config-file-path", self.cameras[0].model_config)
+        # Overrides batch-size in the nvinfer config; TensorRT rebuilds the
+        # engine for this batch size if the configured one does not match.
+        pgie.set_property("batch-size", batch_size)
+
+        self.pgie = pgie
+
+        pipeline.add(streammux)
+        pipeline.add(pgie)
+        pipeline.add(demux)
+        for index, camera in enumerate(self.cameras):
+            camera.build_source(pipeline, streammux, index)
+        streammux.link(pgie)
+        pgie.link(demux)
+        for index, camera in enumerate(self.cameras):
+            camera.build_output(pipeline, demux.get_request_pad(f"src_{index}"))
+        return pipeline
+
+    def start(self) -> None:
+        with self._lock:
+            if self._running:
+                return
+            if self.pipeline is None:
+                self.pipeline = self._build_pipeline()
+            self._running = True
+
+        logger.info("Starting shared pipeline %s (batch-size %d)", self.name, len(self.cameras))
+        self.loop = GLib.MainLoop()
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self._bus_call)
+
+        self.pipeline.set_state(Gst.State.PLAYING)
+        self.thread = threading.Thread(target=self.loop.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+
+        for camera in self.cameras:
+            camera.stop()
+        logger.info("Stopping shared pipeline %s", self.name)
+        if self.loop is not None:
+            self.loop.quit()
+        self.pipeline.set_state(Gst.State.NULL)
+
+    def _bus_call(self, bus, message):
+        reason = _bus_failure(message)
+        if reason is not None:
+            logger.error("Shared pipeline %s failed: %s", self.name, reason)
+            # One bus for the whole batch: every camera in it is down.
+            for camera in self.cameras:
+                camera.mark_failed(reason)
             if self.loop is not None:
                 self.loop.quit()
 
-    def force_snapshot(self) -> None:
-        logger.info("Force snapshot requested for %s", self.camera_id)
-        self.sampling_state.force_snapshot = True
-
-    def add_snooze(self, minutes: int = 10) -> datetime.datetime:
-        now = datetime.datetime.now()
-        with self._status_lock:
-            base_time = self._snooze_until if self._snooze_until and self._snooze_until > now else now
-            self._snooze_until = base_time + datetime.timedelta(minutes=max(0, minutes))
-            return self._snooze_until
-
-    def cancel_snooze(self) -> None:
-        with self._status_lock:
-            self._snooze_until = None
-
-    def is_snoozing(self) -> bool:
-        with self._status_lock:
-            if self._snooze_until is None:
-                return False
-            if self._snooze_until <= datetime.datetime.now():
-                self._snooze_until = None
-                return False
-            return True
-
-    def get_latest_jpeg(self) -> Optional[bytes]:
-        with self._jpeg_lock:
-            return self._latest_jpeg
+    def apply_interval(self) -> bool:
+        """One nvinfer serves the whole batch, so it only slows down once every camera is idle or paused."""
+        if self.pgie is not None:
+            _set_interval(self.pgie, min(camera.inference_interval for camera in self.cameras))
+        return False
 
     def get_status(self) -> dict:
-        with self._status_lock:
-            last_frame = self._last_frame_time
-            snooze_until = self._snooze_until
-        now = datetime.datetime.now()
-        snoozing = bool(snooze_until and snooze_until > now)
-        remaining_seconds = int((snooze_until - now).total_seconds()) if snoozing else 0
         return {
-            "camera_id": self.camera_id,
-            "camera_name": self.camera_name,
-            "device": self.device,
+            "group": self.name,
+            "batch_size": len(self.cameras),
             "running": self._running,
-            "last_frame_time": last_frame.isoformat() if last_frame else None,
-            "recent_samples_limit": self.recent_samples_limit,
-            "sampling": {
-                "time_span_years": self.sampling_policy.time_span_years,
-                "cooldown_hours": self.sampling_policy.cooldown_seconds / 3600,
-            },
-            "snoozing": snoozing,
-            "snooze_until": snooze_until.isoformat() if snoozing else None,
-            "snooze_remaining_seconds": remaining_seconds,
         }
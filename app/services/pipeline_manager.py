@@ -1,46 +1,539 @@
-from typing import Dict
+import dataclasses
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
 
-from app.config import AppConfig
-from app.services.pipeline import DeepStreamPipeline
+from app.config import AppConfig, CameraConfig
+from app.services.camera import CameraPipeline
+from app.services.event_buffer import EventRecorder
+from app.services.events import EventHub
+from app.services.frame_worker import FrameProcessor
+from app.services.gating import InferenceGate
+from app.services.occupancy import OccupancyStore
+from app.services.snooze import SnoozePower
+from app.services.metrics import REGISTRY, CameraMetrics
+from app.services.preview import MOSAIC_ID, MosaicPublisher
 from app.services.sampling import SamplingPolicy
 from app.services.storage import Storage
+from app.services.watchdog import Watchdog
+
+logger = logging.getLogger(__name__)
+
+# Camera settings that are applied to a running pipeline; any other change rebuilds it.
+LIVE_FIELDS = ("name", "sampling", "recent_samples_limit", "preview_fps", "stall_seconds", "snooze")
+
+STATE_STARTING = "starting"
+STATE_RUNNING = "running"
+STATE_FAILED = "failed"
+STATE_STOPPED = "stopped"
+
+
+@dataclass
+class CameraStartup:
+    requested_at: float
+    state: str = STATE_STARTING
+    error: Optional[str] = None
+    build_seconds: Optional[float] = None
+    start_seconds: Optional[float] = None
+
+    def to_dict(self, pipeline: Optional[CameraPipeline]) -> dict:
+        first_frame_at = pipeline.first_frame_at if pipeline is not None else None
+        return {
+            "state": self.state,
+            "error": self.error,
+            "build_seconds": _round(self.build_seconds),
+            "start_seconds": _round(self.start_seconds),
+            # From the start request, so it includes waiting for a startup worker.
+            "first_frame_seconds": _round(first_frame_at - self.requested_at) if first_frame_at else None,
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def _snooze_power(camera: CameraConfig) -> Optional[SnoozePower]:
+    snooze = camera.snooze
+    if snooze.profile != "low-power":
+        return None
+    return SnoozePower(fps=snooze.fps, pause_inference=snooze.pause_inference, preview_fps=snooze.preview_fps)
 
 
 class PipelineManager:
     def __init__(self, config: AppConfig) -> None:
         self.config = config
-        self.pipelines: Dict[str, DeepStreamPipeline] = {}
+        # Replaced, never mutated, so readers can iterate it without a lock.
+        self.pipelines: Dict[str, CameraPipeline] = {}
+        self._metrics: Dict[str, CameraMetrics] = {}
+        self.startup: Dict[str, CameraStartup] = {}
+        # Torn-down pipelines whose rebuild failed; the next rebuild still inherits their state.
+        self._orphans: Dict[str, CameraPipeline] = {}
+        self._reconfigure_lock = threading.Lock()
+        self._pipelines_lock = threading.Lock()
+        # Guards lazy creation of the shared inference coordinators during parallel builds.
+        self._shared_lock = threading.Lock()
+        self._started = False
+        self.frame_processor = FrameProcessor(max_workers=config.frame_workers)
+        # Shared-inference coordinators, created on first use when inference.shared is set.
+        self.deepstream_group = None
+        self.batched_inference = None
+        self.mosaic = MosaicPublisher(
+            sources=lambda: [
+                (pipeline.camera_name, pipeline.preview) for pipeline in self.pipelines.values()
+            ],
+            max_fps=config.mosaic_fps,
+            metrics=CameraMetrics(MOSAIC_ID),
+        )
+        self.events = EventHub(self.list_status)
+        self.watchdog = Watchdog(
+            camera_ids=lambda: [camera.id for camera in self.config.cameras],
+            check=self._check_camera,
+            restart=self.restart_cameras,
+            interval_seconds=config.watchdog.interval_seconds,
+            backoff_seconds=config.watchdog.backoff_seconds,
+            max_backoff_seconds=config.watchdog.max_backoff_seconds,
+        )
+
+    def _build_camera(self, camera: CameraConfig) -> CameraPipeline:
+        sampling_policy = SamplingPolicy(
+            time_span_years=camera.sampling.time_span_years,
+            cooldown_hours=camera.sampling.cooldown_hours,
+        )
+        metrics = self._metrics.get(camera.id)
+        if metrics is None:
+            metrics = self._metrics[camera.id] = CameraMetrics(camera.id)
+        storage = Storage(
+            camera.storage_dir,
+            queue_size=camera.storage.queue_size,
+            fsync_seconds=camera.storage.fsync_seconds,
+            jpeg_quality=camera.storage.jpeg_quality,
+            max_bytes=camera.storage.max_bytes,
+            max_files=camera.storage.max_files,
+            max_age_days=camera.storage.max_age_days,
+            thin_after_days=camera.storage.thin_after_days,
+            retention_interval_seconds=camera.storage.retention_interval_seconds,
+            thumb_width=camera.storage.thumb_width,
+            thumb_cache_bytes=camera.storage.thumb_cache_bytes,
+            metrics=metrics,
+            on_saved=lambda record, camera_id=camera.id: self.events.publish_sample(camera_id, record),
+            dedup_mode=camera.dedup.mode if camera.dedup.enabled else None,
+            dedup_distance=camera.dedup.max_distance,
+            dedup_window=camera.dedup.window,
+        )
+        return self._create_pipeline(camera, sampling_policy, storage, metrics)
+
+    def _create_pipeline(
+        self,
+        camera: CameraConfig,
+        sampling_policy: SamplingPolicy,
+        storage: Storage,
+        metrics: CameraMetrics,
+    ) -> CameraPipeline:
+        common = dict(
+            camera_id=camera.id,
+            camera_name=camera.name,
+            width=camera.width,
+            height=camera.height,
+            fps=camera.fps,
+            sampling_policy=sampling_policy,
+            storage=storage,
+            recent_samples_limit=camera.recent_samples_limit,
+            frame_processor=self.frame_processor,
+            preview_fps=camera.preview_fps,
+            frame_queue_size=camera.processing.queue_size,
+            drop_policy=camera.processing.drop_policy,
+            metrics=metrics,
+            log_summary_seconds=self.config.logging.summary_seconds,
+            event_recorder=self._create_event_recorder(camera, storage),
+            inference_gate=self._create_inference_gate(camera),
+            snooze_power=_snooze_power(camera),
+            occupancy=self._create_occupancy(camera),
+        )
+        shared = self.config.inference.shared
+        if camera.backend == "replay":
+            from app.services.replay import ReplayPipeline, make_detector
+
+            replay = camera.replay
+            detector = make_detector(
+                replay.detector,
+                replay.persons,
+                replay.hold_seconds,
+                interval=replay.detect_interval,
+                seed=replay.seed,
+            )
+            with self._shared_lock:
+                inference = self._get_batched_inference(camera.id, detector) if shared else None
+            return ReplayPipeline(
+                source=replay.source,
+                loop=replay.loop,
+                detector=detector,
+                inference=inference,
+                **common,
+            )
+
+        # Imported lazily so replay-only setups do not need pyds/GStreamer.
+        from app.services.pipeline import DeepStreamGroup, DeepStreamPipeline
+
+        with self._shared_lock:
+            if shared and self.deepstream_group is None:
+                self.deepstream_group = DeepStreamGroup(batch_timeout_ms=self.config.inference.batch_timeout_ms)
+            group = self.deepstream_group if shared else None
+        pipeline = DeepStreamPipeline(
+            device=camera.device,
+            model_config=camera.model_config,
+            group=group,
+            **common,
+        )
+        if group is not None:
+            with self._shared_lock:
+                group.add(pipeline)
+        return pipeline
+
+    def _create_event_recorder(self, camera: CameraConfig, storage: Storage) -> Optional[EventRecorder]:
+        capture = camera.capture
+        if capture.buffer_seconds <= 0:
+            return None
+        return EventRecorder(
+            storage,
+            mode=capture.mode,
+            buffer_seconds=capture.buffer_seconds,
+            buffer_fps=capture.buffer_fps,
+            buffer_bytes=capture.buffer_bytes,
+            before_seconds=capture.before_seconds,
+            after_seconds=capture.after_seconds,
+            jpeg_quality=camera.storage.jpeg_quality,
+        )
+
+    def _create_occupancy(self, camera: CameraConfig) -> Optional[OccupancyStore]:
+        occupancy = camera.occupancy
+        if not occupancy.enabled:
+            return None
+        return OccupancyStore(
+            camera.storage_dir,
+            bucket_seconds=occupancy.bucket_seconds,
+            retention_days=occupancy.retention_days,
+        )
 
-        for camera in config.cameras:
-            sampling_policy = SamplingPolicy(
-                time_span_years=camera.sampling.time_span_years,
-                cooldown_hours=camera.sampling.cooldown_hours,
+    def _create_inference_gate(self, camera: CameraConfig) -> Optional[InferenceGate]:
+        gating = camera.gating
+        if not gating.enabled:
+            return None
+        return InferenceGate(
+            camera.id,
+            idle_seconds=gating.idle_seconds,
+            idle_interval=gating.idle_interval,
+            motion_threshold=gating.motion_threshold,
+            motion_width=gating.motion_width,
+        )
+
+    def _get_batched_inference(self, camera_id: str, detector):
+        from app.services.batch import (
+            DETECTOR_PER_CAMERA,
+            DETECTOR_RESNET10,
+            BatchedInference,
+            PerSourceDetector,
+            Resnet10Detector,
+        )
+
+        inference_config = self.config.inference
+        if self.batched_inference is None:
+            if inference_config.detector == DETECTOR_RESNET10:
+                batch_detector = Resnet10Detector(
+                    inference_config.proto_file,
+                    inference_config.model_file,
+                    threshold=inference_config.threshold,
+                )
+            elif inference_config.detector == DETECTOR_PER_CAMERA:
+                batch_detector = PerSourceDetector()
+            else:
+                raise ValueError(f"Unknown shared detector: {inference_config.detector}")
+            self.batched_inference = BatchedInference(
+                batch_detector,
+                batch_timeout_ms=inference_config.batch_timeout_ms,
             )
-            storage = Storage(camera.storage_dir)
-            pipeline = DeepStreamPipeline(
-                camera_id=camera.id,
-                camera_name=camera.name,
-                device=camera.device,
-                width=camera.width,
-                height=camera.height,
-                fps=camera.fps,
-                model_config=camera.model_config,
-                sampling_policy=sampling_policy,
-                storage=storage,
-                recent_samples_limit=camera.recent_samples_limit,
+            self.batched_inference.start()
+        if isinstance(self.batched_inference.detector, PerSourceDetector):
+            self.batched_inference.detector.register(camera_id, detector)
+        return self.batched_inference
+
+    def _teardown_camera(self, pipeline: CameraPipeline) -> None:
+        pipeline.stop()
+        if pipeline.event_recorder is not None:
+            pipeline.event_recorder.close()
+        pipeline.close()
+        pipeline.storage.close()
+        detector = getattr(self.batched_inference, "detector", None)
+        if hasattr(detector, "unregister"):
+            detector.unregister(pipeline.camera_id)
+
+    def apply_config(self, old: AppConfig, new: AppConfig) -> None:
+        """Bring the running cameras in line with ``new``, touching only the ones that changed."""
+        with self._reconfigure_lock:
+            for field in dataclasses.fields(AppConfig):
+                if field.name != "cameras" and getattr(self.config, field.name) != getattr(new, field.name):
+                    logger.warning("Config change to %s takes effect after a restart", field.name)
+            if not self._started:
+                # Nothing is built before start_all, which will use the new cameras.
+                self.config = dataclasses.replace(self.config, cameras=new.cameras)
+                return
+
+            current = {camera.id: camera for camera in self.config.cameras}
+            wanted = {camera.id: camera for camera in new.cameras}
+            removed = current.keys() - wanted.keys()
+            rebuilt: Set[str] = set()
+            for camera in new.cameras:
+                previous = current.get(camera.id)
+                if previous is None or previous == camera:
+                    continue
+                pipeline = self.pipelines.get(camera.id)
+                if (
+                    pipeline is not None
+                    and dataclasses.replace(previous, **{name: getattr(camera, name) for name in LIVE_FIELDS}) == camera
+                ):
+                    self._apply_live(pipeline, camera)
+                else:
+                    # Also retries cameras that failed to start.
+                    rebuilt.add(camera.id)
+            added = wanted.keys() - current.keys()
+            self.config = dataclasses.replace(self.config, cameras=new.cameras)
+            if not (removed or rebuilt or added):
+                return
+
+            if self.config.inference.shared and self.deepstream_group is not None:
+                changed = removed | rebuilt | added
+                if any(
+                    camera.backend == "deepstream"
+                    for camera in list(current.values()) + list(wanted.values())
+                    if camera.id in changed
+                ):
+                    rebuilt |= self._release_group() - added
+
+            for camera_id in removed:
+                logger.info("Removing camera %s", camera_id)
+                pipeline = self._unpublish(camera_id)
+                self.startup.pop(camera_id, None)
+                self._orphans.pop(camera_id, None)
+                if pipeline is not None:
+                    self._teardown_camera(pipeline)
+                self._metrics.pop(camera_id, None)
+                REGISTRY.remove(camera=camera_id)
+            for camera_id in added:
+                logger.info("Adding camera %s", camera_id)
+            self._rebuild(rebuilt | added)
+
+    def restart_cameras(self, camera_ids: Set[str]) -> None:
+        """Tears down and rebuilds ``camera_ids`` in place, keeping sampling history, snooze and viewers."""
+        with self._reconfigure_lock:
+            if not self._started:
+                return
+            camera_ids = set(camera_ids) & {camera.id for camera in self.config.cameras}
+            if self.deepstream_group is not None and any(
+                getattr(self.pipelines.get(camera_id), "group", None) is not None for camera_id in camera_ids
+            ):
+                camera_ids |= self._release_group()
+            for camera_id in camera_ids:
+                if camera_id in self._metrics:
+                    self._metrics[camera_id].restarts.inc()
+            self._rebuild(camera_ids)
+
+    def _release_group(self) -> Set[str]:
+        """Stops the shared DeepStream pipeline; returns the cameras that have to be rebuilt with it."""
+        # nvstreammux's batch is fixed once built, so every grouped camera is rebuilt.
+        logger.warning("Rebuilding the shared DeepStream pipeline")
+        self.deepstream_group.stop()
+        self.deepstream_group = None
+        return {camera.id for camera in self.config.cameras if camera.backend == "deepstream"}
+
+    def _rebuild(self, camera_ids: Set[str]) -> None:
+        """Replaces the pipelines of ``camera_ids``, or builds them if they have none yet."""
+        previous: Dict[str, CameraPipeline] = {}
+        for camera_id in camera_ids:
+            pipeline = self.pipelines.get(camera_id)
+            if pipeline is not None:
+                logger.info("Rebuilding camera %s", camera_id)
+                self._teardown_camera(pipeline)
+                previous[camera_id] = pipeline
+            elif camera_id in self._orphans:
+                previous[camera_id] = self._orphans.pop(camera_id)
+        self._start_cameras([camera for camera in self.config.cameras if camera.id in camera_ids], previous)
+
+    def _check_camera(self, camera_id: str, now: float) -> Optional[str]:
+        """Why the watchdog should restart ``camera_id``, or None if it is healthy or still starting."""
+        record = self.startup.get(camera_id)
+        if record is None or record.state == STATE_STARTING:
+            return None
+        if record.state == STATE_FAILED:
+            return f"failed to start: {record.error}"
+        pipeline = self.pipelines.get(camera_id)
+        if pipeline is None:
+            return None
+        if pipeline.failure is not None:
+            return pipeline.failure
+        stall_seconds = next(
+            (camera.stall_seconds for camera in self.config.cameras if camera.id == camera_id), 0.0
+        )
+        if stall_seconds <= 0:
+            return None
+        if pipeline.last_frame_at is None:
+            age = now - record.requested_at
+            limit = max(stall_seconds, self.config.watchdog.startup_seconds)
+        else:
+            age = now - pipeline.last_frame_at
+            # A throttled snooze lets frames through slower than stall_seconds allows for.
+            limit = max(stall_seconds, 3 * pipeline.min_frame_interval)
+        if age > limit:
+            return f"no frames for {age:.0f} s"
+        return None
+
+    def _apply_live(self, pipeline: CameraPipeline, camera: CameraConfig) -> None:
+        logger.info("Updating camera %s in place", camera.id)
+        pipeline.update_settings(
+            camera_name=camera.name,
+            time_span_years=camera.sampling.time_span_years,
+            cooldown_hours=camera.sampling.cooldown_hours,
+            recent_samples_limit=camera.recent_samples_limit,
+            preview_fps=camera.preview_fps,
+            snooze_power=_snooze_power(camera),
+        )
+
+    def _publish(self, camera_id: str, pipeline: CameraPipeline) -> None:
+        with self._pipelines_lock:
+            pipelines = dict(self.pipelines)
+            pipelines[camera_id] = pipeline
+            # Keep the configured camera order for the dashboard and mosaic.
+            self.pipelines = {camera.id: pipelines[camera.id] for camera in self.config.cameras if camera.id in pipelines}
+
+    def _unpublish(self, camera_id: str) -> Optional[CameraPipeline]:
+        with self._pipelines_lock:
+            pipelines = dict(self.pipelines)
+            pipeline = pipelines.pop(camera_id, None)
+            self.pipelines = pipelines
+        return pipeline
+
+    def start_all(self, wait: bool = True) -> threading.Thread:
+        """Builds and starts every camera on a worker pool; with ``wait=False`` returns at once.
+
+        Cameras appear in ``pipelines`` as soon as each one is built, and
+        ``list_status`` reports the rest as starting or failed.
+        """
+        self._started = True
+        self.watchdog.start()
+        thread = threading.Thread(target=self._start_all, name="startup", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _start_all(self) -> None:
+        with self._reconfigure_lock:
+            began = time.monotonic()
+            self._start_cameras(self.config.cameras)
+            running = sum(record.state == STATE_RUNNING for record in self.startup.values())
+            logger.info(
+                "Started %d of %d cameras in %.1f s", running, len(self.config.cameras), time.monotonic() - began
             )
-            self.pipelines[camera.id] = pipeline
 
-    def start_all(self) -> None:
-        for pipeline in self.pipelines.values():
+    def _start_cameras(
+        self,
+        cameras: Iterable[CameraConfig],
+        previous: Optional[Dict[str, CameraPipeline]] = None,
+    ) -> None:
+        cameras = list(cameras)
+        if not cameras:
+            return
+        now = time.monotonic()
+        for camera in cameras:
+            self.startup[camera.id] = CameraStartup(requested_at=now)
+        previous = previous or {}
+        workers = min(self.config.startup_workers, len(cameras))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="startup") as pool:
+            built = list(pool.map(lambda camera: self._bring_up(camera, previous.get(camera.id)), cameras))
+            # Grouped cameras share one nvstreammux, so the group is only
+            # started once all of its cameras have been added.
+            grouped = [pipeline for pipeline in built if pipeline is not None]
+            list(pool.map(self._start_pipeline, grouped))
+
+    def _bring_up(self, camera: CameraConfig, previous: Optional[CameraPipeline]) -> Optional[CameraPipeline]:
+        """Builds one camera and starts it unless it is part of a shared group; returns deferred ones."""
+        record = self.startup[camera.id]
+        began = time.monotonic()
+        try:
+            pipeline = self._build_camera(camera)
+        except Exception as exc:
+            logger.exception("Failed to build camera %s", camera.id)
+            record.state = STATE_FAILED
+            record.error = str(exc)
+            self._unpublish(camera.id)
+            if previous is not None:
+                self._orphans[camera.id] = previous
+            return None
+        record.build_seconds = time.monotonic() - began
+        if previous is not None:
+            pipeline.inherit_state(previous)
+        self._publish(camera.id, pipeline)
+        if getattr(pipeline, "group", None) is not None:
+            return pipeline
+        self._start_pipeline(pipeline)
+        return None
+
+    def _start_pipeline(self, pipeline: CameraPipeline) -> None:
+        record = self.startup[pipeline.camera_id]
+        began = time.monotonic()
+        try:
             pipeline.start()
+        except Exception as exc:
+            logger.exception("Failed to start camera %s", pipeline.camera_id)
+            record.state = STATE_FAILED
+            record.error = str(exc)
+            return
+        record.start_seconds = time.monotonic() - began
+        record.state = STATE_RUNNING
 
     def stop_all(self) -> None:
-        for pipeline in self.pipelines.values():
-            pipeline.stop()
+        self._started = False
+        self.watchdog.stop()
+        # Waits for a startup or reconfiguration in progress to finish first.
+        with self._reconfigure_lock:
+            for pipeline in self.pipelines.values():
+                pipeline.stop()
+                if pipeline.event_recorder is not None:
+                    pipeline.event_recorder.close()
+            if self.deepstream_group is not None:
+                self.deepstream_group.stop()
+            if self.batched_inference is not None:
+                self.batched_inference.stop()
+            self.frame_processor.shutdown()
+            for pipeline in self.pipelines.values():
+                pipeline.storage.close()
 
-    def get_pipeline(self, camera_id: str) -> DeepStreamPipeline:
+    def get_pipeline(self, camera_id: str) -> CameraPipeline:
         return self.pipelines[camera_id]
 
     def list_status(self) -> list:
-        return [pipeline.get_status() for pipeline in self.pipelines.values()]
+        pipelines = self.pipelines
+        result: List[dict] = []
+        for camera in self.config.cameras:
+            pipeline = pipelines.get(camera.id)
+            if pipeline is not None:
+                status = pipeline.get_status()
+            else:
+                status = {
+                    "camera_id": camera.id,
+                    "camera_name": camera.name,
+                    "backend": camera.backend,
+                    "device": camera.device,
+                    "running": False,
+                    "last_frame_time": None,
+                    "snoozing": False,
+                    "snooze_until": None,
+                    "snooze_remaining_seconds": 0,
+                }
+            record = self.startup.get(camera.id)
+            status["state"] = record.state if record is not None else STATE_STOPPED
+            status["startup"] = record.to_dict(pipeline) if record is not None else None
+            status["watchdog"] = self.watchdog.get_status(camera.id)
+            result.append(status)
+        return result
@@ -0,0 +1,290 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.metrics import CameraMetrics
+
+MJPEG_BOUNDARY = "frame"
+
+PREVIEW_TIERS = {
+    "thumb": 480,
+    "medium": 960,
+    "full": None,
+}
+DEFAULT_TIER = "full"
+# The mosaic's stream path (/stream/mosaic) and metrics label; no camera may use it as its id.
+MOSAIC_ID = "mosaic"
+
+
+def build_mjpeg_chunk(jpeg: bytes) -> bytes:
+    return (
+        f"--{MJPEG_BOUNDARY}\r\n"
+        f"Content-Type: image/jpeg\r\n"
+        f"Content-Length: {len(jpeg)}\r\n\r\n"
+    ).encode("ascii") + jpeg + b"\r\n"
+
+
+def resize_to_width(frame, width: Optional[int]):
+    if width is None or frame.shape[1] <= width:
+        return frame
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class _TierCache:
+    def __init__(self, width: Optional[int]) -> None:
+        self.width = width
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.jpeg: Optional[bytes] = None
+        self.chunk: Optional[bytes] = None
+
+    def reset(self, seq: int) -> None:
+        with self.lock:
+            self.seq = seq
+            self.jpeg = None
+            self.chunk = None
+
+
+class PreviewPublisher:
+    def __init__(
+        self,
+        max_fps: float,
+        jpeg_quality: int = 80,
+        keepalive_seconds: float = 5.0,
+        metrics: Optional[CameraMetrics] = None,
+    ) -> None:
+        self.max_fps = max(0.0, float(max_fps))
+        self.metrics = metrics
+        self.jpeg_quality = jpeg_quality
+        self.keepalive_seconds = keepalive_seconds
+        self._lock = threading.Lock()
+        self._frame_ready = threading.Condition(self._lock)
+        self._subscribers = 0
+        self._seq = 0
+        self._frame = None
+        self._lease = None
+        self._tiers = {name: _TierCache(width) for name, width in PREVIEW_TIERS.items()}
+        self._next_publish = 0.0
+        self._listeners: Tuple[Callable[[int], None], ...] = ()
+
+    @property
+    def min_interval(self) -> float:
+        return 1.0 / self.max_fps if self.max_fps > 0 else 0.0
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def subscribe(self) -> None:
+        with self._lock:
+            self._subscribers += 1
+
+    def unsubscribe(self) -> None:
+        with self._lock:
+            self._subscribers = max(0, self._subscribers - 1)
+            idle = self._subscribers == 0
+            lease = None
+            if idle:
+                self._frame = None
+                lease, self._lease = self._lease, None
+            seq = self._seq
+        if lease is not None:
+            lease.release()
+        if idle:
+            for tier in self._tiers.values():
+                tier.reset(seq)
+
+    def wants_frame(self) -> bool:
+        if self._subscribers <= 0:
+            return False
+        now = time.monotonic()
+        if now < self._next_publish:
+            return False
+        self._next_publish = now + self.min_interval
+        return True
+
+    def add_listener(self, callback: Callable[[int], None]) -> None:
+        """``callback(seq)`` runs on the publishing thread for every new frame; keep it cheap."""
+        with self._lock:
+            self._listeners = self._listeners + (callback,)
+
+    def remove_listener(self, callback: Callable[[int], None]) -> None:
+        with self._lock:
+            self._listeners = tuple(listener for listener in self._listeners if listener is not callback)
+
+    def publish(self, frame, lease=None) -> int:
+        """Publish ``frame``; a pooled ``lease`` is retained until the frame is replaced."""
+        if lease is not None:
+            lease.retain()
+        with self._frame_ready:
+            self._seq += 1
+            seq = self._seq
+            self._frame = frame
+            previous, self._lease = self._lease, lease
+            self._frame_ready.notify_all()
+            listeners = self._listeners
+        if previous is not None:
+            previous.release()
+        for listener in listeners:
+            listener(seq)
+        return seq
+
+    def borrow_frame(self):
+        """Returns ``(frame, lease)``; release the lease, if any, once done with the frame."""
+        with self._lock:
+            lease = self._lease.retain() if self._lease is not None else None
+            return self._frame, lease
+
+    def wait_for_frame(self, last_seq: int, timeout: Optional[float] = None) -> int:
+        with self._frame_ready:
+            self._frame_ready.wait_for(lambda: self._seq != last_seq, timeout)
+            return self._seq
+
+    def _encode_latest(self, tier_name: str) -> _TierCache:
+        tier = self._tiers[tier_name]
+        with self._lock:
+            frame = self._frame
+            seq = self._seq
+            if seq == tier.seq or frame is None:
+                return tier
+            lease = self._lease.retain() if self._lease is not None else None
+
+        started = time.perf_counter()
+        try:
+            ret, jpeg = cv2.imencode(
+                ".jpg",
+                resize_to_width(frame, tier.width),
+                [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality],
+            )
+        finally:
+            if lease is not None:
+                lease.release()
+        if ret:
+            tier.jpeg = jpeg.tobytes()
+            tier.chunk = build_mjpeg_chunk(tier.jpeg)
+            tier.seq = seq
+        if self.metrics is not None:
+            self.metrics.encode_seconds.observe(time.perf_counter() - started)
+        return tier
+
+    def get_jpeg(self, tier_name: str = DEFAULT_TIER) -> Optional[bytes]:
+        with self._tiers[tier_name].lock:
+            return self._encode_latest(tier_name).jpeg
+
+    def get_chunk(self, tier_name: str = DEFAULT_TIER) -> Optional[bytes]:
+        with self._tiers[tier_name].lock:
+            return self._encode_latest(tier_name).chunk
+
+    def stream(self, tier_name: str = DEFAULT_TIER, max_fps: Optional[float] = None) -> Iterator[bytes]:
+        if tier_name not in self._tiers:
+            raise ValueError(f"Unknown preview tier: {tier_name}")
+        min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+        bytes_sent = self.metrics.stream_counter(tier_name) if self.metrics is not None else None
+
+        self.subscribe()
+        try:
+            seq = 0
+            next_send = 0.0
+            while True:
+                seq = self.wait_for_frame(seq, timeout=self.keepalive_seconds)
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                    seq = self._seq
+                chunk = self.get_chunk(tier_name)
+                if chunk:
+                    next_send = time.monotonic() + min_interval
+                    yield chunk
+                    if bytes_sent is not None:
+                        bytes_sent.inc(len(chunk))
+        finally:
+            self.unsubscribe()
+
+
+class MosaicPublisher(PreviewPublisher):
+    def __init__(
+        self,
+        sources: Callable[[], List[Tuple[str, PreviewPublisher]]],
+        max_fps: float,
+        cell_width: int = PREVIEW_TIERS["thumb"],
+        jpeg_quality: int = 80,
+        metrics: Optional[CameraMetrics] = None,
+    ) -> None:
+        super().__init__(max_fps=max_fps, jpeg_quality=jpeg_quality, metrics=metrics)
+        self.cell_width = cell_width
+        self.cell_height = cell_width * 9 // 16
+        self._sources = sources
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self) -> None:
+        with self._lock:
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _compose(self, frames: List[Tuple[str, Optional[np.ndarray]]]) -> np.ndarray:
+        count = max(1, len(frames))
+        cols = math.ceil(math.sqrt(count))
+        rows = math.ceil(count / cols)
+        canvas = np.zeros((rows * self.cell_height, cols * self.cell_width, 3), dtype=np.uint8)
+
+        for index, (name, frame) in enumerate(frames):
+            top = (index // cols) * self.cell_height
+            left = (index % cols) * self.cell_width
+            cell = canvas[top:top + self.cell_height, left:left + self.cell_width]
+            if frame is not None:
+                cv2.resize(frame, (self.cell_width, self.cell_height), dst=cell, interpolation=cv2.INTER_AREA)
+            cv2.putText(
+                cell,
+                name,
+                (8, self.cell_height - 10),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.6,
+                (255, 255, 255),
+                1,
+                cv2.LINE_AA,
+            )
+        return canvas
+
+    def _run(self) -> None:
+        subscribed: Dict[int, PreviewPublisher] = {}
+        try:
+            while True:
+                with self._lock:
+                    if self._subscribers <= 0:
+                        self._thread = None
+                        return
+
+                sources = self._sources()
+                current = {id(source): source for _name, source in sources}
+                for key in list(subscribed):
+                    if key not in current:
+                        subscribed.pop(key).unsubscribe()
+                for key, source in current.items():
+                    if key not in subscribed:
+                        source.subscribe()
+                        subscribed[key] = source
+
+                started = time.monotonic()
+                borrowed = [(name, source.borrow_frame()) for name, source in sources]
+                try:
+                    canvas = self._compose([(name, frame) for name, (frame, _lease) in borrowed])
+                finally:
+                    for _name, (_frame, lease) in borrowed:
+                        if lease is not None:
+                            lease.release()
+                self.publish(canvas)
+                time.sleep(max(0.0, (self.min_interval or 0.2) - (time.monotonic() - started)))
+        finally:
+            for source in subscribed.values():
+                source.unsubscribe()
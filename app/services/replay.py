@@ -0,0 +1,361 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Iterator, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from app.services.batch import BatchedInference
+from app.services.camera import CameraPipeline
+from app.services.event_buffer import EventRecorder
+from app.services.frame_worker import DROP_OLDEST, FrameProcessor
+from app.services.gating import InferenceGate
+from app.services.metrics import CameraMetrics
+from app.services.occupancy import OccupancyStore
+from app.services.sampling import SamplingPolicy
+from app.services.snooze import SnoozePower
+from app.services.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+SOURCE_SYNTHETIC = "synthetic"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+DETECTOR_SCRIPT = "script"
+DETECTOR_RANDOM = "random"
+DETECTOR_HOG = "hog"
+DETECTORS = (DETECTOR_SCRIPT, DETECTOR_RANDOM, DETECTOR_HOG)
+
+
+class FrameSource:
+    def frames(self) -> Iterator[np.ndarray]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SyntheticSource(FrameSource):
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self.persons = 0
+
+    def frames(self) -> Iterator[np.ndarray]:
+        background = np.full((self.height, self.width, 3), 48, dtype=np.uint8)
+        box_w = max(8, self.width // 12)
+        box_h = max(16, self.height // 4)
+        index = 0
+        while True:
+            frame = background.copy()
+            for person in range(self.persons):
+                x = (index * 4 + person * box_w * 2) % max(1, self.width - box_w)
+                y = self.height // 2 - box_h // 2
+                cv2.rectangle(frame, (x, y), (x + box_w, y + box_h), (0, 160, 255), -1)
+            index += 1
+            yield frame
+
+
+class ImageDirectorySource(FrameSource):
+    def __init__(self, path: str, loop: bool = True, cache: bool = True) -> None:
+        self.paths = sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.paths:
+            raise ValueError(f"No images found in {path}")
+        self.loop = loop
+        self.cache = cache
+        self._decoded: List[np.ndarray] = []
+
+    def frames(self) -> Iterator[np.ndarray]:
+        while True:
+            for i, path in enumerate(self.paths):
+                if i < len(self._decoded):
+                    yield self._decoded[i]
+                    continue
+                frame = cv2.imread(path, cv2.IMREAD_COLOR)
+                if frame is None:
+                    logger.warning("Skip unreadable image: %s", path)
+                    continue
+                if self.cache:
+                    self._decoded.append(frame)
+                yield frame
+            if not self.loop:
+                return
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path: str, loop: bool = True) -> None:
+        self.path = path
+        self.loop = loop
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise ValueError(f"Cannot open video: {path}")
+
+    def frames(self) -> Iterator[np.ndarray]:
+        while True:
+            ok, frame = self._capture.read()
+            if ok:
+                yield frame
+                continue
+            if not self.loop:
+                return
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def close(self) -> None:
+        self._capture.release()
+
+
+def open_source(source: str, width: int, height: int, loop: bool = True) -> FrameSource:
+    if source == SOURCE_SYNTHETIC:
+        return SyntheticSource(width, height)
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, loop=loop)
+    return VideoFileSource(source, loop=loop)
+
+
+class PersonDetector:
+    def detect(self, frame: np.ndarray, now: float) -> int:
+        raise NotImplementedError
+
+
+class ScriptedDetector(PersonDetector):
+    """Cycles through fixed person counts, holding each for ``hold_seconds``."""
+
+    def __init__(self, persons: Sequence[int], hold_seconds: float) -> None:
+        self.persons = list(persons) or [0]
+        self.hold_seconds = max(0.001, hold_seconds)
+        self._started = time.monotonic()
+
+    def detect(self, frame: np.ndarray, now: float) -> int:
+        step = int((now - self._started) / self.hold_seconds)
+        return self.persons[step % len(self.persons)]
+
+
+class RandomDetector(PersonDetector):
+    """Person counts that change every ``hold_seconds`` around ``max(persons)``."""
+
+    def __init__(self, persons: Sequence[int], hold_seconds: float, seed: Optional[int] = None) -> None:
+        self.max_persons = max(persons) if persons else 1
+        self.hold_seconds = max(0.001, hold_seconds)
+        self._random = random.Random(seed)
+        self._next_change = 0.0
+        self._count = 0
+
+    def detect(self, frame: np.ndarray, now: float) -> int:
+        if now >= self._next_change:
+            self._count = self._random.randint(0, self.max_persons)
+            self._next_change = now + self._random.expovariate(1.0 / self.hold_seconds)
+        return self._count
+
+
+class HogDetector(PersonDetector):
+    """OpenCV's HOG people detector on a downscaled frame, run every ``interval`` frames."""
+
+    def __init__(self, interval: int = 5, width: int = 640) -> None:
+        self.interval = max(1, interval)
+        self.width = width
+        self._hog = cv2.HOGDescriptor()
+        self._hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        self._frames = 0
+        self._count = 0
+
+    def detect(self, frame: np.ndarray, now: float) -> int:
+        self._frames += 1
+        if (self._frames - 1) % self.interval == 0:
+            if frame.shape[1] > self.width:
+                height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+                frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+            rects, _weights = self._hog.detectMultiScale(frame, winStride=(8, 8))
+            self._count = len(rects)
+        return self._count
+
+
+def make_detector(
+    name: str,
+    persons: Sequence[int],
+    hold_seconds: float,
+    interval: int = 5,
+    seed: Optional[int] = None,
+) -> PersonDetector:
+    if name == DETECTOR_SCRIPT:
+        return ScriptedDetector(persons, hold_seconds)
+    if name == DETECTOR_RANDOM:
+        return RandomDetector(persons, hold_seconds, seed=seed)
+    if name == DETECTOR_HOG:
+        return HogDetector(interval=interval)
+    raise ValueError(f"Unknown detector: {name}")
+
+
+class ReplayPipeline(CameraPipeline):
+    """CPU backend that replays a video, an image directory or synthetic frames."""
+
+    backend = "replay"
+
+    def __init__(
+        self,
+        camera_id: str,
+        camera_name: str,
+        source: str,
+        width: int,
+        height: int,
+        fps: int,
+        detector: PersonDetector,
+        sampling_policy: SamplingPolicy,
+        storage: Storage,
+        recent_samples_limit: int,
+        frame_processor: FrameProcessor,
+        preview_fps: float = 10.0,
+        frame_queue_size: int = 4,
+        drop_policy: str = DROP_OLDEST,
+        loop: bool = True,
+        inference: Optional[BatchedInference] = None,
+        metrics: Optional[CameraMetrics] = None,
+        log_summary_seconds: float = 10.0,
+        event_recorder: Optional[EventRecorder] = None,
+        inference_gate: Optional[InferenceGate] = None,
+        snooze_power: Optional[SnoozePower] = None,
+        occupancy: Optional[OccupancyStore] = None,
+    ) -> None:
+        super().__init__(
+            camera_id=camera_id,
+            camera_name=camera_name,
+            sampling_policy=sampling_policy,
+            storage=storage,
+            recent_samples_limit=recent_samples_limit,
+            frame_processor=frame_processor,
+            preview_fps=preview_fps,
+            frame_queue_size=frame_queue_size,
+            drop_policy=drop_policy,
+            metrics=metrics,
+            log_summary_seconds=log_summary_seconds,
+            frame_size=(width, height),
+            event_recorder=event_recorder,
+            inference_gate=inference_gate,
+            snooze_power=snooze_power,
+            occupancy=occupancy,
+        )
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = max(1, fps)
+        self.loop = loop
+        self.detector = detector
+        self.inference = inference
+        self.thread: Optional[threading.Thread] = None
+        self._frame_source: Optional[FrameSource] = None
+        self._stop = threading.Event()
+        self._frames = 0
+        self._late_frames = 0
+        # Gated frames arrive on the replay thread and inferred ones on the
+        # shared inference thread; handle_detection must see one at a time.
+        self._detection_lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._running:
+            return
+
+        self._running = True
+        self._stop.clear()
+        if self.inference is not None:
+            self.inference.register(self.camera_id)
+        logger.info("Starting replay for %s (%s @ %d fps)", self.camera_id, self.source, self.fps)
+        self.thread = threading.Thread(target=self._run, name=f"replay-{self.camera_id}", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+
+        # Also runs after the replay thread ended on its own, to release the inference slot.
+        self._running = False
+        logger.info("Stopping replay for %s", self.camera_id)
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+        if self.inference is not None:
+            self.inference.unregister(self.camera_id)
+
+    def _run(self) -> None:
+        try:
+            frame_source = open_source(self.source, self.width, self.height, loop=self.loop)
+        except Exception as exc:
+            logger.exception("Failed to open replay source: %s", self.source)
+            self.mark_failed(f"cannot open {self.source}: {exc}")
+            self._running = False
+            return
+
+        self._frame_source = frame_source
+        interval = 1.0 / self.fps
+        next_frame = time.monotonic()
+        try:
+            for frame in frame_source.frames():
+                if self._stop.is_set():
+                    break
+                if self.admit_frame():
+                    self._detect(frame)
+                self._frames += 1
+
+                next_frame += interval
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+                else:
+                    # Running behind: do not try to catch up with a burst.
+                    self._late_frames += 1
+                    next_frame = time.monotonic()
+        except Exception as exc:
+            logger.exception("Replay failed: %s", self.camera_id)
+            self.mark_failed(str(exc))
+        finally:
+            frame_source.close()
+            if not self._stop.is_set():
+                logger.warning("Replay source ended: %s", self.camera_id)
+                if self.loop:
+                    # A looping source only ends when it breaks.
+                    self.mark_failed("source ended")
+            self._running = False
+
+    def _detect(self, frame: np.ndarray) -> None:
+        gate = self.inference_gate
+        if self.inference_paused:
+            self._on_detection(frame, None)
+            return
+        infer = gate is None or gate.should_infer()
+        if gate is not None and gate.observe(frame, inferred=infer):
+            infer = True
+        if not infer:
+            self._on_detection(frame, None)
+        elif self.inference is not None:
+            # A frame replaced before it was batched still counts, as a skipped detection.
+            self.inference.submit(self.camera_id, frame, self._on_detection, on_drop=self._on_skipped)
+        else:
+            self._on_detection(frame, self.detector.detect(frame, time.monotonic()))
+
+    def _on_skipped(self, frame: np.ndarray) -> None:
+        self._on_detection(frame, None)
+
+    def _on_detection(self, frame: np.ndarray, person_count: Optional[int]) -> None:
+        if not self._running:
+            return
+        with self._detection_lock:
+            started = time.perf_counter()
+            if isinstance(self._frame_source, SyntheticSource) and person_count is not None:
+                self._frame_source.persons = person_count
+            self.handle_detection(person_count, lambda: frame)
+            self.metrics.probe_seconds.observe(time.perf_counter() - started)
+
+    def get_source_status(self) -> dict:
+        status = {
+            "device": self.source,
+            "replay": {"fps": self.fps, "frames": self._frames, "late_frames": self._late_frames},
+        }
+        if self.inference is not None:
+            status["shared_inference"] = self.inference.get_status()
+        return status
@@ -0,0 +1,196 @@
+import datetime
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Set
+
+from app.services.sample_index import CLIP_EXTENSION, SampleIndex, SampleRecord
+
+logger = logging.getLogger(__name__)
+
+THIN_CURSOR_KEY = "retention_thin_cursor"
+
+
+class RetentionManager:
+    def __init__(
+        self,
+        base_dir: str,
+        index: SampleIndex,
+        max_bytes: int = 0,
+        max_files: int = 0,
+        max_age_days: float = 0.0,
+        thin_after_days: float = 0.0,
+        interval_seconds: float = 60.0,
+        batch_size: int = 200,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.base_dir = base_dir
+        self.index = index
+        self.max_bytes = max(0, max_bytes)
+        self.max_files = max(0, max_files)
+        self.max_age_days = max(0.0, max_age_days)
+        self.thin_after_days = max(0.0, thin_after_days)
+        self.interval_seconds = max(1.0, interval_seconds)
+        self.batch_size = max(1, batch_size)
+        self.on_evict = on_evict
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._evicted = 0
+        self._evicted_bytes = 0
+        self._last_run_ms = 0.0
+        # Samples that could not be removed; passed over until the next idle pass retries them.
+        self._failed: Set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_bytes or self.max_files or self.max_age_days or self.thin_after_days)
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"retention-{os.path.basename(self.base_dir)}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                busy = self.run_once()
+            except Exception:
+                logger.exception("Retention pass failed: %s", self.base_dir)
+                busy = False
+            if not busy:
+                self._failed.clear()
+            # Keep draining in short steps while over quota, otherwise idle.
+            self._stop.wait(0.5 if busy else self.interval_seconds)
+
+    def run_once(self) -> bool:
+        started = time.monotonic()
+        with self._run_lock:
+            removed = self._evict_expired()
+            removed += self._thin()
+            removed += self._evict_over_quota()
+        with self._lock:
+            self._last_run_ms = (time.monotonic() - started) * 1000
+        return removed >= self.batch_size
+
+    def _evict_expired(self) -> int:
+        if not self.max_age_days:
+            return 0
+        cutoff = time.time() - self.max_age_days * 86400
+        records = self._oldest(self.batch_size, before=cutoff)
+        return sum(self._evict(record) for record in records)
+
+    def _thin(self) -> int:
+        if not self.thin_after_days:
+            return 0
+        cutoff = time.time() - self.thin_after_days * 86400
+        raw_cursor = self.index.get_meta(THIN_CURSOR_KEY)
+        cursor = float(raw_cursor) if raw_cursor is not None else None
+        records = self.index.oldest(self.batch_size, after=cursor, before=cutoff)
+        if not records:
+            return 0
+
+        # The first sample seen for each day is kept. The cursor day has
+        # already had its keeper, so further samples of that day are dropped.
+        kept_day = datetime.date.fromtimestamp(cursor) if cursor is not None else None
+        removed = 0
+        for record in records:
+            day = datetime.date.fromtimestamp(record.timestamp)
+            if day == kept_day:
+                removed += self._evict(record)
+            else:
+                kept_day = day
+        self.index.set_meta(THIN_CURSOR_KEY, repr(records[-1].timestamp))
+        return removed
+
+    def _evict_over_quota(self) -> int:
+        if not self.max_bytes and not self.max_files:
+            return 0
+        count, size = self.index.totals()
+        removed = 0
+        while removed < self.batch_size:
+            over_files = self.max_files and count > self.max_files
+            over_bytes = self.max_bytes and size > self.max_bytes
+            if not over_files and not over_bytes:
+                break
+            records = self._oldest(min(32, self.batch_size - removed))
+            if not records:
+                break
+            for record in records:
+                if not self._evict(record):
+                    continue
+                count -= 1
+                size -= record.size
+                removed += 1
+                if not (self.max_files and count > self.max_files) and not (
+                    self.max_bytes and size > self.max_bytes
+                ):
+                    break
+        return removed
+
+    def _oldest(self, limit: int, before: Optional[float] = None) -> List[SampleRecord]:
+        """The oldest samples, leaving out the ones that failed to evict this pass."""
+        records = self.index.oldest(limit + len(self._failed), before=before)
+        return [record for record in records if record.path not in self._failed][:limit]
+
+    def _evict(self, record: SampleRecord) -> bool:
+        full_path = os.path.join(self.base_dir, record.path)
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.exception("Failed to evict sample: %s", full_path)
+            self._failed.add(record.path)
+            return False
+        try:
+            os.remove(os.path.splitext(full_path)[0] + CLIP_EXTENSION)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.exception("Failed to evict clip for sample: %s", full_path)
+        self.index.remove(record.path)
+        if self.on_evict is not None:
+            self.on_evict(record.path)
+        self._prune_dirs(os.path.dirname(full_path))
+        with self._lock:
+            self._evicted += 1
+            self._evicted_bytes += record.size
+        logger.debug("Evicted sample: %s", full_path)
+        return True
+
+    def _prune_dirs(self, directory: str) -> None:
+        base = os.path.abspath(self.base_dir)
+        directory = os.path.abspath(directory)
+        while directory != base and directory.startswith(base + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_bytes": self.max_bytes,
+                "max_files": self.max_files,
+                "max_age_days": self.max_age_days,
+                "thin_after_days": self.thin_after_days,
+                "evicted": self._evicted,
+                "evicted_bytes": self._evicted_bytes,
+                "failed": len(self._failed),
+                "last_run_ms": round(self._last_run_ms, 2),
+            }
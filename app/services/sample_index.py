@@ -0,0 +1,233 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".samples.sqlite3"
+SCHEMA_VERSION = 1
+EXCLUDED_NAMES = ("latest.jpg",)
+# Event clips are stored next to their sample, sharing its stem.
+CLIP_EXTENSION = ".avi"
+# Thumbnail cache inside the storage dir; not samples.
+THUMB_DIR = ".thumbs"
+# Marks samples kept although they look like a recent one (dedup "tag" mode).
+DUPLICATE_SUFFIX = "_dup"
+
+
+@dataclass
+class SampleRecord:
+    path: str
+    timestamp: float
+    size: int
+
+    def to_dict(self) -> dict:
+        return {"path": self.path, "timestamp": self.timestamp, "size": self.size}
+
+
+def scan_samples(base_dir: str) -> Iterable[SampleRecord]:
+    """Samples found on disk under ``base_dir``, for when there is no index to ask."""
+    for root, dirs, files in os.walk(base_dir):
+        if root == base_dir and THUMB_DIR in dirs:
+            dirs.remove(THUMB_DIR)
+        for name in files:
+            if not name.lower().endswith(".jpg") or name in EXCLUDED_NAMES:
+                continue
+            full_path = os.path.join(root, name)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            yield SampleRecord(
+                path=os.path.relpath(full_path, base_dir),
+                timestamp=stat.st_mtime,
+                size=stat.st_size,
+            )
+
+
+def read_totals(base_dir: str, filename: str = INDEX_FILENAME) -> Tuple[int, int]:
+    """Sample count and total bytes without modifying anything, for tools running next to the service.
+
+    The index is opened read-only; if it is missing or unreadable the
+    directory is scanned instead of creating or rebuilding it.
+    """
+    uri = "file:" + urllib.parse.quote(os.path.abspath(os.path.join(base_dir, filename))) + "?mode=ro"
+    try:
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM samples").fetchone()
+        finally:
+            conn.close()
+        return count, size
+    except sqlite3.Error:
+        records = list(scan_samples(base_dir))
+        return len(records), sum(record.size for record in records)
+
+
+class SampleIndex:
+    def __init__(self, base_dir: str, filename: str = INDEX_FILENAME) -> None:
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, filename)
+        self._lock = threading.Lock()
+        self._conn = self._open()
+        if self._needs_rebuild():
+            self.rebuild()
+
+    def _open(self) -> sqlite3.Connection:
+        try:
+            conn = self._connect()
+            conn.execute("SELECT 1 FROM meta LIMIT 1")
+            return conn
+        except sqlite3.DatabaseError:
+            logger.warning("Sample index missing or corrupt, recreating: %s", self.path)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+            return self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            "path TEXT PRIMARY KEY, timestamp REAL NOT NULL, size INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS samples_timestamp ON samples (timestamp)")
+        return conn
+
+    def _needs_rebuild(self) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            if row is None or int(row[0]) != SCHEMA_VERSION:
+                return True
+            newest = self._conn.execute(
+                "SELECT path FROM samples ORDER BY timestamp DESC LIMIT 1"
+            ).fetchone()
+        # A cheap consistency check: the newest indexed sample must still exist.
+        return newest is not None and not os.path.exists(os.path.join(self.base_dir, newest[0]))
+
+    def _scan(self) -> Iterable[SampleRecord]:
+        return scan_samples(self.base_dir)
+
+    def rebuild(self) -> int:
+        started = time.monotonic()
+        records = [(r.path, r.timestamp, r.size) for r in self._scan()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM samples")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO samples (path, timestamp, size) VALUES (?, ?, ?)",
+                    records,
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                    (str(SCHEMA_VERSION),),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(
+            "Rebuilt sample index for %s: %d samples (%.1f ms)",
+            self.base_dir,
+            len(records),
+            (time.monotonic() - started) * 1000,
+        )
+        return len(records)
+
+    def add(self, path: str, timestamp: float, size: int = 0) -> None:
+        rel_path = os.path.relpath(path, self.base_dir) if os.path.isabs(path) else path
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO samples (path, timestamp, size) VALUES (?, ?, ?)",
+                (rel_path, timestamp, size),
+            )
+
+    def remove(self, path: str) -> None:
+        rel_path = os.path.relpath(path, self.base_dir) if os.path.isabs(path) else path
+        with self._lock:
+            self._conn.execute("DELETE FROM samples WHERE path = ?", (rel_path,))
+
+    def query(
+        self,
+        limit: int,
+        before: Optional[float] = None,
+        after: Optional[float] = None,
+        duplicates: bool = True,
+    ) -> List[SampleRecord]:
+        if limit <= 0:
+            return []
+        clauses = []
+        params: list = []
+        if not duplicates:
+            clauses.append("path NOT LIKE ? ESCAPE '\\'")
+            params.append("%" + DUPLICATE_SUFFIX.replace("_", "\\_") + ".jpg")
+        if before is not None:
+            clauses.append("timestamp < ?")
+            params.append(before)
+        if after is not None:
+            clauses.append("timestamp >= ?")
+            params.append(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT path, timestamp, size FROM samples {where} ORDER BY timestamp DESC LIMIT ?",
+                params,
+            ).fetchall()
+        return [SampleRecord(path=row[0], timestamp=row[1], size=row[2]) for row in rows]
+
+    def latest(self, limit: int, duplicates: bool = True) -> List[SampleRecord]:
+        return self.query(limit, duplicates=duplicates)
+
+    def oldest(self, limit: int, after: Optional[float] = None, before: Optional[float] = None) -> List[SampleRecord]:
+        clauses = []
+        params: list = []
+        if after is not None:
+            clauses.append("timestamp > ?")
+            params.append(after)
+        if before is not None:
+            clauses.append("timestamp < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(max(0, limit))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT path, timestamp, size FROM samples {where} ORDER BY timestamp ASC LIMIT ?",
+                params,
+            ).fetchall()
+        return [SampleRecord(path=row[0], timestamp=row[1], size=row[2]) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def totals(self) -> Tuple[int, int]:
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM samples").fetchone()
+        return count, size
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,7 +1,10 @@
 import datetime
 import logging
+import math
 import random
+import time
 from dataclasses import dataclass
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -10,54 +13,80 @@ logger = logging.getLogger(__name__)
 class SamplingState:
     last_sample_time: datetime.datetime
     force_snapshot: bool = False
+    cooldown_deadline: float = 0.0
+    lottery_budget: int = 0
+    scheduled_by: Optional[object] = None
+    last_reason: str = ""
 
 
 class SamplingPolicy:
-    def __init__(self, time_span_years: float, cooldown_hours: float) -> None:
+    def __init__(self, time_span_years: float, cooldown_hours: float, seed: Optional[int] = None) -> None:
+        self._random = random.Random(seed)
+        self.configure(time_span_years, cooldown_hours)
+
+    def configure(self, time_span_years: float, cooldown_hours: float) -> None:
+        """Changes the rates in place; states scheduled earlier keep their deadline until ``reschedule``."""
         self.time_span_years = max(time_span_years, 0.1)
         self.cooldown_seconds = max(cooldown_hours, 0.0) * 3600
         self.sample_chance = (200 * 1024 * 2) / (
             self.time_span_years * 365 * 24 * 3600 * 30
         )
+        self._log_miss = math.log1p(-self.sample_chance) if self.sample_chance < 1.0 else None
+
+    @staticmethod
+    def reschedule(state: SamplingState) -> None:
+        # The next should_sample recomputes the deadline from last_sample_time.
+        state.scheduled_by = None
+
+    def draw_lottery_budget(self) -> int:
+        # Person-weighted frames until the next lottery hit. Each person in a
+        # frame is an independent trial with probability sample_chance, so
+        # the wait is geometric and can be drawn once per sample.
+        if self._log_miss is None:
+            return 1
+        u = 1.0 - self._random.random()
+        return int(math.log(u) / self._log_miss) + 1
+
+    def _schedule(self, state: SamplingState, now: float, elapsed: Optional[float] = None) -> None:
+        if elapsed is None:
+            state.cooldown_deadline = now + self.cooldown_seconds
+        else:
+            state.cooldown_deadline = now + self.cooldown_seconds - elapsed
+        state.lottery_budget = self.draw_lottery_budget()
+        state.scheduled_by = self
 
     def should_sample(
         self,
         state: SamplingState,
         person_count: int,
     ) -> bool:
-        now = datetime.datetime.now()
-        elapsed = (now - state.last_sample_time).total_seconds()
-        if elapsed >= self.cooldown_seconds:
-            state.force_snapshot = True
-
-        not_sample_chance = max(0.0, 1.0 - self.sample_chance * person_count)
+        now = time.monotonic()
+        if state.scheduled_by is not self:
+            elapsed = (datetime.datetime.now() - state.last_sample_time).total_seconds()
+            self._schedule(state, now, elapsed)
 
-        if state.force_snapshot:
+        if state.force_snapshot or now >= state.cooldown_deadline:
+            state.last_reason = "forced" if state.force_snapshot else "cooldown"
             logger.info(
-                "Force snapshot triggered (elapsed=%.2fs, person_count=%d)",
-                elapsed,
+                "Force snapshot triggered (cooldown_due=%s, person_count=%d)",
+                now >= state.cooldown_deadline,
                 person_count,
             )
             state.force_snapshot = False
-            state.last_sample_time = now
+            self._record_sample(state, now)
             return True
 
-        lottery = random.random()
-        if lottery >= not_sample_chance:
-            logger.info(
-                "Lottery snapshot (chance=%.4f, threshold=%.4f, person_count=%d)",
-                lottery,
-                not_sample_chance,
-                person_count,
-            )
-            state.last_sample_time = now
-            return True
+        if person_count <= 0:
+            return False
+        state.lottery_budget -= person_count
+        if state.lottery_budget > 0:
+            return False
 
-        logger.debug(
-            "Skip snapshot (chance=%.4f, threshold=%.4f, person_count=%d)",
-            lottery,
-            not_sample_chance,
-            person_count,
-        )
+        logger.info("Lottery snapshot (chance=%.6f, person_count=%d)", self.sample_chance, person_count)
+        state.last_reason = "lottery"
+        self._record_sample(state, now)
+        return True
 
-        return False
+    def _record_sample(self, state: SamplingState, now: float) -> None:
+        state.last_sample_time = datetime.datetime.now()
+        self._schedule(state, now)
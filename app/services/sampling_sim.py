@@ -0,0 +1,200 @@
+import csv
+import math
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+from app.services.sampling import SamplingPolicy
+
+SECONDS_PER_DAY = 24 * 3600
+SECONDS_PER_YEAR = 365 * SECONDS_PER_DAY
+
+# Mean persons in view for each hour of a synthetic day.
+DEFAULT_OCCUPANCY = (
+    0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.2, 0.8,
+    1.0, 0.5, 0.3, 0.3, 0.8, 0.6, 0.3, 0.3,
+    0.4, 0.8, 1.5, 1.8, 1.6, 1.2, 0.6, 0.1,
+)
+
+
+@dataclass
+class OccupancyTrace:
+    """Mean person count per fixed-width bin, covering one period that repeats."""
+
+    persons: np.ndarray
+    bin_seconds: float
+
+    @property
+    def period_seconds(self) -> float:
+        return len(self.persons) * self.bin_seconds
+
+
+@dataclass
+class SimulationResult:
+    days: float
+    forced: int
+    lottery: int
+    sample_bytes: int
+
+    @property
+    def samples(self) -> int:
+        return self.forced + self.lottery
+
+    @property
+    def samples_per_day(self) -> float:
+        return self.samples / self.days if self.days else 0.0
+
+    @property
+    def disk_bytes(self) -> int:
+        return self.samples * self.sample_bytes
+
+    def to_dict(self) -> dict:
+        return {
+            "days": round(self.days, 2),
+            "samples": self.samples,
+            "forced": self.forced,
+            "lottery": self.lottery,
+            "samples_per_day": round(self.samples_per_day, 3),
+            "disk_gb": round(self.disk_bytes / 1024 ** 3, 3),
+        }
+
+
+def synthetic_trace(hourly: Sequence[float] = DEFAULT_OCCUPANCY, bin_seconds: float = 60.0) -> OccupancyTrace:
+    if len(hourly) != 24:
+        raise ValueError("hourly occupancy needs 24 values")
+    per_hour = max(1, int(round(3600 / bin_seconds)))
+    persons = np.repeat(np.asarray(hourly, dtype=np.float64), per_hour)
+    return OccupancyTrace(persons=persons, bin_seconds=3600 / per_hour)
+
+
+def load_trace(path: str, bin_seconds: float = 60.0) -> OccupancyTrace:
+    """Load ``timestamp,person_count`` rows (per frame or per interval) as a repeating trace."""
+    if path.endswith(".npy"):
+        data = np.load(path)
+        timestamps, counts = data[:, 0], data[:, 1]
+    else:
+        with open(path, "r", encoding="utf-8") as file:
+            rows = [row for row in csv.reader(file) if row and not row[0].startswith("#")]
+        if rows and not _is_number(rows[0][0]):
+            rows = rows[1:]
+        timestamps = np.array([float(row[0]) for row in rows], dtype=np.float64)
+        counts = np.array([float(row[1]) for row in rows], dtype=np.float64)
+    if len(timestamps) == 0:
+        raise ValueError(f"empty trace: {path}")
+
+    offsets = timestamps - timestamps.min()
+    bins = (offsets // bin_seconds).astype(np.int64)
+    n_bins = int(bins.max()) + 1
+    totals = np.bincount(bins, weights=counts, minlength=n_bins)
+    frames = np.bincount(bins, minlength=n_bins)
+    persons = np.divide(totals, frames, out=np.zeros(n_bins), where=frames > 0)
+    return OccupancyTrace(persons=persons, bin_seconds=bin_seconds)
+
+
+def _is_number(value: str) -> bool:
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def simulate(
+    policy: SamplingPolicy,
+    trace: OccupancyTrace,
+    years: float,
+    fps: float = 30.0,
+    sample_bytes: int = 400 * 1024,
+    start_elapsed: float = 0.0,
+    seed: Optional[int] = None,
+) -> SimulationResult:
+    """Replay ``trace`` through the policy's lottery and cooldown for ``years``.
+
+    Lottery waits are geometric and memoryless, so a cooldown-forced sample
+    does not change when the next lottery hit lands. All hits are drawn at
+    once against the cumulative person-frame curve, and each gap between
+    samples is then filled with ``floor(gap / cooldown)`` forced samples.
+    """
+    duration = years * SECONDS_PER_YEAR
+    repeats = max(1, math.ceil(duration / trace.period_seconds))
+    rate = np.tile(trace.persons * fps, repeats)
+    edges = np.arange(len(rate) + 1, dtype=np.float64) * trace.bin_seconds
+    cumulative = np.concatenate(([0.0], np.cumsum(rate * trace.bin_seconds)))
+    total = cumulative[np.searchsorted(edges, duration, side="right") - 1]
+
+    rng = np.random.default_rng(seed)
+    chance = min(1.0, policy.sample_chance)
+    hits = np.empty(0)
+    drawn = 0.0
+    while drawn < total:
+        batch = max(1024, int((total - drawn) * chance * 1.1))
+        points = drawn + np.cumsum(rng.geometric(chance, size=batch).astype(np.float64))
+        drawn = points[-1]
+        hits = np.concatenate((hits, points[points <= total]))
+
+    bins = np.searchsorted(cumulative, hits, side="left") - 1
+    bins = np.clip(bins, 0, len(rate) - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offsets = np.where(rate[bins] > 0, (hits - cumulative[bins]) / rate[bins], 0.0)
+    times = edges[bins] + offsets
+    times = times[times < duration]
+
+    cooldown = policy.cooldown_seconds
+    forced = 0
+    if cooldown > 0:
+        starts = np.concatenate(([-start_elapsed], times))
+        ends = np.concatenate((times, [duration]))
+        gaps = ends - starts
+        # The trailing gap ends at the horizon rather than at a sample, so a
+        # forced sample landing exactly on it falls outside the window.
+        counts = np.floor(gaps / cooldown)
+        counts[-1] = np.ceil(gaps[-1] / cooldown) - 1
+        forced = int(np.maximum(counts, 0).sum())
+
+    return SimulationResult(
+        days=duration / SECONDS_PER_DAY,
+        forced=forced,
+        lottery=len(times),
+        sample_bytes=sample_bytes,
+    )
+
+
+def suggest_time_span(
+    cooldown_hours: float,
+    trace: OccupancyTrace,
+    years: float,
+    target_bytes: int,
+    fps: float = 30.0,
+    sample_bytes: int = 400 * 1024,
+    seed: Optional[int] = None,
+) -> Optional[float]:
+    """Smallest ``time_span_years`` whose projected usage fits ``target_bytes``.
+
+    Returns ``None`` when cooldown-forced samples alone exceed the budget.
+    """
+
+    def usage(span: float) -> int:
+        policy = SamplingPolicy(time_span_years=span, cooldown_hours=cooldown_hours)
+        return simulate(policy, trace, years, fps=fps, sample_bytes=sample_bytes, seed=seed).disk_bytes
+
+    low, high = 0.1, 1000.0
+    if usage(high) > target_bytes:
+        return None
+    if usage(low) <= target_bytes:
+        return low
+    for _ in range(30):
+        mid = math.sqrt(low * high)
+        if usage(mid) <= target_bytes:
+            high = mid
+        else:
+            low = mid
+        if high / low < 1.01:
+            break
+    return high
+
+
+def min_cooldown_hours(years: float, target_bytes: int, sample_bytes: int = 400 * 1024) -> float:
+    """Cooldown at which forced samples alone use the whole budget."""
+    max_samples = max(1, target_bytes // max(1, sample_bytes))
+    return years * SECONDS_PER_YEAR / max_samples / 3600
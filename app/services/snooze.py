@@ -0,0 +1,104 @@
+import datetime
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SnoozePower:
+    """What a snoozed camera still does.
+
+    ``fps`` caps the frames that get past the source (0 keeps every frame),
+    ``pause_inference`` stops the detector altogether and ``preview_fps``
+    keeps a slow preview (0 turns it off).
+    """
+
+    fps: float = 1.0
+    pause_inference: bool = False
+    preview_fps: float = 1.0
+
+
+class SnoozeTimer:
+    """A snooze deadline that ends itself with a timer instead of being checked on every frame.
+
+    ``on_change(active)`` runs under the timer's lock whenever the camera
+    enters or leaves the snooze, so the power profile switches in the same
+    order as the snooze itself.
+    """
+
+    def __init__(self, name: str, on_change: Optional[Callable[[bool], None]] = None) -> None:
+        self.name = name
+        self.on_change = on_change
+        self.until: Optional[datetime.datetime] = None
+        self.active = False
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._generation = 0
+
+    def extend(self, minutes: int) -> datetime.datetime:
+        """Adds ``minutes`` to a running snooze, or starts one; returns the new end time."""
+        now = datetime.datetime.now()
+        with self._lock:
+            base_time = self.until if self.active and self.until > now else now
+            until = base_time + datetime.timedelta(minutes=max(0, minutes))
+            self._schedule(until, now)
+            return until
+
+    def restore(self, until: Optional[datetime.datetime]) -> None:
+        """Continues a snooze taken over from a replaced pipeline."""
+        with self._lock:
+            self._schedule(until, datetime.datetime.now())
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._schedule(None, datetime.datetime.now())
+
+    def refresh(self, update: Optional[Callable[[], None]] = None) -> None:
+        """Runs ``update`` and re-applies the current state through ``on_change``, in order with the timer."""
+        with self._lock:
+            if update is not None:
+                update()
+            if self.on_change is not None:
+                self.on_change(self.active)
+
+    def close(self) -> None:
+        """Stops the timer but keeps ``until``, so a rebuilt pipeline can restore it."""
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _schedule(self, until: Optional[datetime.datetime], now: datetime.datetime) -> None:
+        self._generation += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if until is not None and until > now:
+            self._timer = threading.Timer((until - now).total_seconds(), self._expire, args=(self._generation,))
+            self._timer.daemon = True
+            self._timer.start()
+            self.until = until
+            self._set_active(True)
+        else:
+            self.until = None
+            self._set_active(False)
+
+    def _expire(self, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._timer = None
+            self.until = None
+            self._set_active(False)
+
+    def _set_active(self, active: bool) -> None:
+        if active == self.active:
+            return
+        self.active = active
+        logger.info("Snooze %s for %s", "started" if active else "ended", self.name)
+        if self.on_change is not None:
+            self.on_change(active)
@@ -1,45 +1,447 @@
 import os
 import datetime
 import logging
+import queue
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
 import cv2
+import numpy as np
+
+from app.logging_setup import log_limited
+from app.services.dedup import DEDUP_SKIP, DuplicateFilter
+from app.services.metrics import CameraMetrics
+from app.services.retention import RetentionManager
+from app.services.sample_index import CLIP_EXTENSION, DUPLICATE_SUFFIX, EXCLUDED_NAMES, SampleIndex, SampleRecord
+from app.services.thumbnails import ThumbnailCache
 
 logger = logging.getLogger(__name__)
 
+SHARD_FORMAT = os.path.join("%Y", "%m", "%d")
+FILENAME_TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+# "<camera_name>_<YYYY-mm-dd>_<HH-MM-SS>[-<mmm>][_<NN>][-<collision>][_dup]"; the
+# camera name may itself contain "_". Names from before milliseconds have no "-<mmm>".
+SAMPLE_NAME_PATTERN = re.compile(
+    r"_(?P<time>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})(?:-(?P<ms>\d{3}))?(?:_\d{2})?(?:-\d+)?(?:_dup)?$"
+)
+# Sample outcomes counted next to the sampling reasons of the samples written.
+SAMPLE_DROPPED = "dropped"
+SAMPLE_DUPLICATE = "duplicate"
+SAMPLE_FAILED = "failed"
+
+
+def shard_dir(moment: datetime.datetime) -> str:
+    return moment.strftime(SHARD_FORMAT)
+
+
+def sample_filename(
+    camera_name: str,
+    moment: datetime.datetime,
+    sequence: Optional[int] = None,
+    duplicate: bool = False,
+) -> str:
+    suffix = f"_{sequence:02d}" if sequence is not None else ""
+    if duplicate:
+        suffix += DUPLICATE_SUFFIX
+    millis = moment.microsecond // 1000
+    return f"{camera_name}_{moment.strftime(FILENAME_TIMESTAMP_FORMAT)}-{millis:03d}{suffix}.jpg"
+
+
+def collision_filename(path: str, attempt: int) -> str:
+    """``path`` with a collision counter, kept before the ``_dup`` tag so tagged samples stay recognisable."""
+    stem, extension = os.path.splitext(path)
+    tag = DUPLICATE_SUFFIX if stem.endswith(DUPLICATE_SUFFIX) else ""
+    if tag:
+        stem = stem[: -len(tag)]
+    return f"{stem}-{attempt}{tag}{extension}"
+
+
+def parse_sample_time(filename: str) -> Optional[datetime.datetime]:
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    match = SAMPLE_NAME_PATTERN.search(stem)
+    if match is None or match.start() == 0:
+        return None
+    try:
+        moment = datetime.datetime.strptime(match.group("time"), FILENAME_TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    if match.group("ms"):
+        moment = moment.replace(microsecond=int(match.group("ms")) * 1000)
+    return moment
+
+
+@dataclass
+class WriteJob:
+    path: str
+    # A BGR array to encode, or JPEG bytes written as-is.
+    frame: object
+    enqueued_at: float
+    timestamp: float
+    lease: object = None
+    clip: Optional[bytes] = None
+    # Counted in the samples metric once the file is written, or under the
+    # outcome that kept it from being written; None is not counted at all.
+    reason: Optional[str] = None
+
 
 class Storage:
-    def __init__(self, base_dir: str) -> None:
+    def __init__(
+        self,
+        base_dir: str,
+        queue_size: int = 8,
+        fsync_seconds: float = 0.0,
+        jpeg_quality: int = 95,
+        max_bytes: int = 0,
+        max_files: int = 0,
+        max_age_days: float = 0.0,
+        thin_after_days: float = 0.0,
+        retention_interval_seconds: float = 60.0,
+        thumb_width: int = 320,
+        thumb_cache_bytes: int = 64 * 1024 * 1024,
+        metrics: Optional[CameraMetrics] = None,
+        on_saved: Optional[Callable[[SampleRecord], None]] = None,
+        dedup_mode: Optional[str] = None,
+        dedup_distance: int = 3,
+        dedup_window: int = 64,
+    ) -> None:
         self.base_dir = base_dir
+        self.jpeg_quality = jpeg_quality
+        self.fsync_seconds = max(0.0, fsync_seconds)
+        self.metrics = metrics
+        self.on_saved = on_saved
         os.makedirs(self.base_dir, exist_ok=True)
+        self.dedup = (
+            DuplicateFilter(self.base_dir, max_distance=dedup_distance, window=dedup_window, mode=dedup_mode)
+            if dedup_mode
+            else None
+        )
+        self.index = SampleIndex(self.base_dir)
+        self.thumbnails = ThumbnailCache(self.base_dir, width=thumb_width, max_bytes=thumb_cache_bytes)
+        self.retention = RetentionManager(
+            self.base_dir,
+            self.index,
+            max_bytes=max_bytes,
+            max_files=max_files,
+            max_age_days=max_age_days,
+            thin_after_days=thin_after_days,
+            interval_seconds=retention_interval_seconds,
+            on_evict=self.thumbnails.discard,
+        )
+
+        self._queue: "queue.Queue[Optional[WriteJob]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._stats_lock = threading.Lock()
+        self._written = 0
+        self._dropped = 0
+        self._last_write_ms = 0.0
+        self._max_write_ms = 0.0
+        self._total_write_ms = 0.0
+        self._unsynced: List[str] = []
+        self._last_fsync = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f"storage-{os.path.basename(base_dir)}", daemon=True)
+        self._thread.start()
+        self.retention.start()
+
+    @property
+    def latest_path(self) -> str:
+        return os.path.join(self.base_dir, "latest.jpg")
+
+    def save_sample(
+        self,
+        frame,
+        camera_name: str,
+        timeout: float = 1.0,
+        lease=None,
+        exempt: bool = False,
+        reason: Optional[str] = None,
+    ) -> Optional[str]:
+        """Queue ``frame`` for writing; a pooled ``lease`` is retained until the write is done.
+
+        Unless ``exempt``, a near-duplicate of a recent sample is skipped
+        (returns None) or tagged, depending on the dedup mode. ``reason`` is
+        the sampling reason the samples metric counts once the write succeeds.
+        """
+        duplicate, value = self._screen(frame, exempt)
+        if duplicate and self.dedup.mode == DEDUP_SKIP:
+            self._count(reason, SAMPLE_DUPLICATE)
+            return None
+        now = datetime.datetime.now()
+        job = WriteJob(
+            path=os.path.join(self.base_dir, shard_dir(now), sample_filename(camera_name, now, duplicate=duplicate)),
+            frame=frame,
+            enqueued_at=time.monotonic(),
+            timestamp=now.timestamp(),
+            lease=lease.retain() if lease is not None else None,
+            reason=SAMPLE_DUPLICATE if duplicate and reason is not None else reason,
+        )
+        return self._enqueue(job, timeout, None if duplicate else value)
+
+    def save_encoded(
+        self,
+        jpeg: bytes,
+        camera_name: str,
+        captured_at: float,
+        sequence: Optional[int] = None,
+        clip: Optional[bytes] = None,
+        timeout: float = 1.0,
+        exempt: bool = False,
+        reason: Optional[str] = None,
+    ) -> Optional[str]:
+        """Queue an already-encoded sample, optionally with an MJPEG clip stored beside it.
 
-    def save_sample(self, frame, camera_name: str) -> str:
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"{camera_name}_{timestamp}.jpg"
-        path = os.path.join(self.base_dir, filename)
-        cv2.imwrite(path, frame)
+        Burst frames (with a ``sequence``) are never deduplicated.
+        """
+        duplicate, value = False, None
+        if self.dedup is not None and not exempt and sequence is None:
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if frame is not None:
+                duplicate, value = self._screen(frame, exempt)
+        if duplicate and self.dedup.mode == DEDUP_SKIP:
+            self._count(reason, SAMPLE_DUPLICATE)
+            return None
+        moment = datetime.datetime.fromtimestamp(captured_at)
+        job = WriteJob(
+            path=os.path.join(
+                self.base_dir, shard_dir(moment), sample_filename(camera_name, moment, sequence, duplicate=duplicate)
+            ),
+            frame=jpeg,
+            enqueued_at=time.monotonic(),
+            timestamp=captured_at,
+            clip=clip,
+            reason=SAMPLE_DUPLICATE if duplicate and reason is not None else reason,
+        )
+        return self._enqueue(job, timeout, None if duplicate else value)
 
-        latest_path = os.path.join(self.base_dir, "latest.jpg")
-        cv2.imwrite(latest_path, frame)
-        logger.info("Saved snapshot: %s", path)
+    def _screen(self, frame, exempt: bool) -> Tuple[bool, Optional[int]]:
+        """Whether ``frame`` is a near-duplicate, and the hash to remember if it is kept."""
+        if self.dedup is None or exempt:
+            return False, None
+        duplicate, value = self.dedup.check(frame)
+        if duplicate:
+            logger.info(
+                "Near-duplicate sample %s (%d bits from a recent one)",
+                "skipped" if self.dedup.mode == DEDUP_SKIP else "tagged",
+                self.dedup.last_distance,
+            )
+        return duplicate, value
+
+    def _enqueue(self, job: WriteJob, timeout: float, dedup_hash: Optional[int] = None) -> Optional[str]:
+        path = job.path
+        try:
+            self._queue.put(job, timeout=timeout)
+        except queue.Full:
+            if job.lease is not None:
+                job.lease.release()
+            with self._stats_lock:
+                self._dropped += 1
+            self._count(job.reason, SAMPLE_DROPPED)
+            log_limited(
+                logger,
+                logging.ERROR,
+                f"storage-full:{self.base_dir}",
+                "Storage queue full, dropped snapshot: %s",
+                path,
+            )
+            return None
+        if dedup_hash is not None:
+            self.dedup.remember(dedup_hash)
         return path
 
+    def _count(self, reason: Optional[str], outcome: Optional[str] = None) -> None:
+        if self.metrics is not None and reason is not None:
+            self.metrics.sample_saved(outcome or reason)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                job = self._queue.get(timeout=self.fsync_seconds or None)
+            except queue.Empty:
+                self._fsync_pending()
+                continue
+            if job is None:
+                self._fsync_pending(force=True)
+                return
+            try:
+                self._write(job)
+            except Exception:
+                self._count(job.reason, SAMPLE_FAILED)
+                logger.exception("Failed to write snapshot: %s", job.path)
+            finally:
+                if job.lease is not None:
+                    job.lease.release()
+            self._fsync_pending()
+
+    def _unique_path(self, path: str) -> str:
+        # Only this thread writes samples, so a free name stays free until written.
+        candidate, attempt = path, 1
+        while os.path.lexists(candidate) or os.path.lexists(os.path.splitext(candidate)[0] + CLIP_EXTENSION):
+            candidate = collision_filename(path, attempt)
+            attempt += 1
+        return candidate
+
+    def _write(self, job: WriteJob) -> None:
+        started = time.monotonic()
+        # Two samples in the same millisecond (overlapping bursts) must not overwrite each other.
+        job.path = self._unique_path(job.path)
+        if isinstance(job.frame, (bytes, bytearray, memoryview)):
+            data = job.frame
+        else:
+            ret, jpeg = cv2.imencode(".jpg", job.frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if not ret:
+                raise RuntimeError("JPEG encode failed")
+            data = jpeg.tobytes()
+
+        os.makedirs(os.path.dirname(job.path), exist_ok=True)
+        size = len(data)
+        if job.clip:
+            # The clip goes first so an indexed sample never points at a missing clip.
+            self._write_file(os.path.splitext(job.path)[0] + CLIP_EXTENSION, job.clip)
+            size += len(job.clip)
+        self._write_file(job.path, data)
+        self._publish_latest(job.path, data)
+        record = SampleRecord(os.path.relpath(job.path, self.base_dir), job.timestamp, size)
+        self.index.add(record.path, record.timestamp, size=record.size)
+
+        elapsed = time.monotonic() - started
+        elapsed_ms = elapsed * 1000
+        if self.metrics is not None:
+            self.metrics.write_seconds.observe(elapsed)
+        self._count(job.reason)
+        with self._stats_lock:
+            self._written += 1
+            self._last_write_ms = elapsed_ms
+            self._max_write_ms = max(self._max_write_ms, elapsed_ms)
+            self._total_write_ms += elapsed_ms
+            if self.fsync_seconds > 0:
+                self._unsynced.append(job.path)
+                if job.clip:
+                    self._unsynced.append(os.path.splitext(job.path)[0] + CLIP_EXTENSION)
+        logger.info(
+            "Saved snapshot: %s (%.1f ms, queued %.1f ms)",
+            job.path,
+            elapsed_ms,
+            (started - job.enqueued_at) * 1000,
+        )
+        if self.on_saved is not None:
+            try:
+                self.on_saved(record)
+            except Exception:
+                logger.exception("Sample listener failed: %s", job.path)
+
+    def _write_file(self, path: str, data) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def _publish_latest(self, path: str, data) -> None:
+        tmp_latest = self.latest_path + ".tmp"
+        if os.path.lexists(tmp_latest):
+            os.remove(tmp_latest)
+        try:
+            os.link(path, tmp_latest)
+        except OSError:
+            with open(tmp_latest, "wb") as file:
+                file.write(data)
+        os.replace(tmp_latest, self.latest_path)
+
+    def _fsync_pending(self, force: bool = False) -> None:
+        if not self._unsynced:
+            return
+        if not force and time.monotonic() - self._last_fsync < self.fsync_seconds:
+            return
+
+        with self._stats_lock:
+            paths, self._unsynced = self._unsynced, []
+        directories = {os.path.dirname(path) for path in paths}
+        for path in paths + sorted(directories) + [self.base_dir]:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._last_fsync = time.monotonic()
+
+    def close(self, timeout: float = 5.0) -> None:
+        if not self._thread.is_alive():
+            return
+        self.retention.stop(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self.index.close()
+
+    def get_status(self) -> dict:
+        with self._stats_lock:
+            written = self._written
+            return {
+                "queue_depth": self._queue.qsize(),
+                "written": written,
+                "dropped": self._dropped,
+                "last_write_ms": round(self._last_write_ms, 2),
+                "max_write_ms": round(self._max_write_ms, 2),
+                "avg_write_ms": round(self._total_write_ms / written, 2) if written else 0.0,
+                "retention": self.retention.get_status(),
+                "thumbnails": self.thumbnails.get_status(),
+                "dedup": self.dedup.get_status() if self.dedup is not None else None,
+            }
+
     def list_recent(self, limit: int) -> list:
-        if limit <= 0:
-            return []
+        """Newest samples for the dashboard; tagged near-duplicates are left out."""
+        return [record.path for record in self.index.latest(limit, duplicates=False)]
 
-        candidates = []
-        for root, _dirs, files in os.walk(self.base_dir):
-            for name in files:
-                if not name.lower().endswith(".jpg"):
-                    continue
-                if name == "latest.jpg":
-                    continue
-                full_path = os.path.join(root, name)
+    def list_samples(
+        self,
+        limit: int,
+        before: Optional[float] = None,
+        after: Optional[float] = None,
+    ) -> List[SampleRecord]:
+        return self.index.query(limit, before=before, after=after)
+
+
+def migrate_flat_layout(base_dir: str, index: Optional[SampleIndex] = None, dry_run: bool = False) -> int:
+    """Move samples stored directly in ``base_dir`` into ``YYYY/MM/DD/`` shards."""
+    owns_index = index is None
+    if index is None and not dry_run:
+        index = SampleIndex(base_dir)
+    moved = 0
+    try:
+        with os.scandir(base_dir) as entries:
+            names = [
+                entry.name
+                for entry in entries
+                if entry.is_file()
+                and entry.name.lower().endswith(".jpg")
+                and entry.name not in EXCLUDED_NAMES
+            ]
+        for name in names:
+            src = os.path.join(base_dir, name)
+            captured = parse_sample_time(name)
+            if captured is None:
                 try:
-                    mtime = os.path.getmtime(full_path)
+                    captured = datetime.datetime.fromtimestamp(os.path.getmtime(src))
                 except OSError:
                     continue
-                rel_path = os.path.relpath(full_path, self.base_dir)
-                candidates.append((mtime, rel_path))
-
-        candidates.sort(key=lambda item: item[0], reverse=True)
-        return [rel for _mtime, rel in candidates[:limit]]
+            dst = os.path.join(base_dir, shard_dir(captured), name)
+            if os.path.exists(dst):
+                logger.warning("Skip migrating %s: %s already exists", src, dst)
+                continue
+            if dry_run:
+                logger.info("Would move %s -> %s", src, dst)
+                moved += 1
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.rename(src, dst)
+            stat = os.stat(dst)
+            index.remove(name)
+            index.add(os.path.relpath(dst, base_dir), stat.st_mtime, size=stat.st_size)
+            moved += 1
+    finally:
+        if owns_index and index is not None:
+            index.close()
+    logger.info("Migrated %d samples in %s", moved, base_dir)
+    return moved
@@ -0,0 +1,135 @@
+import collections
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import cv2
+
+from app.services.sample_index import THUMB_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailCache:
+    """Downscaled JPEG copies of samples, made on first request and kept on disk.
+
+    Thumbnails live under ``<base_dir>/.thumbs`` mirroring the sample path. The
+    cache is an LRU capped at ``max_bytes``; its recency order is seeded from
+    file mtimes at startup, so it survives restarts.
+    """
+
+    def __init__(self, base_dir: str, width: int = 320, max_bytes: int = 64 * 1024 * 1024, jpeg_quality: int = 80) -> None:
+        self.base_dir = base_dir
+        self.root = os.path.join(base_dir, THUMB_DIR)
+        self.width = max(16, width)
+        self.max_bytes = max(0, max_bytes)
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        # relpath -> size, least recently used first.
+        self._entries: "collections.OrderedDict[str, int]" = collections.OrderedDict()
+        self._building: Dict[str, threading.Event] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._load()
+
+    def _load(self) -> None:
+        found = []
+        for root, _dirs, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, os.path.relpath(path, self.root), stat.st_size))
+        for _mtime, relpath, size in sorted(found):
+            self._entries[relpath] = size
+            self._bytes += size
+
+    def get(self, relpath: str) -> Optional[str]:
+        """Returns the thumbnail path for the sample at ``relpath``, creating it if needed; None if it cannot."""
+        path = os.path.join(self.root, relpath)
+        while True:
+            with self._lock:
+                if relpath in self._entries and os.path.exists(path):
+                    self._entries.move_to_end(relpath)
+                    self.hits += 1
+                    return path
+                building = self._building.get(relpath)
+                if building is None:
+                    building = self._building[relpath] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another request is making this one; use its result.
+            building.wait(5.0)
+            if relpath not in self._entries:
+                return None
+
+        try:
+            size = self._build(relpath, path)
+        finally:
+            with self._lock:
+                self._building.pop(relpath).set()
+        if size is None:
+            return None
+        with self._lock:
+            self._bytes += size - self._entries.pop(relpath, 0)
+            self._entries[relpath] = size
+            self._evict()
+        return path
+
+    def _build(self, relpath: str, path: str) -> Optional[int]:
+        frame = cv2.imread(os.path.join(self.base_dir, relpath), cv2.IMREAD_REDUCED_COLOR_2)
+        if frame is None:
+            return None
+        if frame.shape[1] > self.width:
+            height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+            frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        ret, jpeg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if not ret:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(jpeg.tobytes())
+        os.replace(tmp_path, path)
+        return len(jpeg)
+
+    def _evict(self) -> None:
+        while self.max_bytes and self._bytes > self.max_bytes and len(self._entries) > 1:
+            relpath, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evicted += 1
+            try:
+                os.remove(os.path.join(self.root, relpath))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.exception("Failed to evict thumbnail: %s", relpath)
+
+    def discard(self, relpath: str) -> None:
+        """Drops the thumbnail of a sample that was removed."""
+        with self._lock:
+            size = self._entries.pop(relpath, None)
+            if size is None:
+                return
+            self._bytes -= size
+        try:
+            os.remove(os.path.join(self.root, relpath))
+        except OSError:
+            pass
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "width": self.width,
+                "files": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+            }
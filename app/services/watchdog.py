@@ -0,0 +1,142 @@
+import datetime
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+HEALTH_OK = "ok"
+HEALTH_WAITING = "waiting"
+
+
+@dataclass
+class CameraHealth:
+    restarts: int = 0
+    consecutive_failures: int = 0
+    last_failure: Optional[str] = None
+    last_failure_time: Optional[datetime.datetime] = None
+    last_restart_time: Optional[datetime.datetime] = None
+    restarted_at: Optional[float] = None
+    retry_at: Optional[float] = None
+
+
+class Watchdog:
+    """Restarts cameras that failed or stopped delivering frames, with exponential backoff.
+
+    ``check(camera_id, now)`` returns why a camera is unhealthy, or None.
+    The first restart after a healthy period is immediate; each further
+    consecutive failure doubles the wait, up to ``max_backoff_seconds``. A
+    camera that stays healthy for ``max_backoff_seconds`` after a restart
+    starts over from no failures.
+    """
+
+    def __init__(
+        self,
+        camera_ids: Callable[[], Iterable[str]],
+        check: Callable[[str, float], Optional[str]],
+        restart: Callable[[Set[str]], None],
+        interval_seconds: float = 2.0,
+        backoff_seconds: float = 2.0,
+        max_backoff_seconds: float = 60.0,
+    ) -> None:
+        self.camera_ids = camera_ids
+        self.check = check
+        self.restart = restart
+        self.interval_seconds = max(0.1, interval_seconds)
+        self.backoff_seconds = max(0.0, backoff_seconds)
+        self.max_backoff_seconds = max(self.backoff_seconds, max_backoff_seconds)
+        self._health: Dict[str, CameraHealth] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Watchdog pass failed")
+
+    def _backoff(self, failures: int) -> float:
+        if failures <= 1:
+            return 0.0
+        return min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (failures - 2))
+
+    def run_once(self) -> Set[str]:
+        """Checks every camera once and restarts the ones that are due; returns their ids."""
+        now = time.monotonic()
+        due: Set[str] = set()
+        camera_ids = set(self.camera_ids())
+        with self._lock:
+            for camera_id in self._health.keys() - camera_ids:
+                del self._health[camera_id]
+            for camera_id in camera_ids:
+                health = self._health.setdefault(camera_id, CameraHealth())
+                problem = self.check(camera_id, now)
+                if problem is None:
+                    if (
+                        health.consecutive_failures
+                        and health.retry_at is None
+                        and now - (health.restarted_at or now) >= self.max_backoff_seconds
+                    ):
+                        logger.info("Camera %s recovered", camera_id)
+                        health.consecutive_failures = 0
+                    continue
+                if health.retry_at is None:
+                    health.consecutive_failures += 1
+                    health.last_failure = problem
+                    health.last_failure_time = datetime.datetime.now()
+                    delay = self._backoff(health.consecutive_failures)
+                    health.retry_at = now + delay
+                    logger.warning(
+                        "Camera %s unhealthy (%s); restart %d in %.0f s",
+                        camera_id,
+                        problem,
+                        health.restarts + 1,
+                        delay,
+                    )
+                if now >= health.retry_at:
+                    due.add(camera_id)
+        if not due:
+            return due
+
+        self.restart(due)
+        with self._lock:
+            for camera_id in due:
+                health = self._health.get(camera_id)
+                if health is None:
+                    continue
+                health.restarts += 1
+                health.retry_at = None
+                health.restarted_at = time.monotonic()
+                health.last_restart_time = datetime.datetime.now()
+        return due
+
+    def get_status(self, camera_id: str) -> dict:
+        with self._lock:
+            health = self._health.get(camera_id) or CameraHealth()
+            retry_in = max(0.0, health.retry_at - time.monotonic()) if health.retry_at is not None else None
+            return {
+                "state": HEALTH_WAITING if retry_in is not None else HEALTH_OK,
+                "restarts": health.restarts,
+                "consecutive_failures": health.consecutive_failures,
+                "last_failure": health.last_failure,
+                "last_failure_time": health.last_failure_time.isoformat() if health.last_failure_time else None,
+                "last_restart_time": health.last_restart_time.isoformat() if health.last_restart_time else None,
+                "restart_in_seconds": round(retry_in, 1) if retry_in is not None else None,
+            }
@@ -0,0 +1,106 @@
+import argparse
+import json
+import logging
+
+from app.config import load_config
+from app.services.sample_index import read_totals
+from app.services.sampling import SamplingPolicy
+from app.services.sampling_sim import (
+    DEFAULT_OCCUPANCY,
+    load_trace,
+    min_cooldown_hours,
+    simulate,
+    suggest_time_span,
+    synthetic_trace,
+)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Project sample counts and disk usage for each camera")
+    parser.add_argument("--config", default="configs/cameras.yaml")
+    parser.add_argument("--camera", action="append", help="camera id to simulate (default: all)")
+    parser.add_argument("--trace", help="CSV or .npy of timestamp,person_count rows, repeated to fill --years")
+    parser.add_argument(
+        "--occupancy",
+        help="24 comma-separated hourly mean person counts for a synthetic trace",
+    )
+    parser.add_argument("--bin-seconds", type=float, default=60.0)
+    parser.add_argument("--years", type=float, help="simulated duration (default: camera time_span_years)")
+    parser.add_argument("--sample-kb", type=float, help="JPEG size per sample (default: mean of the archive, else 400)")
+    parser.add_argument("--target-gb", type=float, help="suggest settings that fit this disk budget per camera")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args()
+
+
+def _sample_bytes(storage_dir: str, override_kb) -> int:
+    if override_kb:
+        return int(override_kb * 1024)
+    # Read-only, so it can run next to the service without touching its index.
+    count, size = read_totals(storage_dir)
+    return size // count if count else 400 * 1024
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = get_args()
+    config = load_config(args.config)
+    if args.trace:
+        trace = load_trace(args.trace, bin_seconds=args.bin_seconds)
+    else:
+        hourly = [float(v) for v in args.occupancy.split(",")] if args.occupancy else DEFAULT_OCCUPANCY
+        trace = synthetic_trace(hourly, bin_seconds=args.bin_seconds)
+
+    reports = []
+    for camera in config.cameras:
+        if args.camera and camera.id not in args.camera:
+            continue
+        years = args.years or camera.sampling.time_span_years
+        sample_bytes = _sample_bytes(camera.storage_dir, args.sample_kb)
+        policy = SamplingPolicy(
+            time_span_years=camera.sampling.time_span_years,
+            cooldown_hours=camera.sampling.cooldown_hours,
+        )
+        result = simulate(policy, trace, years, fps=camera.fps, sample_bytes=sample_bytes, seed=args.seed)
+        report = {
+            "camera_id": camera.id,
+            "time_span_years": camera.sampling.time_span_years,
+            "cooldown_hours": camera.sampling.cooldown_hours,
+            "sample_kb": round(sample_bytes / 1024, 1),
+            **result.to_dict(),
+        }
+        if args.target_gb:
+            target_bytes = int(args.target_gb * 1024 ** 3)
+            report["target_gb"] = args.target_gb
+            report["suggested_time_span_years"] = suggest_time_span(
+                camera.sampling.cooldown_hours,
+                trace,
+                years,
+                target_bytes,
+                fps=camera.fps,
+                sample_bytes=sample_bytes,
+                seed=args.seed,
+            )
+            report["min_cooldown_hours"] = round(min_cooldown_hours(years, target_bytes, sample_bytes), 2)
+        reports.append(report)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    for report in reports:
+        print(
+            f"{report['camera_id']}: {report['samples']} samples over {report['days']:.0f} days "
+            f"({report['samples_per_day']:.2f}/day, forced={report['forced']}, lottery={report['lottery']}), "
+            f"~{report['disk_gb']:.2f} GB at {report['sample_kb']} KB/sample"
+        )
+        if "target_gb" in report:
+            span = report["suggested_time_span_years"]
+            print(
+                f"  for {report['target_gb']} GB: time_span_years="
+                f"{'n/a (cooldown alone exceeds budget)' if span is None else round(span, 2)}, "
+                f"cooldown_hours>={report['min_cooldown_hours']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
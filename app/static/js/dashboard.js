@@ -82,3 +82,70 @@ if (form) {
     }, 2000);
   });
 }
+
+const STATE_LABELS = { starting: "启动中", failed: "失败" };
+
+function renderCard(card, status) {
+  const lastFrame = card.querySelector("[data-role='last-frame']");
+  if (lastFrame) lastFrame.textContent = `最近帧: ${status.last_frame_time || "暂无"}`;
+  const state = card.querySelector("[data-role='state']");
+  if (state) state.textContent = `状态: ${STATE_LABELS[status.state] || (status.running ? "运行中" : "停止")}`;
+  const snooze = card.querySelector("[data-role='snooze-status']");
+  if (snooze) {
+    snooze.textContent = status.snoozing
+      ? `瞌睡: 剩余 ${Math.floor((status.snooze_remaining_seconds || 0) / 60)} 分钟`
+      : "瞌睡: 关闭";
+  }
+  const preview = card.querySelector(".preview");
+  if (preview && status.state === "running" && !preview.querySelector("img")) {
+    const img = document.createElement("img");
+    img.src = preview.dataset.stream;
+    img.alt = status.camera_name || "";
+    preview.replaceChildren(img);
+  }
+}
+
+function addSample(section, sample) {
+  const grid = section.querySelector(".recent-grid");
+  const link = document.createElement("a");
+  link.className = "recent-item";
+  link.href = sample.url;
+  link.target = "_blank";
+  link.rel = "noopener";
+  const img = document.createElement("img");
+  img.src = sample.thumb_url;
+  img.alt = "sample";
+  link.appendChild(img);
+  grid.prepend(link);
+  const limit = parseInt(section.dataset.limit, 10);
+  while (grid.children.length > limit) grid.lastElementChild.remove();
+  section.querySelector("[data-role='empty']")?.setAttribute("hidden", "");
+}
+
+const eventsRoot = document.querySelector("[data-events]");
+if (eventsRoot && window.EventSource) {
+  // Status events are deltas; the first one per camera carries every field.
+  const cameras = new Map();
+  const source = new EventSource(eventsRoot.dataset.events);
+  source.addEventListener("status", (event) => {
+    if (!eventsRoot.classList.contains("grid")) return;
+    const delta = JSON.parse(event.data);
+    const card = eventsRoot.querySelector(`[data-camera="${CSS.escape(delta.camera_id)}"]`);
+    if (delta.removed) {
+      cameras.delete(delta.camera_id);
+      card?.remove();
+      return;
+    }
+    if (!card) {
+      // A camera added at runtime: its card is rendered by the server.
+      window.location.reload();
+      return;
+    }
+    const status = { ...cameras.get(delta.camera_id), ...delta };
+    cameras.set(delta.camera_id, status);
+    renderCard(card, status);
+  });
+  source.addEventListener("sample", (event) => {
+    if (eventsRoot.classList.contains("recent")) addSample(eventsRoot, JSON.parse(event.data));
+  });
+}